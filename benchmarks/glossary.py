@@ -0,0 +1,146 @@
+''' Generate synthetic glossaries for benchmarking.
+
+    Definitions and interactions are streamed into Postgres with COPY a batch at a
+    time, so that millions of rows can be generated in minutes. Run it through
+    `python manage.py generate`, which adds to whatever is already in the database.
+'''
+from gloss import db
+from gloss.aliases import refresh_aliases
+from gloss.bulk import copy_rows
+from gloss.models import get_alias_key, normalize_term
+from gloss.stats import rebuild_statistics
+from gloss.urls import get_image_url
+from datetime import datetime, timedelta
+import random
+
+# the generated glossary covers this much time, ending now
+HISTORY = timedelta(days=5 * 365)
+
+# what terms and definitions are made of
+WORDS = (
+    "account", "action", "agency", "application", "assistance", "benefit", "budget", "care", "case", "center",
+    "child", "citizen", "claim", "client", "code", "community", "compliance", "county", "data", "delivery",
+    "department", "design", "digital", "eligibility", "emergency", "employment", "enrollment", "family", "federal", "food",
+    "form", "fund", "grant", "health", "household", "housing", "income", "insurance", "justice", "legal",
+    "local", "management", "medical", "network", "notice", "nutrition", "office", "operations", "partner", "payment",
+    "plan", "policy", "program", "public", "record", "referral", "report", "request", "research", "resident",
+    "review", "safety", "security", "service", "social", "state", "support", "system", "team", "technology",
+    "transit", "unemployment", "user", "verification", "veteran", "volunteer", "welfare", "worker", "youth", "zone"
+)
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+IMAGE_URL_TEMPLATE = "https://images.example.com/{}/{}.{}"
+
+# the share of definitions that have an image or are aliases of another term
+IMAGE_SHARE = 0.1
+ALIAS_SHARE = 0.05
+# the share of lookups for terms that aren't defined
+NOT_FOUND_SHARE = 0.2
+
+class GlossaryGenerator(object):
+    ''' Makes up definitions and interactions that look like a busy team's: mostly
+        acronyms with a few words of definition, defined by a small group of people who
+        set most of the terms, and looked up with a long tail of popularity.
+    '''
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+        self.keys = set()
+        self.terms = []
+        self.users = []
+
+    def make_users(self, count):
+        self.users = ["{}.{}".format(self.random.choice(WORDS), number) for number in range(max(count, 1))]
+
+    def pick_user(self):
+        # a fifth of the people set more than half of the terms
+        return self.users[int(len(self.users) * self.random.random() ** 3)]
+
+    def make_term(self):
+        ''' Make up a term that hasn't been used yet.
+        '''
+        if self.random.random() < 0.7:
+            term = "".join([self.random.choice(LETTERS) for count in range(self.random.randint(2, 5))])
+        else:
+            term = " ".join([self.random.choice(WORDS).capitalize() for count in range(self.random.randint(1, 3))])
+
+        # numbered variants keep the terms unique once the short ones run out
+        candidate = term
+        while normalize_term(candidate) in self.keys:
+            candidate = "{} {}".format(term, self.random.randint(2, 99999))
+        self.keys.add(normalize_term(candidate))
+        return candidate
+
+    def make_definition(self):
+        if self.terms and self.random.random() < ALIAS_SHARE:
+            return "see {}".format(self.random.choice(self.terms))
+
+        definition = " ".join([self.random.choice(WORDS) for count in range(self.random.randint(2, 30))]).capitalize()
+        if self.random.random() < IMAGE_SHARE:
+            definition = "{} {}".format(definition, IMAGE_URL_TEMPLATE.format(self.random.choice(WORDS), self.random.randint(1, 10 ** 6), self.random.choice(("gif", "png", "jpg"))))
+        return definition
+
+    def make_date(self, now):
+        return now - timedelta(seconds=self.random.random() * HISTORY.total_seconds())
+
+    def definition_rows(self, count, now):
+        ''' Generate rows for the definitions table.
+        '''
+        for number in range(count):
+            term = self.make_term()
+            definition = self.make_definition()
+            self.terms.append(term)
+            yield (self.make_date(now).isoformat(), term, normalize_term(term), definition, get_image_url(definition), get_alias_key(definition), self.pick_user())
+
+    def interaction_rows(self, count, now):
+        ''' Generate rows for the interactions table.
+        '''
+        for number in range(count):
+            if self.terms and self.random.random() >= NOT_FOUND_SHARE:
+                # popular terms are looked up far more often than the rest
+                term = self.terms[int(len(self.terms) * self.random.random() ** 4)]
+                action = "found"
+            else:
+                term = self.make_term_for_lookup()
+                action = "not_found"
+            yield (self.make_date(now).isoformat(), self.pick_user(), term, action)
+
+    def make_term_for_lookup(self):
+        return "".join([self.random.choice(LETTERS) for count in range(self.random.randint(2, 6))])
+
+def generate_glossary(definitions, interactions, users=None, seed=None):
+    ''' Add the passed numbers of made-up definitions and interactions to the database.
+        The definitions' counting triggers are switched off while the rows are copied,
+        and the statistics are recounted once at the end; the interactions are counted
+        as they're rolled up.
+    '''
+    generator = GlossaryGenerator(seed=seed)
+    generator.make_users(users or max(definitions // 50, 10))
+    now = datetime.utcnow()
+
+    # start from the terms that are already defined, so that new ones don't clash
+    for term, term_key in db.session.execute('SELECT term, term_key FROM definitions'):
+        generator.terms.append(term)
+        generator.keys.add(term_key)
+    db.session.commit()
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('ALTER TABLE definitions DISABLE TRIGGER count_definitions_trigger')
+        copy_rows(cursor, "definitions", ("creation_date", "term", "term_key", "definition", "image_url", "alias_key", "user_name"), generator.definition_rows(definitions, now))
+        copy_rows(cursor, "interactions", ("creation_date", "user_name", "term", "action"), generator.interaction_rows(interactions, now))
+        cursor.execute('ALTER TABLE definitions ENABLE TRIGGER count_definitions_trigger')
+        connection.commit()
+    finally:
+        connection.close()
+
+    # the aliases are pointed at their definitions once they're all there
+    refresh_aliases()
+    db.session.commit()
+    rebuild_statistics()
+
+    # give the planner statistics for the new rows; VACUUM can't run in a transaction
+    with db.engine.connect() as connection:
+        autocommit = connection.execution_options(isolation_level="AUTOCOMMIT")
+        autocommit.execute('VACUUM ANALYZE definitions')
+        autocommit.execute('VACUUM ANALYZE interactions')
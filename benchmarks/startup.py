@@ -0,0 +1,89 @@
+''' Time how long gunicorn takes from starting to answering its first slash command.
+
+    Run with `python -m benchmarks.startup` from the repository root, with DATABASE_URL
+    pointing at a glossary. It starts gunicorn with and without preloading several
+    times each, and reports the time from starting the process until a worker says
+    it's ready, until the first lookup is answered, and how long that lookup took.
+'''
+from os import environ
+from time import perf_counter, sleep
+import argparse
+import json
+import requests
+import subprocess
+import sys
+
+TOKEN = "startup-benchmark"
+
+def wait_for(check, timeout):
+    ''' Call check until it returns something, returning that and how long it took
+    '''
+    started = perf_counter()
+    while perf_counter() - started < timeout:
+        try:
+            result = check()
+            if result is not None:
+                return result, perf_counter() - started
+        except requests.exceptions.ConnectionError:
+            pass
+        sleep(0.01)
+    raise RuntimeError("gave up after {} seconds".format(timeout))
+
+def time_startup(preload, workers, port, timeout):
+    ''' Start gunicorn and time how long it takes to become ready and answer a command
+    '''
+    url = "http://127.0.0.1:{}/".format(port)
+    env = dict(environ, SLACK_TOKEN=TOKEN, SLACK_WEBHOOK_URL="http://127.0.0.1:9/", GUNICORN_PRELOAD="true" if preload else "false", WEB_CONCURRENCY=str(workers))
+    started = perf_counter()
+    server = subprocess.Popen(["gunicorn", "-c", "gunicorn_config.py", "--bind", "127.0.0.1:{}".format(port), "gloss.wsgi:app"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        def listening():
+            return requests.get("{}ready".format(url), timeout=timeout).status_code
+
+        def ready():
+            return True if requests.get("{}ready".format(url), timeout=timeout).status_code == 200 else None
+
+        def answered():
+            asked = perf_counter()
+            response = requests.post(url, data={'token': TOKEN, 'text': "shh EW", 'user_name': "benchmark", 'channel_id': "123456", 'command': "/gloss"}, timeout=timeout)
+            return perf_counter() - asked if response.status_code == 200 else None
+
+        result = {'preload': preload}
+        wait_for(listening, timeout)
+        result['listening'] = perf_counter() - started
+        wait_for(ready, timeout)
+        result['ready'] = perf_counter() - started
+        result['first_response'], _ = wait_for(answered, timeout)
+        result['answered'] = perf_counter() - started
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Time gunicorn's startup with and without preloading.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default="startup-results.json")
+    args = parser.parse_args()
+
+    results = []
+    for run in range(args.runs):
+        for preload in (False, True):
+            results.append(time_startup(preload, args.workers, args.port, args.timeout))
+
+    print("{:<8} {:>14} {:>10} {:>13} {:>18}".format("preload", "listening (s)", "ready (s)", "answered (s)", "first response (s)"))
+    for preload in (False, True):
+        runs = [result for result in results if result['preload'] == preload]
+        averages = [sum([result[key] for result in runs]) / len(runs) for key in ('listening', 'ready', 'answered', 'first_response')]
+        print("{:<8} {:>14.3f} {:>10.3f} {:>13.3f} {:>18.4f}".format(str(preload).lower(), *averages))
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print("wrote {}".format(args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+''' Compare how many slash commands a second sync and gevent gunicorn workers answer.
+
+    Run with `python -m benchmarks.throughput` from the repository root, with
+    DATABASE_URL pointing at a glossary (`python manage.py generate` will make one).
+    For each worker class it starts gunicorn with the same number of workers, posts
+    lookups of random terms from many threads at once, and reports requests a second
+    and latency percentiles. Webhooks go to a local sink that answers after a delay,
+    like Slack does.
+'''
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import environ
+from socketserver import ThreadingMixIn
+from threading import Thread
+from time import perf_counter, sleep
+import argparse
+import json
+import psycopg2
+import random
+import requests
+import subprocess
+import sys
+
+TOKEN = "throughput-benchmark"
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def make_webhook_sink(delay):
+    ''' Make a server that accepts webhooks after waiting delay seconds
+    '''
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            sleep(delay)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def get_terms(database_url, count):
+    with psycopg2.connect(database_url) as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT term FROM definitions ORDER BY random() LIMIT %s', (count,))
+        return [term for term, in cursor.fetchall()]
+
+def wait_for_server(url, timeout=30.0):
+    started = perf_counter()
+    while perf_counter() - started < timeout:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            sleep(0.2)
+    raise RuntimeError("gunicorn didn't start listening at {}".format(url))
+
+def run_load(url, terms, concurrency, total, private_share, seed):
+    ''' Post total lookups from concurrency threads, returning each one's latency and
+        the number that failed
+    '''
+    chooser = random.Random(seed)
+    texts = ["{}{}".format("shh " if chooser.random() < private_share else "", chooser.choice(terms)) for number in range(total)]
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency))
+
+    def post(text):
+        started = perf_counter()
+        response = session.post(url, data={'token': TOKEN, 'text': text, 'user_name': "benchmark", 'channel_id': "123456", 'command': "/gloss"}, timeout=60)
+        return perf_counter() - started, response.status_code == 200
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(post, texts))
+    return [latency for latency, succeeded in results], len([succeeded for latency, succeeded in results if not succeeded])
+
+def benchmark_worker_class(worker_class, args, terms, webhook_url, port):
+    env = dict(environ, SLACK_TOKEN=TOKEN, SLACK_WEBHOOK_URL=webhook_url, GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(args.workers))
+    server = subprocess.Popen(["gunicorn", "-c", "gunicorn_config.py", "--worker-class", worker_class, "--bind", "127.0.0.1:{}".format(port), "gloss.wsgi:app"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = "http://127.0.0.1:{}/".format(port)
+        wait_for_server(url)
+        # warm up the workers' connections and caches
+        run_load(url, terms, args.concurrency, args.concurrency * 2, args.private_share, args.seed)
+        started = perf_counter()
+        latencies, failures = run_load(url, terms, args.concurrency, args.requests, args.private_share, args.seed)
+        elapsed = perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        'worker_class': worker_class,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'failures': failures,
+        'requests_per_second': args.requests / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+        'p99': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync and gevent gunicorn workers.")
+    parser.add_argument("--worker-classes", default="sync,gevent")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--private-share", type=float, default=0.5, help="the share of lookups made with shh, which skip the webhook")
+    parser.add_argument("--webhook-delay", type=float, default=0.2, help="how long the webhook sink takes to answer")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=8675309)
+    parser.add_argument("--output", default="throughput-results.json")
+    args = parser.parse_args()
+
+    terms = get_terms(environ['DATABASE_URL'], 1000)
+    if not terms:
+        print("there are no definitions to look up; run `python manage.py generate` first")
+        return 1
+
+    sink = make_webhook_sink(args.webhook_delay)
+    webhook_url = "http://127.0.0.1:{}/".format(sink.server_address[1])
+    results = [benchmark_worker_class(worker_class, args, terms, webhook_url, args.port) for worker_class in args.worker_classes.split(",")]
+    sink.shutdown()
+
+    print("{:<8} {:>8} {:>12} {:>10} {:>10} {:>10} {:>9}".format("workers", "class", "requests/s", "p50 (s)", "p95 (s)", "p99 (s)", "failures"))
+    for result in results:
+        print("{:<8} {:>8} {:>12.1f} {:>10.4f} {:>10.4f} {:>10.4f} {:>9}".format(result['workers'], result['worker_class'], result['requests_per_second'], result['p50'], result['p95'], result['p99'], result['failures']))
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print("wrote {}".format(args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
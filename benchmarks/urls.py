@@ -0,0 +1,74 @@
+''' Compare gloss.urls against the regular expression that verify_url used to use.
+
+    Run with `python -m benchmarks.urls` from the repository root. It checks that the
+    scanner agrees with the old pattern on randomly generated URL-ish text, then times
+    both on inputs built to make the old pattern backtrack, at increasing sizes. The
+    scanner's time should grow linearly with the size of the input.
+'''
+from gloss.urls import verify_url
+from time import perf_counter
+import random
+import re
+import sys
+
+# the pattern from before the scanner, with the typo'd "Ja" top-level domain that it
+# matched fixed to "sj", so that the fuzzer only reports real differences
+LEGACY_URL_PATTERN = re.compile(r"^(?:(?:https?)://|)(?:(?!(?:10|127)(?:\.\d{1,3}){3})(?!(?:169\.254|192\.168)(?:\.\d{1,3}){2})(?!172\.(?:1[6-9]|2\d|3[0-1])(?:\.\d{1,3}){2})(?:[1-9]\d?|1\d\d|2[01]\d|22[0-3])(?:\.(?:1?\d{1,2}|2[0-4]\d|25[0-5])){2}(?:\.(?:[1-9]\d?|1\d\d|2[0-4]\d|25[0-4]))|(?:(?:[a-z\u00a1-\uffff0-9]-*)*[a-z\u00a1-\uffff0-9]+)(?:\.(?:[a-z\u00a1-\uffff0-9]-*)*[a-z\u00a1-\uffff0-9]+)*(?:\.(?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)))(?::\d{2,5})?(?:/\S*)?$", re.UNICODE)
+
+# the pieces that random inputs are made from
+PIECES = ["http://", "https://", "a", "z", "0", "9", "-", ".", ":", "/", " ", "com", "org", "uk", "gif", "ü", "✪", "255", "10", "172", "16", "1", "00", "@", "?", "#"]
+
+# the strings that are repeated to build pathological inputs; the old pattern takes
+# about four times longer for every two more repetitions of "aa." or "a.a"
+PATHOLOGICAL = ["aa.", "a.a", "a1.", "a-"]
+
+def legacy_verify_url(text):
+    return bool(LEGACY_URL_PATTERN.match(text))
+
+def fuzz(attempts, seed):
+    ''' Compare the scanner and the old pattern on random short inputs, returning
+        the inputs they disagree on.
+    '''
+    fuzzer = random.Random(seed)
+    differences = []
+    for attempt in range(attempts):
+        text = "".join([fuzzer.choice(PIECES) for count in range(fuzzer.randint(1, 12))])
+        if bool(verify_url(text)) != legacy_verify_url(text):
+            differences.append(text)
+    return differences
+
+def time_call(function, text):
+    ''' Time one call of the function, in seconds
+    '''
+    started = perf_counter()
+    function(text)
+    return perf_counter() - started
+
+def benchmark(sizes, legacy_budget):
+    ''' Time both implementations on pathological inputs of the passed sizes. The old
+        pattern is skipped for larger sizes once one call takes longer than legacy_budget
+        seconds.
+    '''
+    print("{:<16} {:>8} {:>14} {:>14}".format("input", "length", "scanner (s)", "regex (s)"))
+    for repeated in PATHOLOGICAL:
+        legacy_skipped = False
+        for size in sizes:
+            text = "http://{}!".format(repeated * size)
+            scanner_time = time_call(verify_url, text)
+            legacy_time = None
+            if not legacy_skipped:
+                legacy_time = time_call(legacy_verify_url, text)
+                legacy_skipped = legacy_time > legacy_budget
+            print("{:<16} {:>8} {:>14.6f} {:>14}".format(repr(repeated), len(text), scanner_time, "{:.6f}".format(legacy_time) if legacy_time is not None else "skipped"))
+
+def main():
+    differences = fuzz(attempts=20000, seed=8675309)
+    print("fuzzed 20000 inputs, {} differences".format(len(differences)))
+    for text in differences[:20]:
+        print("  {!r}: scanner {}, regex {}".format(text, bool(verify_url(text)), legacy_verify_url(text)))
+    print("")
+    benchmark(sizes=[8, 12, 16, 20, 1000, 100000], legacy_budget=0.5)
+    return 1 if differences else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+''' Time the functions in gloss.views that every slash command leans on, against
+    generated glossaries of increasing size.
+
+    Run with `python -m benchmarks.views` from the repository root. Every size drops
+    and recreates the tables in the benchmark database (postgresql:///glossary-bot-benchmark
+    unless BENCHMARK_DATABASE_URL or --database-url says otherwise) and fills them with
+    `generate_glossary`. Results are written as JSON, and passing the JSON from an
+    earlier run as --compare reports the benchmarks whose median time has grown.
+'''
+from gloss import create_app, db
+from gloss.urls import get_image_url, verify_url
+from gloss.views import get_learnings, get_matches_for_term, get_stats, make_bold, parse_learnings_params, query_definition, read_page_token
+from benchmarks.glossary import generate_glossary
+from datetime import datetime
+from os import environ
+from time import perf_counter
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+# definitions:interactions pairs, up to a million definitions and fifty million interactions
+DEFAULT_SIZES = "1000:100000,100000:5000000,1000000:50000000"
+DEFAULT_DATABASE_URL = "postgresql:///glossary-bot-benchmark"
+
+# text for the functions that don't touch the database
+URL_SAMPLES = ("https://images.example.com/cats/1234.gif", "http://example.com/", "see EW", "not a url at all", "http://{}!".format("aa." * 1000))
+BOLD_SAMPLES = ("EW", "Eligibility Worker\nsomeone who works on eligibility\n\n", "\n".join(["line {}".format(number) for number in range(50)]))
+LEARNINGS_PARAMS_SAMPLES = ("", "20", "alpha 10", "random 5 10", "all", "10 next:WyJhbHBoYSIsICJldyJd")
+
+def measure(name, function, arguments, iterations):
+    ''' Call function iterations times, cycling through the argument tuples, and return
+        the fastest, median, mean and 95th percentile times in seconds
+    '''
+    timings = []
+    for iteration in range(iterations):
+        args = arguments[iteration % len(arguments)]
+        started = perf_counter()
+        function(*args)
+        timings.append(perf_counter() - started)
+        # don't let one call's transaction or loaded objects carry over to the next
+        db.session.rollback()
+        db.session.expunge_all()
+
+    timings.sort()
+    return {
+        'benchmark': name,
+        'iterations': iterations,
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'mean': sum(timings) / len(timings),
+        'p95': timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+    }
+
+def benchmark_text(iterations):
+    ''' Time the functions that only work on text
+    '''
+    return [
+        measure("verify_url", verify_url, [(text,) for text in URL_SAMPLES], iterations),
+        measure("get_image_url", get_image_url, [(text,) for text in URL_SAMPLES], iterations),
+        measure("make_bold", make_bold, [(text,) for text in BOLD_SAMPLES], iterations),
+        measure("parse_learnings_params", parse_learnings_params, [(text,) for text in LEARNINGS_PARAMS_SAMPLES], iterations)
+    ]
+
+def benchmark_glossary(iterations):
+    ''' Time the functions that query the glossary in the database
+    '''
+    terms = [term for term, in db.session.execute('SELECT term FROM definitions ORDER BY random() LIMIT 100')]
+    db.session.rollback()
+    if not terms:
+        return []
+
+    fragments = [(term[:3],) for term in terms] + [(term[:2],) for term in terms[:10]] + [("eligibility",), ("zzzz",)]
+    first_page = get_learnings(how_many=12, sort_order="recent")[2]
+    first_alpha_page = get_learnings(how_many=12, sort_order="alpha")[2]
+    after_recent = read_page_token(first_page)[1] if first_page else None
+    after_alpha = read_page_token(first_alpha_page)[1] if first_alpha_page else None
+
+    return [
+        measure("query_definition", query_definition, [(term,) for term in terms], iterations),
+        measure("query_definition missing", query_definition, [("{} missing".format(term),) for term in terms], iterations),
+        measure("get_matches_for_term", get_matches_for_term, fragments, iterations),
+        measure("get_learnings recent", get_learnings, [(12, "recent")], iterations),
+        measure("get_learnings alpha", get_learnings, [(12, "alpha")], iterations),
+        measure("get_learnings random", get_learnings, [(12, "random")], iterations),
+        measure("get_learnings recent offset", get_learnings, [(12, "recent", 1000)], iterations),
+        measure("get_learnings recent next page", get_learnings, [(12, "recent", 0, after_recent)], iterations),
+        measure("get_learnings alpha next page", get_learnings, [(12, "alpha", 0, after_alpha)], iterations),
+        measure("get_stats", get_stats, [()], iterations)
+    ]
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_sizes(text):
+    ''' Parse "definitions:interactions,..." into a list of pairs of numbers
+    '''
+    sizes = []
+    for size in text.split(","):
+        definitions, _, interactions = size.partition(":")
+        sizes.append((int(definitions), int(interactions or 0)))
+    return sizes
+
+def compare(results, previous_results, threshold):
+    ''' Print how each benchmark's median compares with an earlier run, returning the
+        number that got slower by more than threshold
+    '''
+    previous = dict([((result['benchmark'], result['definitions'], result['interactions']), result) for result in previous_results])
+    slower = 0
+    print("{:<34} {:>10} {:>12} {:>12} {:>8}".format("benchmark", "definitions", "before (s)", "after (s)", "ratio"))
+    for result in results:
+        before = previous.get((result['benchmark'], result['definitions'], result['interactions']))
+        if before is None or not before['median']:
+            continue
+        ratio = result['median'] / before['median']
+        flag = ""
+        if ratio > threshold:
+            slower += 1
+            flag = "  slower"
+        print("{:<34} {:>10} {:>12.6f} {:>12.6f} {:>8.2f}{}".format(result['benchmark'], result['definitions'] or "", before['median'], result['median'], ratio, flag))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gloss.views against generated glossaries.")
+    parser.add_argument("--database-url", default=environ.get('BENCHMARK_DATABASE_URL', DEFAULT_DATABASE_URL), help="a database whose tables can be dropped")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated definitions:interactions pairs")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=8675309)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="results from an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="the ratio of medians that counts as a regression")
+    args = parser.parse_args()
+
+    app_environ = dict(environ, DATABASE_URL=args.database_url, WEBHOOK_WORKERS='0', INTERACTION_DURABILITY='sync', DEFINITION_CACHE_LISTEN='false')
+    app_environ.setdefault('SLACK_TOKEN', "benchmark")
+    app_environ.setdefault('SLACK_WEBHOOK_URL', "http://hooks.example.com/services/BENCHMARK")
+    app = create_app(app_environ)
+
+    results = []
+    with app.app_context():
+        for result in benchmark_text(args.iterations):
+            result.update(definitions=None, interactions=None)
+            results.append(result)
+
+        for definitions, interactions in parse_sizes(args.sizes):
+            db.drop_all()
+            db.create_all()
+            started = perf_counter()
+            generate_glossary(definitions, interactions, seed=args.seed)
+            print("generated {} definitions and {} interactions in {:.1f}s".format(definitions, interactions, perf_counter() - started))
+            for result in benchmark_glossary(args.iterations):
+                result.update(definitions=definitions, interactions=interactions)
+                results.append(result)
+
+        db.session.remove()
+
+    print("{:<34} {:>10} {:>12} {:>12} {:>12}".format("benchmark", "definitions", "min (s)", "median (s)", "p95 (s)"))
+    for result in results:
+        print("{:<34} {:>10} {:>12.6f} {:>12.6f} {:>12.6f}".format(result['benchmark'], result['definitions'] or "", result['min'], result['median'], result['p95']))
+
+    report = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'started': datetime.utcnow().isoformat(),
+        'iterations': args.iterations,
+        'seed': args.seed,
+        'results': results
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print("wrote {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+        print("")
+        print("compared with {} ({})".format(args.compare, previous.get('commit')))
+        return 1 if compare(results, previous['results'], args.threshold) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
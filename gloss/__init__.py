@@ -1,18 +1,108 @@
 from flask import Blueprint, Flask
-from flask_sqlalchemy import SQLAlchemy
+from .database import RoutingSQLAlchemy, make_engine_options
 
 gloss = Blueprint('gloss', __name__)
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+from .cache import DefinitionCache
+from .commands import CommandRouter
+from .interactions import InteractionWriter
+from .maintenance import InteractionMaintenance
+from .metrics import Metrics
+from .profiling import RequestProfiler
+from .replicas import ReplicaRouter
+from .sampling import DefinitionSampler
+from .search import SearchIndex
+from .warmup import Warmup
+from .webhooks import WebhookDelivery
+
+definition_cache = DefinitionCache()
+interactions = InteractionWriter()
+interaction_maintenance = InteractionMaintenance()
+definition_sampler = DefinitionSampler()
+router = CommandRouter()
+search_index = SearchIndex(cache=definition_cache)
+webhooks = WebhookDelivery()
+metrics = Metrics(router=router, webhooks=webhooks, interactions=interactions)
+request_profiler = RequestProfiler(router=router)
+warmup = Warmup(router=router, search_index=search_index)
+replicas = ReplicaRouter(router=router, cache=definition_cache)
 
 def create_app(environ):
     app = Flask(__name__)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_DATABASE_URI'] = environ['DATABASE_URL']
+    app.config['DATABASE_POOL_SIZE'] = int(environ.get('DATABASE_POOL_SIZE', 5))
+    app.config['DATABASE_MAX_OVERFLOW'] = int(environ.get('DATABASE_MAX_OVERFLOW', 10))
+    app.config['DATABASE_POOL_RECYCLE'] = int(environ.get('DATABASE_POOL_RECYCLE', -1))
+    app.config['DATABASE_POOL_PRE_PING'] = environ.get('DATABASE_POOL_PRE_PING', "true").lower() == "true"
+    app.config['DATABASE_STATEMENT_TIMEOUT'] = int(environ.get('DATABASE_STATEMENT_TIMEOUT', 0))
+    app.config['DATABASE_APPLICATION_NAME'] = environ.get('DATABASE_APPLICATION_NAME', "glossary-bot")
+    app.config['DATABASE_PGBOUNCER'] = environ.get('DATABASE_PGBOUNCER', "false").lower() == "true"
+    # PgBouncer can run each transaction on a different server connection, which
+    # doesn't have the statements prepared on another or hear its notifications
+    app.config['DATABASE_PREPARED_STATEMENTS'] = environ.get('DATABASE_PREPARED_STATEMENTS', "false" if app.config['DATABASE_PGBOUNCER'] else "true").lower() == "true"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = make_engine_options(app.config)
     app.config['DATABASE_URL'] = environ['DATABASE_URL']
+    # read-only commands can be answered from read replicas, given as a comma-separated list of URLs
+    app.config['DATABASE_REPLICA_URLS'] = [url.strip() for url in environ.get('DATABASE_REPLICA_URLS', "").split(",") if url.strip()]
+    app.config['DATABASE_REPLICA_CONNECT_TIMEOUT'] = int(environ.get('DATABASE_REPLICA_CONNECT_TIMEOUT', 2))
+    app.config['DATABASE_REPLICA_CHECK_INTERVAL'] = float(environ.get('DATABASE_REPLICA_CHECK_INTERVAL', 10.0))
+    app.config['DATABASE_REPLICA_MAX_LAG'] = float(environ.get('DATABASE_REPLICA_MAX_LAG', 5.0))
+    # a workspace's reads stay on the primary for this long after its definitions change,
+    # which is long enough for a replica that isn't lagging too far behind to catch up
+    app.config['DATABASE_REPLICA_WRITE_HOLD'] = float(environ.get('DATABASE_REPLICA_WRITE_HOLD', app.config['DATABASE_REPLICA_MAX_LAG']))
     app.config['SLACK_TOKEN'] = environ['SLACK_TOKEN']
     app.config['SLACK_WEBHOOK_URL'] = environ['SLACK_WEBHOOK_URL']
+    # keep a glossary for each Slack workspace that sends commands, by the team_id they're sent with
+    app.config['MULTI_WORKSPACE'] = environ.get('MULTI_WORKSPACE', "false").lower() == "true"
+    app.config['WEBHOOK_WORKERS'] = int(environ.get('WEBHOOK_WORKERS', 2))
+    app.config['WEBHOOK_QUEUE_SIZE'] = int(environ.get('WEBHOOK_QUEUE_SIZE', 100))
+    app.config['WEBHOOK_MAX_RETRIES'] = int(environ.get('WEBHOOK_MAX_RETRIES', 3))
+    app.config['WEBHOOK_BACKOFF'] = float(environ.get('WEBHOOK_BACKOFF', 0.5))
+    app.config['WEBHOOK_TIMEOUT'] = float(environ.get('WEBHOOK_TIMEOUT', 5.0))
+    app.config['WEBHOOK_DRAIN_TIMEOUT'] = float(environ.get('WEBHOOK_DRAIN_TIMEOUT', 10.0))
+    # how long a request waits for room in a full queue before its payload is dropped
+    app.config['WEBHOOK_QUEUE_WAIT'] = float(environ.get('WEBHOOK_QUEUE_WAIT', 0.5))
+    # how many lists of payloads that have to arrive in order can wait to be sent at once
+    app.config['WEBHOOK_ORDERED_QUEUE_SIZE'] = int(environ.get('WEBHOOK_ORDERED_QUEUE_SIZE', 10))
+    app.config['INTERACTION_DURABILITY'] = environ.get('INTERACTION_DURABILITY', "buffered")
+    app.config['INTERACTION_BUFFER_SIZE'] = int(environ.get('INTERACTION_BUFFER_SIZE', 100))
+    app.config['INTERACTION_BUFFER_LIMIT'] = int(environ.get('INTERACTION_BUFFER_LIMIT', 10000))
+    app.config['INTERACTION_FLUSH_INTERVAL'] = float(environ.get('INTERACTION_FLUSH_INTERVAL', 5.0))
+    app.config['INTERACTION_PARTITIONS_AHEAD'] = int(environ.get('INTERACTION_PARTITIONS_AHEAD', 2))
+    app.config['INTERACTION_ROLLUP_DELAY'] = float(environ.get('INTERACTION_ROLLUP_DELAY', 3600.0))
+    app.config['INTERACTION_RETENTION_DAYS'] = int(environ.get('INTERACTION_RETENTION_DAYS', 90))
+    # how often each worker checks whether the scheduled maintenance has been missed; 0 turns the checks off
+    app.config['INTERACTION_MAINTENANCE_CHECK_INTERVAL'] = float(environ.get('INTERACTION_MAINTENANCE_CHECK_INTERVAL', 3600.0))
+    app.config['DEFINITION_CACHE_SIZE'] = int(environ.get('DEFINITION_CACHE_SIZE', 1000))
+    app.config['DEFINITION_CACHE_TTL'] = float(environ.get('DEFINITION_CACHE_TTL', 60.0))
+    app.config['DEFINITION_CACHE_LISTEN'] = environ.get('DEFINITION_CACHE_LISTEN', "false" if app.config['DATABASE_PGBOUNCER'] else "true").lower() == "true"
+    app.config['SEARCH_RESULTS_LIMIT'] = int(environ.get('SEARCH_RESULTS_LIMIT', 20))
+    app.config['SEARCH_BACKEND'] = environ.get('SEARCH_BACKEND', "postgres")
+    app.config['SEARCH_INDEX_REBUILD_INTERVAL'] = float(environ.get('SEARCH_INDEX_REBUILD_INTERVAL', 300.0))
+    app.config['RANDOM_SEED'] = environ.get('RANDOM_SEED')
+    app.config['LEARNINGS_MESSAGE_LENGTH'] = int(environ.get('LEARNINGS_MESSAGE_LENGTH', 4000))
+    # a public list of every learning that would take more messages than this is sent privately instead
+    app.config['LEARNINGS_PUBLIC_MESSAGES'] = int(environ.get('LEARNINGS_PUBLIC_MESSAGES', 10))
+    app.config['PROFILE_SAMPLE_RATE'] = float(environ.get('PROFILE_SAMPLE_RATE', 0.0))
+    app.config['PROFILE_CPROFILE'] = environ.get('PROFILE_CPROFILE', "false").lower() == "true"
+    app.config['PROFILE_PATH'] = environ.get('PROFILE_PATH', "profiles.jsonl")
+    app.config['PROFILE_MAX_BYTES'] = int(environ.get('PROFILE_MAX_BYTES', 10 * 1024 * 1024))
+    app.config['PROFILE_BACKUP_COUNT'] = int(environ.get('PROFILE_BACKUP_COUNT', 3))
+    app.config['WARMUP_CONNECTIONS'] = int(environ.get('WARMUP_CONNECTIONS', 2))
 
     db.init_app(app)
+    webhooks.init_app(app)
+    interactions.init_app(app)
+    interaction_maintenance.init_app(app)
+    definition_cache.init_app(app)
+    search_index.init_app(app)
+    definition_sampler.init_app(app)
+    metrics.init_app(app)
+    request_profiler.init_app(app)
+    warmup.init_app(app)
+    replicas.init_app(app)
 
     app.register_blueprint(gloss)
     return app
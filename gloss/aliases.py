@@ -0,0 +1,98 @@
+from sqlalchemy import sql
+from . import db
+
+# chains of aliases that are longer than this are left unresolved
+MAX_ALIAS_HOPS = 32
+
+# the aliases that lead on from the passed terms, as (term_key, alias_key) pairs;
+# UNION stops at a pair it's already seen, so a circle that's already there ends
+FIND_ALIAS_CHAINS = '''
+    WITH RECURSIVE chain (term_key, alias_key) AS (
+        SELECT term_key, alias_key FROM definitions
+        WHERE team_id = :team_id AND term_key = ANY(CAST(:term_keys AS varchar[])) AND alias_key IS NOT NULL
+        UNION
+        SELECT definitions.term_key, definitions.alias_key FROM definitions JOIN chain ON definitions.term_key = chain.alias_key
+        WHERE definitions.team_id = :team_id AND definitions.alias_key IS NOT NULL
+    )
+    SELECT term_key, alias_key FROM chain
+'''
+
+# point every affected alias at the definition at the end of its chain: the first
+# definition along it that isn't an alias, or the last one that exists. An alias of
+# a term that isn't defined doesn't point anywhere. The definitions that are
+# affected are the ones that match the filter and every alias that leads to them,
+# which are returned so that their cached lookups can be evicted.
+REFRESH_ALIASES = '''
+    WITH RECURSIVE affected (id, team_id, term_key) AS (
+        SELECT id, team_id, term_key FROM definitions WHERE {affected_filter}
+        UNION
+        SELECT definitions.id, definitions.team_id, definitions.term_key
+        FROM definitions JOIN affected ON definitions.team_id = affected.team_id AND definitions.alias_key = affected.term_key
+    ), hops (alias_id, team_id, id, alias_key, depth) AS (
+        SELECT definitions.id, definitions.team_id, definitions.id, definitions.alias_key, 0
+        FROM definitions JOIN affected ON definitions.team_id = affected.team_id AND definitions.id = affected.id
+        UNION ALL
+        SELECT hops.alias_id, hops.team_id, definitions.id, definitions.alias_key, hops.depth + 1
+        FROM definitions JOIN hops ON definitions.team_id = hops.team_id AND definitions.term_key = hops.alias_key
+        WHERE hops.depth < {max_hops}
+    ), resolved AS (
+        SELECT DISTINCT ON (alias_id) alias_id, team_id, CASE WHEN depth = 0 OR depth = {max_hops} THEN NULL ELSE id END AS alias_of
+        FROM hops ORDER BY alias_id, depth DESC
+    ), updated AS (
+        UPDATE definitions SET alias_of = resolved.alias_of FROM resolved
+        WHERE definitions.team_id = resolved.team_id AND definitions.id = resolved.alias_id AND definitions.alias_of IS DISTINCT FROM resolved.alias_of
+    )
+    SELECT definitions.term FROM affected JOIN definitions ON definitions.team_id = affected.team_id AND definitions.id = affected.id
+'''
+# the passed terms, and the aliases of them
+CHANGED_TERMS = "team_id = :team_id AND (term_key = ANY(CAST(:term_keys AS varchar[])) OR alias_key = ANY(CAST(:term_keys AS varchar[])))"
+# every alias in a workspace
+TEAM_ALIASES = "team_id = :team_id AND alias_key IS NOT NULL"
+
+def find_alias_cycles(aliases, team_id=""):
+    ''' Find the terms that would be aliases of themselves, by way of any number of
+        other aliases, if the passed {term_key: alias_key} changes were saved in the
+        passed workspace. An alias_key of None means the term won't be an alias.
+    '''
+    targets = [alias_key for alias_key in aliases.values() if alias_key is not None]
+    if not targets:
+        return set()
+
+    edges = dict(db.session.execute(sql.text(FIND_ALIAS_CHAINS), {'team_id': team_id, 'term_keys': targets}).fetchall())
+    for term_key, alias_key in aliases.items():
+        if alias_key is None:
+            edges.pop(term_key, None)
+        else:
+            edges[term_key] = alias_key
+
+    cycles = set()
+    for term_key in aliases:
+        seen = set([term_key])
+        alias_key = edges.get(term_key)
+        while alias_key is not None:
+            if alias_key in seen:
+                cycles.add(term_key)
+                break
+            seen.add(alias_key)
+            alias_key = edges.get(alias_key)
+
+    return cycles
+
+def refresh_aliases(term_keys=None, team_id=""):
+    ''' Bring alias_of up to date for the passed terms in the passed workspace, which
+        have just been set, changed or deleted, and for every alias that leads to them;
+        or, if no terms are passed, for every alias in the workspace. Pending changes
+        are flushed first. Returns the terms of the definitions that were affected,
+        whose cached lookups may be out of date.
+    '''
+    db.session.flush()
+    if term_keys is None:
+        rows = db.session.execute(sql.text(REFRESH_ALIASES.format(affected_filter=TEAM_ALIASES, max_hops=MAX_ALIAS_HOPS)), {'team_id': team_id})
+        return [term for term, in rows]
+
+    term_keys = list(term_keys)
+    if not term_keys:
+        return []
+
+    rows = db.session.execute(sql.text(REFRESH_ALIASES.format(affected_filter=CHANGED_TERMS, max_hops=MAX_ALIAS_HOPS)), {'team_id': team_id, 'term_keys': term_keys})
+    return [term for term, in rows]
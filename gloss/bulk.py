@@ -0,0 +1,219 @@
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+from sqlalchemy import sql
+from . import db, definition_cache
+from .aliases import refresh_aliases
+from .commands import SPACES_PATTERN
+from .models import Definition, get_alias_key, normalize_term
+from .urls import get_image_url
+from .views import RESERVED_TERMS
+import csv
+import io
+import json
+
+FILE_FORMATS = ("csv", "jsonl")
+EXTENSIONS = {'.csv': "csv", '.jsonl': "jsonl", '.ndjson': "jsonl", '.json': "jsonl"}
+
+# the fields that are imported and exported, in order
+FIELDS = ("term", "definition", "user_name", "creation_date")
+DATE_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+# how many records are sent to each parsing process at a time
+IMPORT_BATCH_SIZE = 1000
+# how many rows are sent in each COPY
+COPY_BATCH_SIZE = 50000
+# how many rows are fetched from the server-side cursor at a time when exporting
+EXPORT_FETCH_SIZE = 1000
+
+IMPORT_COLUMNS = ("term", "term_key", "definition", "image_url", "alias_key", "user_name", "creation_date")
+CREATE_IMPORT_TABLE = '''
+    CREATE TEMPORARY TABLE definitions_import (
+        position bigserial, term varchar, term_key varchar, definition varchar,
+        image_url varchar, alias_key varchar, user_name varchar, creation_date timestamp
+    ) ON COMMIT DROP
+'''
+# the last record for a term wins, and terms that are already defined the same way are left alone
+UPSERT_IMPORTED = '''
+    INSERT INTO definitions (team_id, term, term_key, definition, image_url, alias_key, user_name, creation_date)
+    SELECT DISTINCT ON (term_key) CAST(:team_id AS varchar), term, term_key, definition, image_url, alias_key, user_name, COALESCE(creation_date, timezone('utc', now()))
+    FROM definitions_import
+    ORDER BY term_key, position DESC
+    ON CONFLICT (team_id, term_key) DO UPDATE SET
+        term = excluded.term, definition = excluded.definition, image_url = excluded.image_url, alias_key = excluded.alias_key,
+        user_name = excluded.user_name, creation_date = excluded.creation_date
+    WHERE (definitions.term, definitions.definition) IS DISTINCT FROM (excluded.term, excluded.definition)
+    RETURNING xmax = 0 AS inserted
+'''
+COUNT_IMPORTED_TERMS = 'SELECT count(DISTINCT term_key) FROM definitions_import'
+
+def get_format(path, file_format=None):
+    ''' Get the format of the file at path, from its extension if it isn't passed
+    '''
+    if file_format is None:
+        extension = path[path.rfind("."):].lower() if "." in path else ""
+        file_format = EXTENSIONS.get(extension)
+    if file_format not in FILE_FORMATS:
+        raise ValueError("Can't tell the format of {}; pass one of {}".format(path, ", ".join(FILE_FORMATS)))
+    return file_format
+
+def parse_date(text):
+    ''' Parse a creation date, returning it in ISO format, or raise ValueError
+    '''
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).isoformat()
+        except ValueError:
+            continue
+    raise ValueError("{!r} isn't a date".format(text))
+
+def read_records(lines, file_format):
+    ''' Generate (line number, record) pairs from the input. CSV records are parsed
+        here, since their quoted fields can span lines; JSON lines are parsed later.
+    '''
+    if file_format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                yield line_number, line
+
+def batch_records(records, size=IMPORT_BATCH_SIZE):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def prepare_records(batch, user_name):
+    ''' Turn a batch of records into rows for the import table, the same way that
+        setting a definition would, returning the rows and a list of (line number,
+        problem) pairs for the records that can't be imported
+    '''
+    rows = []
+    errors = []
+    for line_number, record in batch:
+        if not isinstance(record, dict):
+            try:
+                record = json.loads(record)
+            except ValueError:
+                errors.append((line_number, "isn't valid JSON"))
+                continue
+            if not isinstance(record, dict):
+                errors.append((line_number, "isn't a JSON object"))
+                continue
+
+        term = SPACES_PATTERN.sub(" ", str(record.get('term') or "").strip())
+        definition = str(record.get('definition') or "").strip()
+        if not term or not definition:
+            errors.append((line_number, "needs a term and a definition"))
+            continue
+        # a lookup of a term with an '=' in it would be taken for a set
+        if "=" in term:
+            errors.append((line_number, "has an '=' in its term"))
+            continue
+        if term.lower() in RESERVED_TERMS:
+            errors.append((line_number, "is for the reserved term {}".format(term)))
+            continue
+
+        creation_date = None
+        if record.get('creation_date'):
+            try:
+                creation_date = parse_date(str(record['creation_date']).strip())
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+                continue
+
+        rows.append((term, normalize_term(term), definition, get_image_url(definition), get_alias_key(definition), str(record.get('user_name') or user_name).strip(), creation_date))
+
+    return rows, errors
+
+def copy_rows(cursor, table, columns, rows):
+    ''' COPY the passed rows into the table a batch at a time, returning how many
+        were copied
+    '''
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(table, ", ".join(columns))
+    copied = 0
+    while True:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        batch = 0
+        for row in rows:
+            writer.writerow(row)
+            batch += 1
+            if batch == COPY_BATCH_SIZE:
+                break
+        if not batch:
+            return copied
+
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        copied += batch
+
+def import_glossary(lines, file_format, user_name="import", processes=None, team_id=""):
+    ''' Import definitions into the passed workspace from the passed lines of CSV or
+        JSON Lines, with term and definition fields and optional user_name and
+        creation_date fields. Records are parsed by a pool of processes, copied into a
+        temporary table and upserted by normalized term in one transaction. Returns
+        counts of what happened, and the problems with the records that weren't imported.
+    '''
+    prepare = partial(prepare_records, user_name=user_name)
+    batches = batch_records(read_records(lines, file_format))
+    pool = Pool(processes) if processes != 1 else None
+    errors = []
+
+    def generate_rows():
+        for rows, batch_errors in (pool.imap(prepare, batches) if pool else map(prepare, batches)):
+            errors.extend(batch_errors)
+            for row in rows:
+                yield row
+
+    try:
+        connection = db.session.connection()
+        connection.execute(sql.text(CREATE_IMPORT_TABLE))
+        copied = copy_rows(connection.connection.cursor(), "definitions_import", IMPORT_COLUMNS, generate_rows())
+        terms = connection.execute(sql.text(COUNT_IMPORTED_TERMS)).scalar()
+        changes = [inserted for inserted, in connection.execute(sql.text(UPSERT_IMPORTED), {'team_id': team_id})]
+        # imported aliases that lead round in a circle are left unresolved
+        refresh_aliases(team_id=team_id)
+        definition_cache.invalidate_all()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if pool:
+            pool.terminate()
+
+    inserted = len([change for change in changes if change])
+    counts = {'records': copied + len(errors), 'skipped': len(errors), 'terms': terms, 'inserted': inserted, 'updated': len(changes) - inserted, 'unchanged': terms - len(changes)}
+    return counts, sorted(errors)
+
+def export_glossary(output, file_format, team_id=""):
+    ''' Write every definition in the passed workspace to output as CSV or JSON Lines,
+        in term order, fetching them from a server-side cursor a batch at a time.
+        Returns how many were written.
+    '''
+    query = db.session.query(Definition.term, Definition.definition, Definition.user_name, Definition.creation_date).filter(Definition.team_id == team_id).order_by(Definition.term_key)
+    writer = None
+    if file_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(FIELDS)
+
+    written = 0
+    for term, definition, user_name, creation_date in query.yield_per(EXPORT_FETCH_SIZE):
+        values = (term, definition, user_name, creation_date.isoformat() if creation_date else None)
+        if writer:
+            writer.writerow(values)
+        else:
+            output.write(json.dumps(dict(zip(FIELDS, values)), ensure_ascii=False))
+            output.write("\n")
+        written += 1
+
+    db.session.commit()
+    return written
@@ -0,0 +1,214 @@
+from collections import namedtuple, OrderedDict
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import sql
+from threading import Lock, Thread
+from time import monotonic, sleep
+from . import db
+from .models import normalize_term
+import logging
+import os
+import select
+
+# the Postgres channel that definition changes are announced on
+NOTIFY_CHANNEL = "gloss_definitions"
+# Postgres limits notification payloads to 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+
+# the parts of a definition that are needed to answer a lookup
+CachedDefinition = namedtuple('CachedDefinition', ['id', 'term', 'definition', 'image_url'])
+
+class DefinitionCache(object):
+    ''' An LRU cache of definition lookups, whose entries expire after a TTL. Changes
+        are announced with Postgres NOTIFY, and a listener thread in every worker
+        evicts the changed entries, so a stale definition is never served for
+        longer than the TTL even if a notification goes missing.
+    '''
+
+    def __init__(self, app=None):
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.pid = None
+        self.app = None
+        self.generation = 0
+        self.listeners = []
+        self.reset_counters()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read the cache's settings from the app's config.
+        '''
+        self.size = app.config.get('DEFINITION_CACHE_SIZE', 1000)
+        self.ttl = app.config.get('DEFINITION_CACHE_TTL', 60.0)
+        self.listen = app.config.get('DEFINITION_CACHE_LISTEN', True)
+        self.app = app
+        self.clear()
+        self.reset_counters()
+        app.extensions['definition_cache'] = self
+
+    def reset_counters(self):
+        ''' Zero the hit and miss counters.
+        '''
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(term, team_id=""):
+        ''' Get the cache key for the passed term in the passed workspace. Slack's team
+            ids never contain a colon, so the key can be split at the first one.
+        '''
+        return "{}:{}".format(team_id, normalize_term(term))
+
+    @staticmethod
+    def split_key(key):
+        ''' Get the team id and term key that the passed cache key was made from.
+        '''
+        team_id, _, term_key = key.partition(":")
+        return team_id, term_key
+
+    def get(self, term, loader, team_id=""):
+        ''' Return the cached lookup for the passed term in the passed workspace, calling
+            loader(term) and caching the result if it isn't cached or has expired.
+        '''
+        if self.size < 1:
+            return loader(term)
+
+        if self.listen:
+            self.start_listening()
+
+        key = self.make_key(term, team_id)
+        now = monotonic()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached and cached[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+
+            self.misses += 1
+            generation = self.generation
+
+        value = loader(term)
+        with self.lock:
+            # don't cache a value that may have changed while it was loading
+            if generation != self.generation:
+                return value
+
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        return value
+
+    def add_listener(self, listener):
+        ''' Call listener(key) whenever a key is evicted, and listener(None) whenever
+            the cache is cleared.
+        '''
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def evict(self, key):
+        ''' Remove the entry for the passed key from this worker's cache.
+        '''
+        with self.lock:
+            self.entries.pop(key, None)
+            self.generation += 1
+            self.invalidations += 1
+
+        for listener in self.listeners:
+            listener(key)
+
+    def clear(self):
+        ''' Remove every entry from this worker's cache.
+        '''
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+        for listener in self.listeners:
+            listener(None)
+
+    def invalidate(self, term, team_id=""):
+        ''' Evict the passed term from this worker's cache, and announce the change
+            to every other worker when the current transaction is committed.
+        '''
+        key = self.make_key(term, team_id)
+        self.evict(key)
+        # an empty payload tells listeners to clear everything
+        payload = key if len(key.encode('utf-8')) <= MAX_PAYLOAD_BYTES else ""
+        db.session.execute(sql.text('SELECT pg_notify(:channel, :payload)'), {'channel': NOTIFY_CHANNEL, 'payload': payload})
+
+    def invalidate_many(self, terms, team_id=""):
+        ''' Evict the passed terms from this worker's cache, and announce all of the
+            changes in one statement when the current transaction is committed.
+        '''
+        keys = [self.make_key(term, team_id) for term in terms]
+        for key in keys:
+            self.evict(key)
+        # clear everything for keys that are too long to announce
+        payloads = [key if len(key.encode('utf-8')) <= MAX_PAYLOAD_BYTES else "" for key in keys]
+        if payloads:
+            db.session.execute(sql.text('SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload'), {'channel': NOTIFY_CHANNEL, 'payloads': payloads})
+
+    def invalidate_all(self):
+        ''' Clear this worker's cache, and tell every other worker to clear theirs when
+            the current transaction is committed.
+        '''
+        self.clear()
+        db.session.execute(sql.text('SELECT pg_notify(:channel, :payload)'), {'channel': NOTIFY_CHANNEL, 'payload': ""})
+
+    def start_listening(self):
+        ''' Start the listener thread if it isn't already running in this process.
+        '''
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+            Thread(target=self.listen_for_changes, name="definition-cache-listener", daemon=True).start()
+
+    def listen_for_changes(self):
+        ''' Evict entries as changes are announced. If the connection is lost, clear
+            the cache, since notifications may have been missed, and reconnect.
+        '''
+        pid = os.getpid()
+        while self.pid == pid:
+            connection = None
+            try:
+                # take a connection out of the pool for good
+                proxy = db.get_engine(self.app).raw_connection()
+                proxy.detach()
+                connection = proxy.connection
+                connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                connection.cursor().execute('LISTEN {}'.format(NOTIFY_CHANNEL))
+                # anything cached before now might have missed a notification
+                self.clear()
+                while self.pid == pid:
+                    if select.select([connection], [], [], self.ttl) == ([], [], []):
+                        continue
+
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        if notify.payload:
+                            self.evict(notify.payload)
+                        else:
+                            self.clear()
+            except Exception:
+                logging.exception("Lost the definition cache's notification connection")
+                self.clear()
+                sleep(1)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def stats(self):
+        ''' Return the cache's size and hit, miss and invalidation counters.
+        '''
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
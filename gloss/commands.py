@@ -0,0 +1,134 @@
+from collections import namedtuple
+from functools import partial
+from threading import Lock
+from time import monotonic
+import logging
+import re
+
+# runs of spaces are collapsed before a command is parsed
+SPACES_PATTERN = re.compile(" +")
+# a private response is asked for with 'shh ' (or any number of s followed by any number of h)
+SHH_PATTERN = re.compile(r'^s+h+ ')
+
+# a parsed slash command
+Command = namedtuple('Command', ['action', 'word', 'text', 'params', 'private', 'slash_command', 'user_name', 'channel_id', 'team_id'])
+
+class CommandRouter(object):
+    ''' Maps the first word of a slash command to the handler for it, and times every
+        command it dispatches. Text with an '=' is a set, and anything else that isn't
+        a registered action is a get. Handlers can be wrapped, for example to answer
+        the actions that are registered as read_only from a read replica.
+    '''
+
+    def __init__(self, get_action="get", set_action="set", help_action="help"):
+        self.lock = Lock()
+        self.handlers = {}
+        self.actions = {}
+        self.single_words = frozenset()
+        self.read_only_actions = frozenset()
+        self.get_action = get_action
+        self.set_action = set_action
+        self.help_action = help_action
+        self.timing_hooks = []
+        self.dispatch_wrappers = []
+        self.reset_timings()
+
+    def command(self, action, words=(), single_word=True, read_only=False):
+        ''' Register the decorated function as the handler for action, which is invoked
+            by any of the passed words. Single words that aren't single_word commands
+            are looked up as terms instead. Handlers for read_only actions don't change
+            the glossary.
+        '''
+        def register(handler):
+            self.handlers[action] = handler
+            for word in words:
+                self.actions[word] = action
+            if single_word:
+                self.single_words = self.single_words | frozenset(words)
+            if read_only:
+                self.read_only_actions = self.read_only_actions | frozenset([action])
+            return handler
+        return register
+
+    def add_dispatch_wrapper(self, wrapper):
+        ''' Call wrapper(handler, read_only, command) instead of the handler for every
+            dispatched command; the wrapper is expected to call handler(command).
+        '''
+        if wrapper not in self.dispatch_wrappers:
+            self.dispatch_wrappers.append(wrapper)
+
+    def add_timing_hook(self, hook):
+        ''' Call hook(action, seconds) after every dispatched command.
+        '''
+        self.timing_hooks.append(hook)
+
+    def reset_timings(self):
+        ''' Zero the per-command timings.
+        '''
+        with self.lock:
+            # action: [count, total seconds, most seconds]
+            self.timings = {}
+
+    def resolve(self, full_text):
+        ''' Work out which action the passed text asks for, returning the action, the
+            word that invoked it, the text of the command, its parameters, and whether
+            to respond privately.
+        '''
+        command_text = SPACES_PATTERN.sub(" ", full_text.strip())
+
+        # a single word that's not a single-word command is a get
+        if command_text and " " not in command_text and command_text.lower() not in self.single_words:
+            return self.get_action, "", command_text, "", False
+
+        # text that contains an '=' is a set
+        if '=' in command_text:
+            return self.set_action, "", command_text, command_text, False
+
+        private = False
+        shh_match = SHH_PATTERN.match(command_text)
+        if shh_match:
+            private = True
+            command_text = command_text[shh_match.end():]
+
+        word, _, params = command_text.partition(" ")
+        word = word.lower()
+        action = self.actions.get(word)
+        if action is None and not command_text.strip():
+            action = self.help_action
+
+        return action or self.get_action, word, command_text, params, private
+
+    def dispatch(self, full_text, slash_command, user_name, channel_id, team_id=""):
+        ''' Resolve the passed text and call the handler for it, timing the call.
+        '''
+        action, word, command_text, params, private = self.resolve(full_text)
+        command = Command(action=action, word=word, text=command_text, params=params, private=private, slash_command=slash_command, user_name=user_name, channel_id=channel_id, team_id=team_id)
+        handler = self.handlers[action]
+        for wrapper in self.dispatch_wrappers:
+            handler = partial(wrapper, handler, action in self.read_only_actions)
+        started = monotonic()
+        try:
+            return handler(command)
+        finally:
+            self.record_timing(action, monotonic() - started)
+
+    def record_timing(self, action, seconds):
+        ''' Add a command's timing to the totals and pass it to the timing hooks.
+        '''
+        with self.lock:
+            timing = self.timings.setdefault(action, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+        for hook in self.timing_hooks:
+            try:
+                hook(action, seconds)
+            except Exception:
+                logging.exception("Command timing hook failed")
+
+    def stats(self):
+        ''' Return how many times each command has run, and its average and longest times.
+        '''
+        with self.lock:
+            return dict([(action, {'count': count, 'average': total / count, 'max': longest}) for action, (count, total, longest) in self.timings.items()])
@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm, sql
+from sqlalchemy.engine import Engine
+import re
+
+# named parameters in a statement, which aren't preceded by another colon like casts are
+PARAMETER_PATTERN = re.compile(r'(?<!:):(\w+)')
+
+def make_engine_options(config):
+    ''' Make the options that the database engine is created with from the app's config.
+        Behind PgBouncer in transaction pooling mode, connections don't keep session
+        state between transactions, so the statement timeout is set for every
+        transaction instead of for every connection.
+    '''
+    options = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+        'connect_args': {'application_name': config['DATABASE_APPLICATION_NAME']}
+    }
+    timeout = config['DATABASE_STATEMENT_TIMEOUT']
+    if timeout and config['DATABASE_PGBOUNCER']:
+        options['execution_options'] = {'transaction_statement_timeout': timeout}
+    elif timeout:
+        options['connect_args']['options'] = "-c statement_timeout={}".format(timeout)
+    return options
+
+def make_replica_engine_options(config):
+    ''' Make the options that read replicas' engines are created with, which give up
+        on connecting sooner, so that a replica that's down is passed over quickly.
+    '''
+    options = make_engine_options(config)
+    options['connect_args']['connect_timeout'] = config['DATABASE_REPLICA_CONNECT_TIMEOUT']
+    return options
+
+class RoutingSession(SignallingSession):
+    ''' A session that runs the queries of a request that's been pinned to a read
+        replica on that replica. Flushes, which write, always go to the primary.
+    '''
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context() and not self._flushing:
+            replica = g.get('database_replica')
+            if replica is not None:
+                return replica
+
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+@contextmanager
+def use_primary():
+    ''' Run the session's queries on the primary inside the block, even if the request
+        has been pinned to a read replica, for the writes that read commands make.
+    '''
+    if not has_request_context():
+        yield
+        return
+
+    replica = g.pop('database_replica', None)
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.database_replica = replica
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    ''' Flask-SQLAlchemy, with sessions that can be routed to a read replica.
+    '''
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+@event.listens_for(Engine, 'begin')
+def set_transaction_statement_timeout(conn):
+    ''' Limit how long the statements in a transaction can run, for engines that ask for it.
+    '''
+    timeout = conn.get_execution_options().get('transaction_statement_timeout')
+    if timeout:
+        conn.execute(sql.text("SELECT set_config('statement_timeout', :timeout, true)"), {'timeout': str(timeout)})
+
+class PreparedStatement(object):
+    ''' A statement that's run as a server-side prepared statement, so that Postgres
+        parses and plans it once per connection instead of on every call. psycopg2 has
+        no API for them, so the statement is PREPAREd on each connection the first time
+        it's used there, and EXECUTEd by name after that. When DATABASE_PREPARED_STATEMENTS
+        is off (it is by default behind PgBouncer, which can hand a transaction to any
+        server connection) the statement is run as it is.
+    '''
+
+    def __init__(self, name, statement, types):
+        self.name = name
+        self.statement = sql.text(statement)
+        # Postgres numbers the parameters of a prepared statement
+        self.parameters = []
+        for parameter in PARAMETER_PATTERN.findall(statement):
+            if parameter not in self.parameters:
+                self.parameters.append(parameter)
+        numbered = PARAMETER_PATTERN.sub(lambda match: "${}".format(self.parameters.index(match.group(1)) + 1), statement)
+        self.prepare_statement = sql.text("PREPARE {}{} AS {}".format(name, "({})".format(", ".join(types)) if types else "", numbered))
+        self.execute_statement = sql.text("EXECUTE {}({})".format(name, ", ".join([":{}".format(parameter) for parameter in self.parameters])) if self.parameters else "EXECUTE {}".format(name))
+
+    def execute(self, session, params=None):
+        ''' Run the statement in the passed session, preparing it first if this
+            session's connection hasn't seen it before.
+        '''
+        if not current_app.config.get('DATABASE_PREPARED_STATEMENTS', False):
+            return session.execute(self.statement, params or {})
+
+        connection = session.connection()
+        # connection.info lasts as long as the DBAPI connection, and so do the statements it has prepared
+        prepared = connection.info.setdefault('prepared_statements', set())
+        if self.name not in prepared:
+            connection.execute(self.prepare_statement)
+            prepared.add(self.name)
+
+        return connection.execute(self.execute_statement, params or {})
@@ -0,0 +1,144 @@
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+from threading import Lock, Thread
+from time import sleep
+from . import db
+from .models import Interaction
+import atexit
+import logging
+import os
+
+DURABILITY_MODES = ("sync", "buffered")
+
+class InteractionWriter(object):
+    ''' Record interactions with the bot. In 'sync' mode each interaction is committed
+        as it happens; in 'buffered' mode they're collected in memory and written in
+        one multi-row INSERT when the buffer fills, when the flush interval passes, or
+        when the worker exits. Rows that can't be written are counted, not hidden.
+    '''
+
+    def __init__(self, app=None):
+        self.lock = Lock()
+        self.pid = None
+        self.rows = []
+        self.app = None
+        self.listeners = []
+        self.reset_counters()
+        atexit.register(self.flush)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read the writer's settings from the app's config.
+        '''
+        self.flush()
+        self.durability = app.config.get('INTERACTION_DURABILITY', "buffered")
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError("INTERACTION_DURABILITY must be one of {}, not '{}'".format(", ".join(DURABILITY_MODES), self.durability))
+
+        self.buffer_size = app.config.get('INTERACTION_BUFFER_SIZE', 100)
+        self.buffer_limit = app.config.get('INTERACTION_BUFFER_LIMIT', 10000)
+        self.flush_interval = app.config.get('INTERACTION_FLUSH_INTERVAL', 5.0)
+        self.app = app
+        self.reset_counters()
+        app.extensions['interaction_writer'] = self
+
+    def reset_counters(self):
+        ''' Zero the written and dropped counters.
+        '''
+        self.written = 0
+        self.dropped = 0
+
+    def add_listener(self, listener):
+        ''' Call listener(outcome, count) whenever interactions are written or dropped,
+            where outcome is 'written' or 'dropped'.
+        '''
+        self.listeners.append(listener)
+
+    def count(self, outcome, count):
+        ''' Add to the written or dropped counter, and tell the listeners.
+        '''
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + count)
+
+        for listener in self.listeners:
+            listener(outcome, count)
+
+    def start(self):
+        ''' Start the thread that flushes the buffer on a timer, if it isn't already
+            running in this process.
+        '''
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+            # rows buffered before a fork belong to the parent
+            self.rows = []
+            Thread(target=self.flush_periodically, name="interaction-writer", daemon=True).start()
+
+    def flush_periodically(self):
+        ''' Flush the buffer every flush_interval seconds.
+        '''
+        pid = os.getpid()
+        while self.pid == pid:
+            sleep(self.flush_interval)
+            self.flush()
+
+    def log(self, term, user_name, action, team_id=""):
+        ''' Record an interaction in the passed workspace.
+        '''
+        if self.durability == "sync":
+            return self.write_now(term, user_name, action, team_id)
+
+        self.start()
+        row = {'team_id': team_id, 'creation_date': datetime.utcnow(), 'user_name': user_name, 'term': term, 'action': action}
+        with self.lock:
+            is_dropped = len(self.rows) >= self.buffer_limit
+            if not is_dropped:
+                self.rows.append(row)
+            is_full = len(self.rows) >= self.buffer_size
+
+        if is_dropped:
+            self.count('dropped', 1)
+        elif is_full:
+            self.flush()
+
+    def write_now(self, term, user_name, action, team_id=""):
+        ''' Record an interaction in its own transaction.
+        '''
+        try:
+            db.session.add(Interaction(team_id=team_id, term=term, user_name=user_name, action=action))
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            self.count('dropped', 1)
+            logging.exception("Unable to log a '{}' interaction".format(action))
+            return
+
+        self.count('written', 1)
+
+    def flush(self):
+        ''' Write every buffered interaction with a single multi-row INSERT.
+        '''
+        with self.lock:
+            rows, self.rows = self.rows, []
+
+        if not rows or self.app is None:
+            return
+
+        try:
+            with db.get_engine(self.app).begin() as connection:
+                connection.execute(Interaction.__table__.insert().values(rows))
+        except SQLAlchemyError:
+            self.count('dropped', len(rows))
+            logging.exception("Unable to write {} buffered interactions".format(len(rows)))
+            return
+
+        self.count('written', len(rows))
+
+    def stats(self):
+        ''' Return the number of interactions buffered, written and dropped.
+        '''
+        with self.lock:
+            return {'buffered': len(self.rows), 'written': self.written, 'dropped': self.dropped}
@@ -0,0 +1,223 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import sql
+from threading import Lock, Thread
+from time import sleep
+from . import db
+import logging
+import os
+import re
+
+# monthly partitions are named for the month they hold
+PARTITION_NAME_FORMAT = "interactions_y{:04d}m{:02d}"
+# how Postgres describes the upper bound of a range partition
+PARTITION_UPPER_BOUND_PATTERN = re.compile(r"TO \('([^']+)'\)")
+PARTITION_BOUND_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# the partition is filled with what's landed in the default partition for its month
+# before it's attached, since a partition can't be attached over rows that the
+# default partition holds for it. The default partition is locked against inserts
+# first, so that none land in it for that month between the move and the attach.
+CREATE_PARTITION = '''
+    LOCK TABLE interactions_default IN SHARE ROW EXCLUSIVE MODE;
+    CREATE TABLE {name} (LIKE interactions INCLUDING DEFAULTS);
+    WITH moved AS (
+        DELETE FROM interactions_default WHERE creation_date >= :start AND creation_date < :end RETURNING *
+    )
+    INSERT INTO {name} SELECT * FROM moved;
+    ALTER TABLE interactions ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}');
+'''
+
+LIST_PARTITIONS = '''
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = to_regclass('interactions')
+'''
+
+# lock the rollup state so that only one rollup runs at a time
+LOCK_ROLLUP_STATE = '''
+    INSERT INTO rollup_state (id, rolled_up_until) VALUES (1, NULL) ON CONFLICT (id) DO NOTHING;
+    SELECT rolled_up_until FROM rollup_state WHERE id = 1 FOR UPDATE;
+'''
+# count the interactions in each workspace between since and until by day, term and
+# action, add them to the daily counts and to the workspaces' statistics, and move
+# the mark up, all in one transaction so that the stats command never counts an
+# interaction twice or misses one
+ROLL_UP_INTERACTIONS = '''
+    WITH counted AS (
+        SELECT team_id, CAST(creation_date AS date) AS day, action, COALESCE(term, '') AS term, count(*) AS count
+        FROM interactions
+        WHERE creation_date >= COALESCE(CAST(:since AS timestamp), CAST('-infinity' AS timestamp)) AND creation_date < :until AND action IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    ), rolled_up AS (
+        INSERT INTO daily_interactions (team_id, day, action, term, count)
+        SELECT team_id, day, action, term, count FROM counted
+        ON CONFLICT (team_id, day, action, term) DO UPDATE SET count = daily_interactions.count + excluded.count
+    )
+    INSERT INTO statistics (team_id, definitions, definers, interactions)
+    SELECT team_id, 0, 0, sum(count) FROM counted GROUP BY team_id
+    ON CONFLICT (team_id) DO UPDATE SET interactions = statistics.interactions + excluded.interactions
+'''
+MOVE_ROLLUP_MARK = 'UPDATE rollup_state SET rolled_up_until = :until WHERE id = 1'
+
+DELETE_OLD_DEFAULTS = 'DELETE FROM interactions_default WHERE creation_date < :before'
+
+# held by whichever worker is maintaining interactions, so that the others don't too
+MAINTENANCE_LOCK_KEY = 7204515
+
+def get_month(moment, months_later=0):
+    ''' Get the start of the month that the passed moment is in, or of a month after it.
+    '''
+    index = moment.year * 12 + moment.month - 1 + months_later
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def create_partitions(now, months_ahead):
+    ''' Make sure there's a partition for this month and for each of the passed number
+        of months after it, returning the names of the ones that were created.
+    '''
+    created = []
+    for months_later in range(months_ahead + 1):
+        start = get_month(now, months_later)
+        end = get_month(now, months_later + 1)
+        name = PARTITION_NAME_FORMAT.format(start.year, start.month)
+        if db.session.execute(sql.text('SELECT to_regclass(:name)'), {'name': name}).scalar():
+            continue
+
+        db.session.execute(sql.text(CREATE_PARTITION.format(name=name, start=start.strftime(PARTITION_BOUND_FORMAT), end=end.strftime(PARTITION_BOUND_FORMAT))), {'start': start, 'end': end})
+        db.session.commit()
+        created.append(name)
+
+    return created
+
+def roll_up(until):
+    ''' Roll up every interaction from before the start of the day that until is in,
+        returning the moment that interactions have been rolled up until.
+    '''
+    until = datetime(until.year, until.month, until.day)
+    try:
+        since = db.session.execute(sql.text(LOCK_ROLLUP_STATE)).scalar()
+        if since is not None and since >= until:
+            db.session.rollback()
+            return since
+
+        db.session.execute(sql.text(ROLL_UP_INTERACTIONS), {'since': since, 'until': until})
+        db.session.execute(sql.text(MOVE_ROLLUP_MARK), {'until': until})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return until
+
+def drop_partitions(before):
+    ''' Drop the monthly partitions that only hold interactions from before the passed
+        moment, and delete any such interactions from the default partition, as long as
+        they've been rolled up. Returns the names of the partitions that were dropped.
+    '''
+    rolled_up_until = db.session.execute(sql.text('SELECT rolled_up_until FROM rollup_state WHERE id = 1')).scalar()
+    if rolled_up_until is None:
+        return []
+    before = min(before, rolled_up_until)
+
+    dropped = []
+    for name, bound in db.session.execute(sql.text(LIST_PARTITIONS)).fetchall():
+        match = PARTITION_UPPER_BOUND_PATTERN.search(bound)
+        if match and datetime.strptime(match.group(1)[:19], PARTITION_BOUND_FORMAT) <= before:
+            db.session.execute(sql.text('DROP TABLE {}'.format(name)))
+            dropped.append(name)
+
+    db.session.execute(sql.text(DELETE_OLD_DEFAULTS), {'before': before})
+    db.session.commit()
+    return dropped
+
+def maintain_interactions(now=None):
+    ''' Create the coming months' partitions, roll up the days that are over, and drop
+        the partitions that are older than INTERACTION_RETENTION_DAYS. Meant to be run
+        at least daily, from a scheduler.
+    '''
+    config = current_app.config
+    now = now or datetime.utcnow()
+    created = create_partitions(now, config['INTERACTION_PARTITIONS_AHEAD'])
+    # leave time for buffered interactions from the end of the day to be written
+    rolled_up_until = roll_up(now - timedelta(seconds=config['INTERACTION_ROLLUP_DELAY']))
+    dropped = drop_partitions(now - timedelta(days=config['INTERACTION_RETENTION_DAYS']))
+    return {'created': created, 'rolled_up_until': rolled_up_until, 'dropped': dropped}
+
+class InteractionMaintenance(object):
+    ''' Run maintain_interactions() from each worker when the scheduled
+        `manage.py maintain` job hasn't run for more than a day, so that partitions are
+        still created and interactions still rolled up if nobody scheduled it. Workers
+        check every check_interval seconds, and only one at a time does the work.
+    '''
+
+    def __init__(self, app=None):
+        self.lock = Lock()
+        self.pid = None
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read the maintenance settings from the app's config, and start checking
+            once the worker answers its first request.
+        '''
+        self.check_interval = app.config.get('INTERACTION_MAINTENANCE_CHECK_INTERVAL', 3600.0)
+        self.app = app
+        app.before_request(self.start)
+        app.extensions['interaction_maintenance'] = self
+
+    def start(self):
+        ''' Start the thread that checks on maintenance, if it isn't already running in
+            this process.
+        '''
+        if not self.check_interval:
+            return
+
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+            Thread(target=self.check_periodically, name="interaction-maintenance", daemon=True).start()
+
+    def check_periodically(self):
+        ''' Maintain interactions every check_interval seconds, if they're overdue.
+        '''
+        pid = os.getpid()
+        while self.pid == pid:
+            sleep(self.check_interval)
+            with self.app.app_context():
+                try:
+                    self.maintain_if_overdue()
+                except Exception:
+                    logging.exception("Unable to maintain the interactions table")
+                finally:
+                    db.session.remove()
+
+    def is_overdue(self, now=None):
+        ''' Have interactions gone more than a day without being rolled up?
+        '''
+        now = now or datetime.utcnow()
+        rolled_up_until = db.session.execute(sql.text('SELECT rolled_up_until FROM rollup_state WHERE id = 1')).scalar()
+        db.session.commit()
+        due = now - timedelta(seconds=self.app.config['INTERACTION_ROLLUP_DELAY'], days=1)
+        return rolled_up_until is None or rolled_up_until < datetime(due.year, due.month, due.day)
+
+    def maintain_if_overdue(self):
+        ''' Maintain interactions if they're overdue and no other worker is doing it,
+            returning the summary of what was done, or None.
+        '''
+        if not self.is_overdue():
+            return None
+
+        # the lock is held by a connection of its own, since maintenance commits as it goes
+        with db.get_engine(self.app).connect() as connection:
+            if not connection.execute(sql.text('SELECT pg_try_advisory_lock(:key)'), key=MAINTENANCE_LOCK_KEY).scalar():
+                return None
+            try:
+                if not self.is_overdue():
+                    return None
+                logging.warning("Interactions haven't been maintained for over a day; is `manage.py maintain` scheduled?")
+                return maintain_interactions()
+            finally:
+                connection.execute(sql.text('SELECT pg_advisory_unlock(:key)'), key=MAINTENANCE_LOCK_KEY)
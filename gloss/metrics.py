@@ -0,0 +1,119 @@
+from flask import g, has_request_context
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+from time import monotonic, time
+import os
+
+# the directory that gunicorn workers share their metrics through, which has to be
+# set before prometheus_client is imported
+MULTIPROCESS_DIRECTORY_VARIABLES = ('PROMETHEUS_MULTIPROC_DIR', 'prometheus_multiproc_dir')
+
+COMMAND_SECONDS = Histogram('gloss_command_seconds', "Time taken to answer a slash command", ['action'])
+REQUEST_DATABASE_SECONDS = Histogram('gloss_request_database_seconds', "Time spent in database queries while answering a request", buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, float("inf")))
+REQUEST_DATABASE_QUERIES = Histogram('gloss_request_database_queries', "Database queries made while answering a request", buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, float("inf")))
+WEBHOOK_SECONDS = Histogram('gloss_webhook_delivery_seconds', "Time from queueing a webhook to delivering it or giving up")
+WEBHOOK_DELIVERIES = Counter('gloss_webhook_deliveries_total', "Webhooks delivered to Slack, by outcome", ['outcome'])
+WEBHOOK_RETRIES = Counter('gloss_webhook_retries_total', "Webhook delivery attempts that were retried")
+INTERACTIONS = Counter('gloss_interactions_total', "Interactions logged, by whether they were written or dropped", ['outcome'])
+# the multiprocess collector adds a pid label to live workers' values
+WORKER_STARTED = Gauge('gloss_worker_start_time_seconds', "When the worker process started, labelled with its pid", multiprocess_mode='liveall')
+
+class Metrics(object):
+    ''' Collects Prometheus metrics from the command router, the database engine, the
+        webhook deliverer and the interaction writer. When the PROMETHEUS_MULTIPROC_DIR
+        environment variable is set, every worker writes its metrics to that directory
+        and a scrape of any one of them reports the total across all of them.
+    '''
+
+    def __init__(self, app=None, router=None, webhooks=None, interactions=None):
+        self.lock = Lock()
+        self.pid = None
+        self.router = router
+        self.webhooks = webhooks
+        self.interactions = interactions
+        self.listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Start collecting metrics for the app.
+        '''
+        with self.lock:
+            if not self.listening:
+                self.listening = True
+                if self.router is not None:
+                    self.router.add_timing_hook(self.observe_command)
+                if self.webhooks is not None:
+                    self.webhooks.add_listener(self.observe_webhook)
+                if self.interactions is not None:
+                    self.interactions.add_listener(self.observe_interactions)
+                event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.extensions['metrics'] = self
+
+    @staticmethod
+    def is_multiprocess():
+        ''' Are metrics being shared between worker processes?
+        '''
+        return any([name in os.environ for name in MULTIPROCESS_DIRECTORY_VARIABLES])
+
+    def mark_started(self):
+        ''' Record when this worker started, once per process.
+        '''
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        WORKER_STARTED.set(time())
+
+    def before_request(self):
+        ''' Start counting the request's database time.
+        '''
+        self.mark_started()
+        g.database_seconds = 0.0
+        g.database_queries = 0
+
+    def teardown_request(self, exception=None):
+        ''' Record the request's database time.
+        '''
+        if 'database_queries' in g:
+            REQUEST_DATABASE_SECONDS.observe(g.database_seconds)
+            REQUEST_DATABASE_QUERIES.observe(g.database_queries)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'database_queries' in g:
+            conn.info.setdefault('query_started', []).append(monotonic())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'database_queries' in g and conn.info.get('query_started'):
+            g.database_seconds += monotonic() - conn.info['query_started'].pop()
+            g.database_queries += 1
+
+    def observe_command(self, action, seconds):
+        COMMAND_SECONDS.labels(action=action).observe(seconds)
+
+    def observe_webhook(self, succeeded, latency, retries):
+        WEBHOOK_SECONDS.observe(latency)
+        WEBHOOK_DELIVERIES.labels(outcome="delivered" if succeeded else "failed").inc()
+        if retries:
+            WEBHOOK_RETRIES.inc(retries)
+
+    def observe_interactions(self, outcome, count):
+        INTERACTIONS.labels(outcome=outcome).inc(count)
+
+    def render(self):
+        ''' Return the metrics in Prometheus' text format, and its content type.
+        '''
+        self.mark_started()
+        if self.is_multiprocess():
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
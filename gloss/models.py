@@ -1,32 +1,235 @@
 from . import db
+from sqlalchemy import DDL, event
 from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import validates
 from datetime import datetime
+from .urls import get_image_url
+import re
+import unicodedata
+
+ALIAS_KEYWORDS = ("see also", "see")
+
+def normalize_term(term):
+    ''' Get the key that a term is stored and looked up by: the term casefolded and
+        NFKC-normalized, so that lookups aren't sensitive to case or Unicode form.
+    '''
+    return unicodedata.normalize('NFKC', unicodedata.normalize('NFKC', term).casefold())
+
+def get_alias_term(definition):
+    ''' If the passed definition starts with a keyword in ALIAS_KEYWORDS, strip
+        that prefix from the definition and return it.
+    '''
+    for keyword in ALIAS_KEYWORDS:
+        if definition.lower().startswith(keyword):
+            return re.split(keyword, definition, flags=re.IGNORECASE)[1].strip()
+
+    return None
+
+def get_alias_key(definition):
+    ''' Get the key of the term that the passed definition is an alias of, if it is one.
+    '''
+    alias_term = get_alias_term(definition) if definition is not None else None
+    return normalize_term(alias_term) if alias_term else None
 
 class Definition(db.Model):
     ''' Records of term definitions, along with some metadata
     '''
     __tablename__ = 'definitions'
+    # every index starts with team_id, so that a workspace's queries only read its own entries
+    __table_args__ = (
+        db.Index('ix_definitions_team_id_term_key', 'team_id', 'term_key', unique=True),
+        db.Index('ix_definitions_team_id_term_trgm', 'team_id', 'term', postgresql_using='gin', postgresql_ops={'term': 'gin_trgm_ops'}),
+        db.Index('ix_definitions_team_id_term_key_pattern', 'team_id', 'term_key', postgresql_ops={'term_key': 'varchar_pattern_ops'}),
+        db.Index('ix_definitions_team_id_tsv_search', 'team_id', 'tsv_search', postgresql_using='gin'),
+        db.Index('ix_definitions_team_id_creation_date_id', 'team_id', 'creation_date', 'id'),
+        db.Index('ix_definitions_team_id_alias_key', 'team_id', 'alias_key'),
+        # an alias points at the definition at the end of its chain, in the same workspace;
+        # the key is only checked on commit, so that a chain can be changed a link at a time
+        db.UniqueConstraint('team_id', 'id', name='uq_definitions_team_id_id'),
+        db.ForeignKeyConstraint(['team_id', 'alias_of'], ['definitions.team_id', 'definitions.id'], name='fk_definitions_alias_of', deferrable=True, initially='DEFERRED'),
+    )
     # Columns
     id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Unicode(), nullable=False, default="", server_default="")
     creation_date = db.Column(db.DateTime(), default=datetime.utcnow)
     term = db.Column(db.Unicode(), index=True)
+    term_key = db.Column(db.Unicode())
     definition = db.Column(db.Unicode())
+    image_url = db.Column(db.Unicode())
     user_name = db.Column(db.Unicode())
     tsv_search = db.Column(TSVECTOR)
+    # the term that the definition says to see instead, and the id of the definition
+    # that a lookup answers with, which is kept up to date by gloss.aliases
+    alias_key = db.Column(db.Unicode())
+    alias_of = db.Column(db.Integer)
+
+    @validates('term')
+    def set_term_key(self, key, term):
+        ''' Keep term_key in step with the term
+        '''
+        self.term_key = normalize_term(term) if term is not None else None
+        return term
+
+    @validates('definition')
+    def set_image_url_and_alias_key(self, key, definition):
+        ''' Find the definition's image URL and the term it's an alias of when it's
+            saved, so that lookups don't have to
+        '''
+        self.image_url = get_image_url(definition)
+        self.alias_key = get_alias_key(definition)
+        return definition
 
     def __repr__(self):
         return '<Term: {}, Definition: {}>'.format(self.term, self.definition)
 
+# trigram matching needs the pg_trgm extension, and GIN indexes that start with
+# team_id need btree_gin
+event.listen(Definition.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+event.listen(Definition.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS btree_gin'))
+
 class Interaction(db.Model):
-    ''' Records of interactions with Glossary Bot
+    ''' Records of interactions with Glossary Bot, partitioned by the month they
+        happened in, so that old months can be dropped once they've been rolled up
+        into daily_interactions
     '''
     __tablename__ = 'interactions'
+    __table_args__ = (
+        db.Index('ix_interactions_team_id_creation_date', 'team_id', 'creation_date'),
+        {'postgresql_partition_by': 'RANGE (creation_date)'},
+    )
     # Columns
-    id = db.Column(db.Integer, primary_key=True)
-    creation_date = db.Column(db.DateTime(), default=datetime.utcnow)
+    # the partition key has to be part of the primary key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    team_id = db.Column(db.Unicode(), nullable=False, default="", server_default="")
+    creation_date = db.Column(db.DateTime(), primary_key=True, default=datetime.utcnow)
     user_name = db.Column(db.Unicode())
     term = db.Column(db.Unicode())
-    action = db.Column(db.Unicode(), index=True)
+    action = db.Column(db.Unicode())
 
     def __repr__(self):
         return '<Action: {}, Date: {}>'.format(self.action, self.creation_date)
+
+# interactions that don't fall in a monthly partition, because maintenance hasn't
+# created it yet, are kept here until it does
+event.listen(Interaction.__table__, 'after_create', DDL('CREATE TABLE interactions_default PARTITION OF interactions DEFAULT'))
+
+class DailyInteractions(db.Model):
+    ''' How many times each term was asked for in each workspace on each day, and
+        with what outcome, rolled up from interactions once the day is over
+    '''
+    __tablename__ = 'daily_interactions'
+    # Columns
+    team_id = db.Column(db.Unicode(), primary_key=True)
+    day = db.Column(db.Date(), primary_key=True)
+    action = db.Column(db.Unicode(), primary_key=True)
+    term = db.Column(db.Unicode(), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<Day: {}, Term: {}, Action: {}, Count: {}>'.format(self.day, self.term, self.action, self.count)
+
+class RollupState(db.Model):
+    ''' How far interactions have been rolled up: every one from before
+        rolled_up_until is counted in daily_interactions, and none after it are
+    '''
+    __tablename__ = 'rollup_state'
+    # Columns
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_up_until = db.Column(db.DateTime())
+
+    def __repr__(self):
+        return '<Rolled Up Until: {}>'.format(self.rolled_up_until)
+
+class Statistics(db.Model):
+    ''' A row of counts for each workspace's stats command. Definitions and definers
+        are kept up to date by triggers on the definitions table; interactions counts
+        the ones that have been rolled up, and the stats command adds the ones since.
+    '''
+    __tablename__ = 'statistics'
+    # Columns
+    team_id = db.Column(db.Unicode(), primary_key=True)
+    definitions = db.Column(db.BigInteger, nullable=False, default=0)
+    definers = db.Column(db.BigInteger, nullable=False, default=0)
+    interactions = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<Definitions: {}, Definers: {}, Interactions: {}>'.format(self.definitions, self.definers, self.interactions)
+
+class Definer(db.Model):
+    ''' How many definitions each person has set in each workspace, so that the number
+        of people who've defined terms can be counted as they come and go
+    '''
+    __tablename__ = 'definers'
+    # Columns
+    team_id = db.Column(db.Unicode(), primary_key=True)
+    user_name = db.Column(db.Unicode(), primary_key=True)
+    definitions = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<User: {}, Definitions: {}>'.format(self.user_name, self.definitions)
+
+# count each workspace's definitions and definers as definitions are set, changed and
+# deleted; a change is taken away from the old row's workspace and added to the new
+# row's, whose statistics row is created if it doesn't exist yet
+COUNT_DEFINITIONS_FUNCTION = '''
+CREATE OR REPLACE FUNCTION count_definitions() RETURNS trigger AS $$
+DECLARE
+  term_change integer;
+  definer_change integer;
+  remaining integer;
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    DELETE FROM definers;
+    UPDATE statistics SET definitions = 0, definers = 0;
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP = 'UPDATE' AND old.team_id = new.team_id AND old.term IS NOT DISTINCT FROM new.term AND old.user_name IS NOT DISTINCT FROM new.user_name THEN
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    term_change := 0;
+    definer_change := 0;
+    IF old.term IS NOT NULL THEN
+      term_change := -1;
+    END IF;
+    IF old.user_name IS NOT NULL THEN
+      UPDATE definers SET definitions = definitions - 1 WHERE team_id = old.team_id AND user_name = old.user_name RETURNING definitions INTO remaining;
+      IF remaining = 0 THEN
+        DELETE FROM definers WHERE team_id = old.team_id AND user_name = old.user_name;
+        definer_change := -1;
+      END IF;
+    END IF;
+    IF term_change <> 0 OR definer_change <> 0 THEN
+      UPDATE statistics SET definitions = definitions + term_change, definers = definers + definer_change WHERE team_id = old.team_id;
+    END IF;
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    term_change := 0;
+    definer_change := 0;
+    IF new.term IS NOT NULL THEN
+      term_change := 1;
+    END IF;
+    IF new.user_name IS NOT NULL THEN
+      INSERT INTO definers (team_id, user_name, definitions) VALUES (new.team_id, new.user_name, 1)
+        ON CONFLICT (team_id, user_name) DO UPDATE SET definitions = definers.definitions + 1
+        RETURNING definitions INTO remaining;
+      IF remaining = 1 THEN
+        definer_change := 1;
+      END IF;
+    END IF;
+    IF term_change <> 0 OR definer_change <> 0 THEN
+      INSERT INTO statistics (team_id, definitions, definers, interactions) VALUES (new.team_id, term_change, definer_change, 0)
+        ON CONFLICT (team_id) DO UPDATE SET definitions = statistics.definitions + excluded.definitions, definers = statistics.definers + excluded.definers;
+    END IF;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+event.listen(Definition.__table__, 'after_create', DDL(COUNT_DEFINITIONS_FUNCTION))
+event.listen(Definition.__table__, 'after_create', DDL('CREATE TRIGGER count_definitions_trigger AFTER INSERT OR UPDATE OR DELETE ON definitions FOR EACH ROW EXECUTE PROCEDURE count_definitions()'))
+event.listen(Definition.__table__, 'after_create', DDL('CREATE TRIGGER count_definitions_truncate_trigger AFTER TRUNCATE ON definitions FOR EACH STATEMENT EXECUTE PROCEDURE count_definitions()'))
@@ -0,0 +1,229 @@
+from datetime import datetime
+from flask import g, has_request_context, request
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+from time import monotonic
+import cProfile
+import glob
+import heapq
+import json
+import logging
+import os
+import pstats
+import random
+import re
+
+# the endpoint whose requests are profiled
+PROFILED_ENDPOINT = "gloss.index"
+# how many statements and functions to record for each request
+TOP_COUNT = 20
+# statements are recorded without their runs of whitespace, and cut off at this length
+STATEMENT_LENGTH = 300
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+class RequestProfiler(object):
+    ''' Profiles slash command requests, either all of them when PROFILE_SAMPLE_RATE
+        is 1 or a random fraction of them, recording how many queries each one made,
+        how long each statement took, and, when PROFILE_CPROFILE is set, the functions
+        that took the most time. Each profile is written as a line of JSON to a
+        rotating file of the worker's own, named for PROFILE_PATH and the worker's
+        pid, since files can't safely be rotated by more than one process.
+    '''
+
+    def __init__(self, app=None, router=None):
+        self.lock = Lock()
+        self.router = router
+        self.listening = False
+        self.logger = None
+        self.logger_pid = None
+        self.sample_rate = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read the profiler's settings from the app's config.
+        '''
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.use_cprofile = app.config.get('PROFILE_CPROFILE', False)
+        self.path = app.config.get('PROFILE_PATH', "profiles.jsonl")
+        self.max_bytes = app.config.get('PROFILE_MAX_BYTES', 10 * 1024 * 1024)
+        self.backup_count = app.config.get('PROFILE_BACKUP_COUNT', 3)
+        self.logger = None
+
+        with self.lock:
+            if not self.listening:
+                self.listening = True
+                if self.router is not None:
+                    self.router.add_timing_hook(self.observe_command)
+                event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.extensions['request_profiler'] = self
+
+    def get_logger(self):
+        ''' Get a logger that writes lines to this process's rotating profile file.
+        '''
+        with self.lock:
+            if self.logger is None or self.logger_pid != os.getpid():
+                handler = RotatingFileHandler(get_process_path(self.path, os.getpid()), maxBytes=self.max_bytes, backupCount=self.backup_count)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self.logger = logging.getLogger("gloss.profiling.{}.{}".format(id(self), os.getpid()))
+                self.logger_pid = os.getpid()
+                self.logger.handlers = [handler]
+                self.logger.setLevel(logging.INFO)
+                self.logger.propagate = False
+            return self.logger
+
+    def before_request(self):
+        ''' Start profiling a sampled slash command request.
+        '''
+        if request.endpoint != PROFILED_ENDPOINT or not self.sample_rate or random.random() >= self.sample_rate:
+            return
+
+        g.profile = {'started': monotonic(), 'action': None, 'statements': [], 'profiler': None}
+        if self.use_cprofile:
+            g.profile['profiler'] = cProfile.Profile()
+            g.profile['profiler'].enable()
+
+    def teardown_request(self, exception=None):
+        ''' Finish the request's profile and write it out.
+        '''
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+
+        duration = monotonic() - profile['started']
+        if profile['profiler'] is not None:
+            profile['profiler'].disable()
+
+        # add up the time taken by each distinct statement
+        statements = {}
+        for statement, seconds in profile['statements']:
+            totals = statements.setdefault(statement, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+        slowest = sorted(statements.items(), key=lambda item: item[1][1], reverse=True)[:TOP_COUNT]
+
+        record = {
+            'time': datetime.utcnow().isoformat(),
+            'pid': os.getpid(),
+            'action': profile['action'],
+            'seconds': duration,
+            'error': repr(exception) if exception is not None else None,
+            'queries': len(profile['statements']),
+            'query_seconds': sum([seconds for statement, seconds in profile['statements']]),
+            'statements': [{'statement': statement, 'count': count, 'seconds': seconds} for statement, (count, seconds) in slowest],
+            'functions': self.get_top_functions(profile['profiler']) if profile['profiler'] is not None else []
+        }
+        try:
+            self.get_logger().info(json.dumps(record))
+        except (OSError, ValueError):
+            logging.exception("Unable to write a request profile")
+
+    @staticmethod
+    def get_top_functions(profiler):
+        ''' Get the functions that took the most cumulative time in the profile.
+        '''
+        stats = pstats.Stats(profiler)
+        functions = []
+        for (filename, line, name), (primitive_calls, calls, total, cumulative, callers) in stats.stats.items():
+            functions.append({'function': "{}:{}({})".format(filename, line, name), 'calls': calls, 'total': total, 'cumulative': cumulative})
+        functions.sort(key=lambda function: function['cumulative'], reverse=True)
+        return functions[:TOP_COUNT]
+
+    @staticmethod
+    def is_profiling():
+        return has_request_context() and 'profile' in g
+
+    def observe_command(self, action, seconds):
+        if self.is_profiling():
+            g.profile['action'] = action
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.is_profiling():
+            conn.info.setdefault('profile_query_started', []).append(monotonic())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.is_profiling() and conn.info.get('profile_query_started'):
+            seconds = monotonic() - conn.info['profile_query_started'].pop()
+            g.profile['statements'].append((WHITESPACE_PATTERN.sub(" ", statement).strip()[:STATEMENT_LENGTH], seconds))
+
+def get_process_path(path, pid):
+    ''' Get the path of the profile file that the process with the passed pid writes
+        to: profiles.jsonl becomes profiles.1234.jsonl.
+    '''
+    root, extension = os.path.splitext(path)
+    return "{}.{}{}".format(root, pid, extension)
+
+def read_profile_file(path, backup_count):
+    ''' Generate the profiles recorded in the file at path and its rotated backups,
+        oldest first.
+    '''
+    paths = ["{}.{}".format(path, number) for number in range(backup_count, 0, -1)] + [path]
+    for profile_path in paths:
+        if not os.path.exists(profile_path):
+            continue
+        with open(profile_path) as profile_file:
+            for line in profile_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+def read_profiles(path, backup_count=3):
+    ''' Generate the profiles recorded by every process for the passed PROFILE_PATH,
+        and their rotated backups, oldest first.
+    '''
+    root, extension = os.path.splitext(path)
+    pattern = re.compile(r'^{}\.\d+{}$'.format(re.escape(root), re.escape(extension)))
+    paths = [process_path for process_path in glob.glob("{}.*{}".format(glob.escape(root), glob.escape(extension))) if pattern.match(process_path)]
+    profiles = [read_profile_file(process_path, backup_count) for process_path in sorted(paths)]
+    return heapq.merge(*profiles, key=lambda profile: profile.get('time', ""))
+
+def get_percentile(values, fraction):
+    ''' Get the value at the passed fraction of the sorted values
+    '''
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+def summarize_profiles(profiles, top_count=10):
+    ''' Summarize the passed profiles as lines of text: timings and query counts for
+        each command, then the statements and functions that took the most time.
+    '''
+    actions = {}
+    statements = {}
+    functions = {}
+    for profile in profiles:
+        actions.setdefault(profile.get('action') or "unknown", []).append(profile)
+        for statement in profile.get('statements', []):
+            totals = statements.setdefault(statement['statement'], [0, 0.0])
+            totals[0] += statement['count']
+            totals[1] += statement['seconds']
+        for function in profile.get('functions', []):
+            totals = functions.setdefault(function['function'], [0, 0.0])
+            totals[0] += function['calls']
+            totals[1] += function['cumulative']
+
+    if not actions:
+        return ["No profiles were found."]
+
+    lines = ["{:<10} {:>8} {:>10} {:>10} {:>10} {:>10}".format("command", "requests", "mean (s)", "p50 (s)", "p95 (s)", "queries")]
+    for action, action_profiles in sorted(actions.items()):
+        seconds = [profile['seconds'] for profile in action_profiles]
+        queries = sum([profile.get('queries', 0) for profile in action_profiles]) / len(action_profiles)
+        lines.append("{:<10} {:>8} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.1f}".format(action, len(action_profiles), sum(seconds) / len(seconds), get_percentile(seconds, 0.5), get_percentile(seconds, 0.95), queries))
+
+    lines += ["", "Slowest statements, by total time:"]
+    for statement, (count, seconds) in sorted(statements.items(), key=lambda item: item[1][1], reverse=True)[:top_count]:
+        lines.append("{:>10.4f}s {:>6}x  {}".format(seconds, count, statement))
+
+    if functions:
+        lines += ["", "Slowest functions, by cumulative time:"]
+        for function, (calls, seconds) in sorted(functions.items(), key=lambda item: item[1][1], reverse=True)[:top_count]:
+            lines.append("{:>10.4f}s {:>6}x  {}".format(seconds, calls, function))
+
+    return lines
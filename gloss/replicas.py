@@ -0,0 +1,246 @@
+from flask import g, has_request_context
+from functools import partial
+from sqlalchemy import create_engine, sql
+from sqlalchemy.exc import OperationalError
+from threading import Lock, Thread
+from time import monotonic, sleep
+from . import db
+from .cache import DefinitionCache
+from .database import make_replica_engine_options
+import logging
+import os
+
+# how many seconds a replica is behind the primary; one that has replayed everything
+# it's received isn't behind, however long ago that was, and neither is a server
+# that isn't replicating at all
+REPLICA_LAG = sql.text('''
+    SELECT CASE WHEN pg_is_in_recovery() AND pg_last_wal_receive_lsn() IS DISTINCT FROM pg_last_wal_replay_lsn()
+        THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END
+''')
+
+class ReplicaRouter(object):
+    ''' Answers read-only commands from read replicas. Each of those commands is pinned
+        to one replica, picked in turn from the ones that passed their last health
+        check, by setting g.database_replica for the session to route its queries to;
+        writes go to the primary.
+
+        When a workspace's definitions change, as announced through the definition
+        cache's listener, its reads stay on the primary for write_hold seconds, so that
+        whoever changed them sees the change, and a lagging replica's copy isn't cached
+        in its place. Each worker checks its replicas every check_interval seconds from
+        a background thread, so that requests never wait on a replica that's down, and
+        passes over any that are unreachable or more than max_lag seconds behind. If it fails
+        during a command, the command is answered again from the primary; work that
+        mustn't be done twice, like logging the interaction or posting a webhook, is
+        passed to after_read() to wait until the command has been answered, or is done
+        after everything has been read.
+
+        A response that's streamed is read after the command has returned, so it's
+        wrapped in pin_stream() to keep reading from the command's replica. Its reads
+        aren't retried, and aren't counted in the command's metrics or profile.
+    '''
+
+    def __init__(self, app=None, router=None, cache=None):
+        self.lock = Lock()
+        self.router = router
+        self.cache = cache
+        self.pid = None
+        self.engines = []
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Create the engines for the app's replicas and read the routing settings.
+        '''
+        self.check_interval = app.config.get('DATABASE_REPLICA_CHECK_INTERVAL', 10.0)
+        self.max_lag = app.config.get('DATABASE_REPLICA_MAX_LAG', 5.0)
+        self.write_hold = app.config.get('DATABASE_REPLICA_WRITE_HOLD', self.max_lag)
+        for engine in self.engines:
+            engine.dispose()
+        urls = app.config.get('DATABASE_REPLICA_URLS', [])
+        self.engines = [create_engine(url, **make_replica_engine_options(app.config)) for url in urls]
+        self.reset()
+        if self.router is not None:
+            self.router.add_dispatch_wrapper(self.route_command)
+        if self.cache is not None:
+            self.cache.add_listener(self.hold_for_key)
+        app.extensions['replicas'] = self
+
+    def reset(self):
+        ''' Forget every replica's health and every held workspace.
+        '''
+        with self.lock:
+            self.next_replica = 0
+            # index: (whether it's healthy, when it was checked)
+            self.health = {}
+            # team_id: when its reads can go back to the replicas
+            self.held = {}
+            self.all_held_until = 0.0
+
+    def hold_for_key(self, key):
+        ''' Keep reads of the workspace that the passed cache key belongs to on the
+            primary for a while; passing None holds every workspace.
+        '''
+        until = monotonic() + self.write_hold
+        with self.lock:
+            if key is None:
+                self.all_held_until = until
+            else:
+                self.held[DefinitionCache.split_key(key)[0]] = until
+
+    def is_held(self, team_id):
+        ''' Should the passed workspace's reads stay on the primary?
+        '''
+        now = monotonic()
+        with self.lock:
+            if self.all_held_until > now:
+                return True
+            until = self.held.get(team_id)
+            if until is not None and until <= now:
+                del self.held[team_id]
+                return False
+            return until is not None
+
+    def check(self, index):
+        ''' Check whether the replica is reachable and caught up, recording the result.
+        '''
+        try:
+            with self.engines[index].connect() as connection:
+                lag = connection.execute(REPLICA_LAG).scalar()
+            healthy = lag <= self.max_lag
+            if not healthy:
+                logging.warning("Database replica {} is {:.1f} seconds behind".format(index, lag))
+        except Exception:
+            logging.exception("Database replica {} failed its health check".format(index))
+            healthy = False
+
+        with self.lock:
+            self.health[index] = (healthy, monotonic())
+        return healthy
+
+    def mark_unhealthy(self, index):
+        ''' Pass over the replica until its next check.
+        '''
+        with self.lock:
+            self.health[index] = (False, monotonic())
+
+    def start(self):
+        ''' Start the thread that checks the replicas, if it isn't already running in
+            this process.
+        '''
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            # connections and health inherited from a parent process can't be trusted
+            self.pid = os.getpid()
+            self.health = {}
+            for engine in self.engines:
+                engine.dispose()
+            Thread(target=self.check_periodically, name="replica-health-checks", daemon=True).start()
+
+    def check_periodically(self):
+        ''' Check every replica, then again every check_interval seconds.
+        '''
+        pid = os.getpid()
+        while self.pid == pid:
+            self.check_all()
+            sleep(self.check_interval)
+
+    def check_all(self):
+        ''' Check every replica, recording the results.
+        '''
+        for index in range(len(self.engines)):
+            self.check(index)
+
+    def choose(self, team_id=""):
+        ''' Pick a replica that passed its last check to answer a read from the passed
+            workspace, or return None to read from the primary.
+        '''
+        if not self.engines or self.is_held(team_id):
+            return None
+
+        self.start()
+        with self.lock:
+            start = self.next_replica
+            self.next_replica = (start + 1) % len(self.engines)
+            for offset in range(len(self.engines)):
+                index = (start + offset) % len(self.engines)
+                healthy, checked_at = self.health.get(index, (False, None))
+                if healthy:
+                    return index
+
+        return None
+
+    def after_read(self, callback, *args, **kwargs):
+        ''' Call callback(*args, **kwargs) on the primary once the command that's being
+            answered won't be answered again: right away, unless the command is being
+            answered from a replica, in which case it's called once the command has been.
+        '''
+        deferred = g.get('replica_deferred') if has_request_context() else None
+        if deferred is None:
+            return callback(*args, **kwargs)
+
+        deferred.append(partial(callback, *args, **kwargs))
+
+    def pin_stream(self, iterable):
+        ''' Wrap the items of a response that's streamed once the command has returned,
+            so that they're read from the replica that's answering the command, if any.
+        '''
+        replica = g.get('database_replica') if has_request_context() else None
+        if replica is None:
+            return iterable
+
+        return self.generate_pinned(replica, iterable)
+
+    def generate_pinned(self, replica, iterable):
+        ''' Generate the passed items, reading from the passed replica while each is
+            generated. If the replica fails, the response is cut short, since what's
+            been sent can't be taken back.
+        '''
+        iterator = iter(iterable)
+        while True:
+            g.database_replica = replica
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except OperationalError:
+                index = self.engines.index(replica)
+                logging.exception("Database replica {} failed while a response was streamed".format(index))
+                self.mark_unhealthy(index)
+                return
+            finally:
+                g.pop('database_replica', None)
+            yield item
+
+    def route_command(self, handler, read_only, command):
+        ''' Answer a read-only command from a replica, or from the primary if no replica
+            is healthy, the workspace is held on the primary, or the replica fails.
+        '''
+        if not read_only or not has_request_context():
+            return handler(command)
+
+        index = self.choose(command.team_id)
+        if index is None:
+            return handler(command)
+
+        g.database_replica = self.engines[index]
+        g.replica_deferred = []
+        try:
+            response = handler(command)
+        except OperationalError:
+            logging.exception("Database replica {} failed, answering from the primary".format(index))
+            self.mark_unhealthy(index)
+            g.pop('database_replica', None)
+            # the work that the failed attempt put off is done by the next one instead
+            g.pop('replica_deferred', None)
+            db.session.rollback()
+            return handler(command)
+        finally:
+            g.pop('database_replica', None)
+
+        for callback in g.pop('replica_deferred', []):
+            callback()
+        return response
@@ -0,0 +1,115 @@
+from math import ceil
+from random import Random
+from sqlalchemy import func
+from threading import Lock
+from . import db
+from .models import Definition
+from .stats import get_statistics
+import os
+
+# how many times to probe for more ids before falling back to reading all of them
+MAX_PROBE_ROUNDS = 4
+# how many more ids to probe than the table's density says should be needed
+PROBE_MARGIN = 1.5
+# the most ids to probe in one round
+MAX_PROBES = 5000
+
+class DefinitionSampler(object):
+    ''' Draws random definitions without sorting the whole table. Random ids are
+        probed between the lowest and highest ids, and the ones that exist are kept,
+        so every definition is equally likely to be picked and the cost depends on
+        how many are asked for rather than how many there are.
+
+        When RANDOM_SEED is set, samples are drawn from a generator seeded with it,
+        so that they can be reproduced.
+    '''
+
+    def __init__(self, app=None):
+        self.lock = Lock()
+        self.pid = None
+        self.seed = None
+        self.random = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read the sampler's settings from the app's config.
+        '''
+        self.seed = app.config.get('RANDOM_SEED')
+        self.pid = None
+        app.extensions['definition_sampler'] = self
+
+    def get_random(self, seed=None):
+        ''' Get the random number generator to use, seeding a new one if a seed is passed.
+        '''
+        if seed is not None:
+            return Random(seed)
+
+        with self.lock:
+            # forked workers would otherwise all draw the same numbers
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.random = Random(self.seed)
+            return self.random
+
+    def shuffle(self, items, seed=None):
+        ''' Shuffle the passed list in place.
+        '''
+        self.get_random(seed).shuffle(items)
+
+    def random_order(self, column, seed=None):
+        ''' Get an expression that shuffles rows when they're ordered by it. When the
+            sampler is seeded, the shuffle is the md5 of the column with a salt from the
+            generator, so that it can be reproduced.
+        '''
+        if seed is None and self.seed is None:
+            return func.random()
+
+        salt = self.get_random(seed).getrandbits(64)
+        return func.md5(func.concat(column, ':', salt))
+
+    def sample(self, how_many, seed=None, team_id=""):
+        ''' Return up to how_many distinct definitions from the passed workspace, chosen
+            at random. Ids are probed between the workspace's own lowest and highest ids,
+            and if other workspaces' ids are interleaved too densely for probing to find
+            enough, the sample is drawn from this workspace's ids alone.
+        '''
+        generator = self.get_random(seed)
+        lowest, highest = db.session.query(func.min(Definition.id), func.max(Definition.id)).filter(Definition.team_id == team_id).first()
+        if lowest is None or how_many < 1:
+            return []
+
+        span = highest - lowest + 1
+        # the stats counters say how many ids in the span are taken, without counting
+        density = max(get_statistics(team_id).definitions, 1) / span
+        found = []
+        probed = set()
+        for probe_round in range(MAX_PROBE_ROUNDS):
+            wanted = how_many - len(found)
+            if not wanted or len(probed) >= span:
+                break
+
+            probe_count = min(span - len(probed), MAX_PROBES, int(ceil(wanted / density * PROBE_MARGIN)) + 1)
+            ids = [row_id for row_id in generator.sample(range(lowest, highest + 1), probe_count) if row_id not in probed]
+            probed.update(ids)
+            found += self.load(ids, team_id)[:wanted]
+
+        if len(found) < how_many and len(probed) < span:
+            # the ids are too sparse to probe, so pick from all of them
+            found_ids = set([definition.id for definition in found])
+            remaining = [row_id for row_id, in db.session.query(Definition.id).filter(Definition.team_id == team_id) if row_id not in found_ids]
+            ids = generator.sample(remaining, min(how_many - len(found), len(remaining)))
+            found += self.load(ids, team_id)
+
+        return found
+
+    @staticmethod
+    def load(ids, team_id=""):
+        ''' Load the passed workspace's definitions with the passed ids that exist, in the
+            order of the ids.
+        '''
+        if not ids:
+            return []
+
+        definitions = dict([(definition.id, definition) for definition in Definition.query.filter(Definition.team_id == team_id, Definition.id.in_(ids))])
+        return [definitions[row_id] for row_id in ids if row_id in definitions]
@@ -0,0 +1,383 @@
+from bisect import bisect_left
+from math import exp, sqrt
+from snowballstemmer import stemmer
+from sqlalchemy import sql
+from threading import Lock, Thread
+from time import monotonic
+from . import db
+from .cache import DefinitionCache
+from .models import normalize_term
+import logging
+import re
+
+# the weights that definitions_search_trigger gives to terms (A) and definitions (B),
+# as ts_rank values them
+TERM_WEIGHT = 1.0
+DEFINITION_WEIGHT = 0.4
+
+# the stopwords dropped by Postgres' english text search configuration
+STOPWORDS = frozenset((
+    "i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "your", "yours", "yourself",
+    "yourselves", "he", "him", "his", "himself", "she", "her", "hers", "herself", "it", "its", "itself",
+    "they", "them", "their", "theirs", "themselves", "what", "which", "who", "whom", "this", "that",
+    "these", "those", "am", "is", "are", "was", "were", "be", "been", "being", "have", "has", "had",
+    "having", "do", "does", "did", "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as",
+    "until", "while", "of", "at", "by", "for", "with", "about", "against", "between", "into", "through",
+    "during", "before", "after", "above", "below", "to", "from", "up", "down", "in", "out", "on", "off",
+    "over", "under", "again", "further", "then", "once", "here", "there", "when", "where", "why", "how",
+    "all", "any", "both", "each", "few", "more", "most", "other", "some", "such", "no", "nor", "not",
+    "only", "own", "same", "so", "than", "too", "very", "s", "t", "can", "will", "just", "don", "should",
+    "now"
+))
+
+# words, with hyphenated words kept whole so that their parts can be split out
+WORD_PATTERN = re.compile(r'[^\W_]+(?:-[^\W_]+)*')
+# pg_trgm only makes trigrams from alphanumeric characters
+TRIGRAM_WORD_PATTERN = re.compile(r'[^\W_]+')
+
+# the limit of sum(1/i^2), used by ts_rank to normalize repeated matches
+PI_SQUARED_OVER_SIX = 1.64493406685
+
+SELECT_DEFINITIONS = sql.text('SELECT id, team_id, term, definition FROM definitions')
+SELECT_DEFINITION = sql.text('SELECT id, team_id, term, definition FROM definitions WHERE team_id = :team_id AND term_key = :term_key')
+
+class SearchIndex(object):
+    ''' An in-process inverted index over terms and definitions, which answers the same
+        searches as the SQL in get_matches_for_term and ranks them the same way: terms
+        that contain the search term come first, ranked like pg_trgm's similarity(),
+        followed by full-text matches ranked like Postgres' ts_rank().
+
+        Changes announced through the definition cache's listener are applied before
+        the next search, and the whole index is rebuilt every rebuild_interval seconds
+        in case an announcement was missed. Only the first load happens during a
+        search; later rebuilds run in a background thread, filling a new index that
+        replaces the old one all at once, so searches go on using the old one until
+        then.
+
+        Every key in the index starts with the team_id of the workspace that the
+        definition belongs to, so a search only ever reads that workspace's entries.
+    '''
+
+    def __init__(self, app=None, cache=None):
+        self.lock = Lock()
+        self.rebuild_lock = Lock()
+        # the stemmer keeps the word it's working on in itself, so only one thread can use it at a time
+        self.stemmer_lock = Lock()
+        self.stemmer = stemmer('english')
+        self.cache = cache
+        self.app = None
+        self.rebuild_thread = None
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read the index's settings from the app's config.
+        '''
+        self.rebuild_interval = app.config.get('SEARCH_INDEX_REBUILD_INTERVAL', 300.0)
+        self.app = app
+        self.reset()
+        if self.cache is not None:
+            self.cache.add_listener(self.mark_stale)
+        app.extensions['search_index'] = self
+
+    def reset(self):
+        ''' Empty the index, so that it's rebuilt before the next search.
+        '''
+        with self.lock:
+            self.is_loaded = False
+            self.loaded_at = None
+            self.stale_keys = set()
+            # the keys marked stale while a rebuild is running, or None if one isn't
+            self.missed_keys = None
+            self.missed_all = False
+            # id: (term, lowercased term, term_key, team_id)
+            self.terms = {}
+            # (team_id, term_key): id
+            self.ids = {}
+            # (team_id, lexeme): {id: [(position, weight), ...]}
+            self.postings = {}
+            # id: the lexemes in that definition
+            self.lexemes = {}
+            # (team_id, three lowercased characters): set of ids whose terms contain them
+            self.substrings = {}
+            # sorted (team_id, term_key, id) triples, for prefix matching
+            self.sorted_keys = []
+
+    def mark_stale(self, key):
+        ''' Note that the definition for the passed cache key has changed; passing None
+            means that anything may have changed.
+        '''
+        with self.lock:
+            if key is None:
+                self.loaded_at = None
+                self.missed_all = self.missed_keys is not None
+            else:
+                self.stale_keys.add(DefinitionCache.split_key(key))
+                if self.missed_keys is not None:
+                    self.missed_keys.add(DefinitionCache.split_key(key))
+
+    def refresh(self):
+        ''' Bring the index up to date with the database, loading it if it hasn't been
+            loaded yet, and starting a rebuild in the background if one is due.
+        '''
+        with self.lock:
+            is_loaded = self.is_loaded
+            is_due = self.loaded_at is None or monotonic() - self.loaded_at > self.rebuild_interval
+            stale_keys, self.stale_keys = self.stale_keys, set()
+
+        if not is_loaded:
+            self.rebuild(if_not_loaded=True)
+        elif is_due:
+            self.start_rebuilding()
+
+        for team_id, term_key in stale_keys:
+            self.remove(team_id, term_key)
+            row = db.session.execute(SELECT_DEFINITION, {'team_id': team_id, 'term_key': term_key}).first()
+            if row:
+                self.add(*row)
+
+    def start_rebuilding(self):
+        ''' Rebuild the index in a background thread, if one isn't already running.
+        '''
+        with self.lock:
+            if self.rebuild_thread is not None and self.rebuild_thread.is_alive():
+                return
+
+            self.rebuild_thread = Thread(target=self.rebuild_in_background, name="search-index-rebuild", daemon=True)
+            self.rebuild_thread.start()
+
+    def rebuild_in_background(self):
+        ''' Rebuild the index with a database session of the thread's own.
+        '''
+        with self.app.app_context():
+            try:
+                self.rebuild()
+            except Exception:
+                logging.exception("Unable to rebuild the search index")
+            finally:
+                db.session.remove()
+
+    def rebuild(self, if_not_loaded=False):
+        ''' Load every definition into a new index and swap it in for the current one.
+            Changes announced while it loads are applied again afterwards, since the
+            new index may have read the definitions before they changed.
+        '''
+        with self.rebuild_lock:
+            with self.lock:
+                if if_not_loaded and self.is_loaded:
+                    return
+                self.missed_keys = set()
+                self.missed_all = False
+                started_at = monotonic()
+
+            # a stemmer of its own, so that searches can stem words while it loads
+            fresh = SearchIndex()
+            for row_id, team_id, term, definition in db.session.execute(SELECT_DEFINITIONS):
+                fresh.add(row_id, team_id, term, definition)
+
+            with self.lock:
+                self.terms = fresh.terms
+                self.ids = fresh.ids
+                self.postings = fresh.postings
+                self.lexemes = fresh.lexemes
+                self.substrings = fresh.substrings
+                self.sorted_keys = fresh.sorted_keys
+                self.is_loaded = True
+                self.loaded_at = None if self.missed_all else started_at
+                self.stale_keys |= self.missed_keys
+                self.missed_keys = None
+                self.missed_all = False
+
+    def stem(self, word):
+        ''' Get the lexeme for a word.
+        '''
+        with self.stemmer_lock:
+            return self.stemmer.stemWord(word)
+
+    def tokenize(self, text):
+        ''' Get the lexemes in the passed text with their positions, splitting and
+            numbering words as Postgres' english configuration does.
+        '''
+        lexemes = []
+        position = 0
+        for match in WORD_PATTERN.finditer(text.lower()):
+            word = match.group(0)
+            # hyphenated words are indexed whole, and then by their parts
+            parts = [word] + word.split('-') if '-' in word else [word]
+            for part in parts:
+                position += 1
+                if part not in STOPWORDS:
+                    lexemes.append((self.stem(part), position))
+
+        return lexemes
+
+    def add(self, row_id, team_id, term, definition):
+        ''' Add a workspace's definition to the index.
+        '''
+        term = term or ""
+        term_key = normalize_term(term)
+        term_lexemes = self.tokenize(term)
+        # concatenated tsvectors number the second vector's positions after the first's
+        offset = max([position for lexeme, position in term_lexemes] or [0])
+        weighted = [(lexeme, position, TERM_WEIGHT) for lexeme, position in term_lexemes]
+        weighted += [(lexeme, position + offset, DEFINITION_WEIGHT) for lexeme, position in self.tokenize(definition or "")]
+
+        with self.lock:
+            self.terms[row_id] = (term, term.lower(), term_key, team_id)
+            self.ids[(team_id, term_key)] = row_id
+            self.lexemes[row_id] = set([lexeme for lexeme, position, weight in weighted])
+            for lexeme, position, weight in weighted:
+                self.postings.setdefault((team_id, lexeme), {}).setdefault(row_id, []).append((position, weight))
+            for substring in self.get_substrings(term.lower()):
+                self.substrings.setdefault((team_id, substring), set()).add(row_id)
+            index = bisect_left(self.sorted_keys, (team_id, term_key, row_id))
+            self.sorted_keys.insert(index, (team_id, term_key, row_id))
+
+    def remove(self, team_id, term_key):
+        ''' Remove a workspace's definition for term_key from the index.
+        '''
+        with self.lock:
+            row_id = self.ids.pop((team_id, term_key), None)
+            if row_id is None:
+                return
+
+            term, lowered_term, term_key, team_id = self.terms.pop(row_id)
+            for lexeme in self.lexemes.pop(row_id):
+                documents = self.postings[(team_id, lexeme)]
+                del documents[row_id]
+                if not documents:
+                    del self.postings[(team_id, lexeme)]
+            for substring in self.get_substrings(lowered_term):
+                self.substrings.get((team_id, substring), set()).discard(row_id)
+            index = bisect_left(self.sorted_keys, (team_id, term_key, row_id))
+            if index < len(self.sorted_keys) and self.sorted_keys[index] == (team_id, term_key, row_id):
+                del self.sorted_keys[index]
+
+    @staticmethod
+    def get_substrings(text):
+        ''' Get the three-character substrings of the passed text.
+        '''
+        return set([text[index:index + 3] for index in range(len(text) - 2)])
+
+    @staticmethod
+    def get_trigrams(text):
+        ''' Get the trigrams that pg_trgm would make from the passed text.
+        '''
+        trigrams = set()
+        for word in TRIGRAM_WORD_PATTERN.findall(text.lower()):
+            padded = "  {} ".format(word)
+            trigrams.update([padded[index:index + 3] for index in range(len(padded) - 2)])
+        return trigrams
+
+    def similarity(self, first, second):
+        ''' Score the similarity of two strings like pg_trgm's similarity().
+        '''
+        first_trigrams = self.get_trigrams(first)
+        second_trigrams = self.get_trigrams(second)
+        union = len(first_trigrams | second_trigrams)
+        return len(first_trigrams & second_trigrams) / union if union else 0.0
+
+    def find_like_matches(self, search_term, prefix_only, team_id=""):
+        ''' Get the ids of a workspace's terms that contain the search term, or that
+            start with it when prefix_only is set.
+        '''
+        if prefix_only:
+            prefix = normalize_term(search_term)
+            matches = set()
+            for key_team_id, term_key, row_id in self.sorted_keys[bisect_left(self.sorted_keys, (team_id, prefix)):]:
+                if key_team_id != team_id or not term_key.startswith(prefix):
+                    break
+                matches.add(row_id)
+            return matches
+
+        lowered = search_term.lower()
+        candidates = None
+        for substring in self.get_substrings(lowered):
+            ids = self.substrings.get((team_id, substring), set())
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return set()
+        return set([row_id for row_id in candidates if lowered in self.terms[row_id][1]])
+
+    def rank(self, positions_by_lexeme, lexemes):
+        ''' Rank a document for the passed query lexemes like ts_rank() with its
+            default weights and normalization.
+        '''
+        if len(lexemes) < 2:
+            return self.rank_any(positions_by_lexeme, lexemes)
+
+        # a query of several words scores words found near each other
+        score = -1.0
+        found = []
+        for lexeme in lexemes:
+            positions = positions_by_lexeme[lexeme]
+            for earlier_positions in found:
+                for position, weight in positions:
+                    for earlier_position, earlier_weight in earlier_positions:
+                        distance = abs(position - earlier_position)
+                        if distance:
+                            proximity = 1e-30 if distance > 100 else 1.0 / (1.005 + 0.05 * exp(distance / 1.5 - 2))
+                            current = sqrt(weight * earlier_weight * proximity)
+                            score = current if score < 0 else 1.0 - (1.0 - score) * (1.0 - current)
+            found.append(positions)
+
+        return score if score >= 0 else 1e-20
+
+    @staticmethod
+    def rank_any(positions_by_lexeme, lexemes):
+        ''' Rank a document for a query of one word, with diminishing returns for
+            repeated matches.
+        '''
+        score = 0.0
+        for lexeme in lexemes:
+            positions = positions_by_lexeme.get(lexeme)
+            if not positions:
+                continue
+
+            repeated = 0.0
+            best_weight = -1.0
+            best_index = 0
+            for index, (position, weight) in enumerate(positions):
+                repeated += weight / ((index + 1) * (index + 1))
+                if weight > best_weight:
+                    best_weight = weight
+                    best_index = index
+            score += (best_weight + repeated - best_weight / ((best_index + 1) * (best_index + 1))) / PI_SQUARED_OVER_SIX
+
+        return score / len(lexemes) if lexemes else 0.0
+
+    def find_text_matches(self, search_term, team_id=""):
+        ''' Get the ids of a workspace's definitions that match every word in the search
+            term, with their ranks.
+        '''
+        lexemes = sorted(set([lexeme for lexeme, position in self.tokenize(search_term)]))
+        if not lexemes:
+            return {}
+
+        postings = [self.postings.get((team_id, lexeme), {}) for lexeme in lexemes]
+        matches = set(min(postings, key=len))
+        for documents in postings:
+            matches &= set(documents)
+
+        ranks = {}
+        for row_id in matches:
+            positions_by_lexeme = dict([(lexeme, documents[row_id]) for lexeme, documents in zip(lexemes, postings)])
+            ranks[row_id] = self.rank(positions_by_lexeme, lexemes)
+        return ranks
+
+    def search(self, search_term, prefix_only=False, limit=None, team_id=""):
+        ''' Return a workspace's terms that match the search term, best first.
+        '''
+        if self.cache is not None and self.cache.listen:
+            self.cache.start_listening()
+        self.refresh()
+
+        with self.lock:
+            text_matches = self.find_text_matches(search_term, team_id)
+            like_matches = self.find_like_matches(search_term, prefix_only, team_id) - set(text_matches)
+            ranked = [(0, -self.similarity(self.terms[row_id][0], search_term), self.terms[row_id][0]) for row_id in like_matches]
+            ranked += [(1, -rank, self.terms[row_id][0]) for row_id, rank in text_matches.items()]
+
+        ranked.sort()
+        return [term for source, rank, term in ranked[:limit or None]]
@@ -0,0 +1,69 @@
+from . import db
+from .database import PreparedStatement, use_primary
+from sqlalchemy import sql
+
+# block writes to the counted tables while they're recounted, so that the triggers
+# and the next rollup pick up exactly where the recount left off
+LOCK_COUNTED_TABLES = 'LOCK TABLE definitions, daily_interactions IN SHARE MODE'
+
+DELETE_DEFINERS = 'DELETE FROM definers WHERE {team_filter}'
+RECOUNT_DEFINERS = '''
+    INSERT INTO definers (team_id, user_name, definitions)
+    SELECT team_id, user_name, count(*) FROM definitions WHERE user_name IS NOT NULL AND {team_filter} GROUP BY team_id, user_name
+'''
+
+DELETE_STATISTICS = 'DELETE FROM statistics WHERE {team_filter}'
+RECOUNT_STATISTICS = '''
+    INSERT INTO statistics (team_id, definitions, definers, interactions)
+    SELECT teams.team_id,
+        (SELECT count(term) FROM definitions WHERE definitions.team_id = teams.team_id),
+        (SELECT count(*) FROM definers WHERE definers.team_id = teams.team_id),
+        (SELECT COALESCE(sum(count), 0) FROM daily_interactions WHERE daily_interactions.team_id = teams.team_id)
+    FROM ({teams}) AS teams (team_id)
+'''
+# a workspace's row of counts, unless it has one already; it takes no locks, so a
+# workspace whose row is missing can be read without holding up anyone's writes
+ADD_STATISTICS = RECOUNT_STATISTICS + ' ON CONFLICT (team_id) DO NOTHING'
+# every workspace that has definitions or rolled up interactions
+ALL_TEAMS = 'SELECT team_id FROM definitions UNION SELECT team_id FROM daily_interactions'
+# one workspace, which gets a row of counts even if it has nothing to count yet
+ONE_TEAM = 'SELECT CAST(:team_id AS varchar)'
+
+# the interactions that haven't been rolled up yet are counted from the partitions
+# that hold them, which maintenance keeps to about a day's worth
+STATISTICS_STATEMENT = PreparedStatement("gloss_statistics", '''
+    SELECT definitions, definers, interactions + (
+        SELECT count(action) FROM interactions WHERE team_id = :team_id
+        AND creation_date >= COALESCE((SELECT rolled_up_until FROM rollup_state WHERE id = 1), CAST('-infinity' AS timestamp))
+    ) AS interactions
+    FROM statistics WHERE team_id = :team_id
+''', ("varchar",))
+
+def rebuild_statistics(team_id=None):
+    ''' Recount the statistics and definers from the definitions and daily_interactions
+        tables, for the passed workspace or for all of them
+    '''
+    team_filter = "true" if team_id is None else "team_id = :team_id"
+    params = {} if team_id is None else {'team_id': team_id}
+    db.session.execute(LOCK_COUNTED_TABLES)
+    db.session.execute(sql.text(DELETE_DEFINERS.format(team_filter=team_filter)), params)
+    db.session.execute(sql.text(RECOUNT_DEFINERS.format(team_filter=team_filter)), params)
+    db.session.execute(sql.text(DELETE_STATISTICS.format(team_filter=team_filter)), params)
+    db.session.execute(sql.text(RECOUNT_STATISTICS.format(teams=ALL_TEAMS if team_id is None else ONE_TEAM)), params)
+    db.session.commit()
+
+def get_statistics(team_id=""):
+    ''' Get the counts for a workspace's stats command, which the triggers on the
+        definitions table and the interaction rollups keep up to date
+    '''
+    statistics = STATISTICS_STATEMENT.execute(db.session, {'team_id': team_id}).first()
+    if statistics is None:
+        # the row is missing until the workspace sets a definition or its interactions
+        # are rolled up, or if it was deleted by hand; count what the triggers and
+        # rollups would have, and leave full rebuilds to manage.py rebuildstats
+        with use_primary():
+            db.session.execute(sql.text(ADD_STATISTICS.format(teams=ONE_TEAM)), {'team_id': team_id})
+            db.session.commit()
+            statistics = STATISTICS_STATEMENT.execute(db.session, {'team_id': team_id}).first()
+
+    return statistics
@@ -0,0 +1,85 @@
+from sqlalchemy import sql
+from . import db, definition_cache
+from .aliases import refresh_aliases
+from .models import Definition
+from .stats import rebuild_statistics
+
+MOVE_DEFINITIONS = 'UPDATE definitions SET team_id = :team_id WHERE team_id = :from_team_id'
+MOVE_INTERACTIONS = 'UPDATE interactions SET team_id = :team_id WHERE team_id = :from_team_id'
+MOVE_DAILY_INTERACTIONS = 'UPDATE daily_interactions SET team_id = :team_id WHERE team_id = :from_team_id'
+
+IS_PARTITIONED = "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('definitions'))"
+HAS_SEARCH_TRIGGER = "SELECT to_regproc('definitions_search_trigger') IS NOT NULL"
+
+# the new table takes over the old one's sequence, which would otherwise be dropped with it
+PARTITION_DEFINITIONS = '''
+    LOCK TABLE definitions IN ACCESS EXCLUSIVE MODE;
+    CREATE TABLE definitions_partitioned (LIKE definitions INCLUDING DEFAULTS) PARTITION BY HASH (team_id);
+    {partitions}
+    INSERT INTO definitions_partitioned SELECT * FROM definitions;
+    ALTER SEQUENCE definitions_id_seq OWNED BY NONE;
+    DROP TABLE definitions;
+    ALTER TABLE definitions_partitioned RENAME TO definitions;
+    ALTER SEQUENCE definitions_id_seq OWNED BY definitions.id;
+    ALTER TABLE definitions ADD PRIMARY KEY (id, team_id);
+    ALTER TABLE definitions ADD CONSTRAINT fk_definitions_alias_of FOREIGN KEY (team_id, alias_of) REFERENCES definitions (team_id, id) DEFERRABLE INITIALLY DEFERRED;
+'''
+CREATE_PARTITION = 'CREATE TABLE definitions_{remainder} PARTITION OF definitions_partitioned FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder});'
+
+# the statistics triggers can be set on the partitioned table itself
+CREATE_COUNT_TRIGGERS = '''
+    CREATE TRIGGER count_definitions_trigger AFTER INSERT OR UPDATE OR DELETE ON definitions FOR EACH ROW EXECUTE PROCEDURE count_definitions();
+    CREATE TRIGGER count_definitions_truncate_trigger AFTER TRUNCATE ON definitions FOR EACH STATEMENT EXECUTE PROCEDURE count_definitions();
+'''
+# but BEFORE triggers have to be set on each partition before Postgres 13
+CREATE_SEARCH_TRIGGER = 'CREATE TRIGGER tsvupdate_definitions_trigger BEFORE INSERT OR UPDATE ON definitions_{remainder} FOR EACH ROW EXECUTE PROCEDURE definitions_search_trigger();'
+
+def assign_team(team_id, from_team_id=""):
+    ''' Move every definition and interaction from one workspace to another; by default,
+        the ones that were recorded before the deployment served more than one workspace.
+        The statistics triggers move the definition counts along with them, and the
+        rolled up interaction counts are recounted.
+    '''
+    params = {'team_id': team_id, 'from_team_id': from_team_id}
+    try:
+        definitions = db.session.execute(sql.text(MOVE_DEFINITIONS), params).rowcount
+        interactions = db.session.execute(sql.text(MOVE_INTERACTIONS), params).rowcount
+        db.session.execute(sql.text(MOVE_DAILY_INTERACTIONS), params)
+        # the moved aliases can lead to terms that were already defined in the workspace
+        refresh_aliases(team_id=team_id)
+        definition_cache.invalidate_all()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    rebuild_statistics(team_id)
+    rebuild_statistics(from_team_id)
+    return definitions, interactions
+
+def partition_definitions(partitions):
+    ''' Rebuild the definitions table as one that's hash partitioned by team_id into the
+        passed number of partitions, so that each workspace's queries only touch the
+        partition that holds it. Writes to the table are blocked while its rows are
+        copied. Needs Postgres 12 or later, for the aliases' foreign key.
+    '''
+    connection = db.session.connection()
+    if connection.execute(sql.text(IS_PARTITIONED)).scalar():
+        raise ValueError("The definitions table is already partitioned")
+    if partitions < 1:
+        raise ValueError("There has to be at least one partition")
+
+    try:
+        has_search_trigger = connection.execute(sql.text(HAS_SEARCH_TRIGGER)).scalar()
+        remainders = range(partitions)
+        connection.execute(sql.text(PARTITION_DEFINITIONS.format(partitions="\n".join([CREATE_PARTITION.format(modulus=partitions, remainder=remainder) for remainder in remainders]))))
+        # indexes created on the partitioned table are created on every partition
+        for index in Definition.__table__.indexes:
+            index.create(connection)
+        connection.execute(sql.text(CREATE_COUNT_TRIGGERS))
+        if has_search_trigger:
+            connection.execute(sql.text("\n".join([CREATE_SEARCH_TRIGGER.format(remainder=remainder) for remainder in remainders])))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,143 @@
+# These functions accept the URLs that @dperini's pattern (https://gist.github.com/dperini/729294)
+# does, which verify_url used to match with a regular expression. Instead of backtracking
+# they scan the text once from left to right, so they take linear time on any input.
+
+SCHEMES = ("http://", "https://")
+
+IMAGE_EXTENSIONS = (".gif", ".jpg", ".jpeg", ".png", ".bmp")
+
+TOP_LEVEL_DOMAINS = frozenset((
+    "com", "net", "org", "edu", "gov", "mil", "aero", "asia", "biz", "cat", "coop", "info", "int", "jobs",
+    "mobi", "museum", "name", "post", "pro", "tel", "travel", "xxx", "ac", "ad", "ae", "af", "ag", "ai", "al",
+    "am", "an", "ao", "aq", "ar", "as", "at", "au", "aw", "ax", "az", "ba", "bb", "bd", "be", "bf", "bg", "bh",
+    "bi", "bj", "bm", "bn", "bo", "br", "bs", "bt", "bv", "bw", "by", "bz", "ca", "cc", "cd", "cf", "cg", "ch",
+    "ci", "ck", "cl", "cm", "cn", "co", "cr", "cs", "cu", "cv", "cx", "cy", "cz", "dd", "de", "dj", "dk", "dm",
+    "do", "dz", "ec", "ee", "eg", "eh", "er", "es", "et", "eu", "fi", "fj", "fk", "fm", "fo", "fr", "ga", "gb",
+    "gd", "ge", "gf", "gg", "gh", "gi", "gl", "gm", "gn", "gp", "gq", "gr", "gs", "gt", "gu", "gw", "gy", "hk",
+    "hm", "hn", "hr", "ht", "hu", "id", "ie", "il", "im", "in", "io", "iq", "ir", "is", "it", "je", "jm", "jo",
+    "jp", "ke", "kg", "kh", "ki", "km", "kn", "kp", "kr", "kw", "ky", "kz", "la", "lb", "lc", "li", "lk", "lr",
+    "ls", "lt", "lu", "lv", "ly", "ma", "mc", "md", "me", "mg", "mh", "mk", "ml", "mm", "mn", "mo", "mp", "mq",
+    "mr", "ms", "mt", "mu", "mv", "mw", "mx", "my", "mz", "na", "nc", "ne", "nf", "ng", "ni", "nl", "no", "np",
+    "nr", "nu", "nz", "om", "pa", "pe", "pf", "pg", "ph", "pk", "pl", "pm", "pn", "pr", "ps", "pt", "pw", "py",
+    "qa", "re", "ro", "rs", "ru", "rw", "sa", "sb", "sc", "sd", "se", "sg", "sh", "si", "sj", "sk", "sl", "sm",
+    "sn", "so", "sr", "ss", "st", "su", "sv", "sx", "sy", "sz", "tc", "td", "tf", "tg", "th", "tj", "tk", "tl",
+    "tm", "tn", "to", "tp", "tr", "tt", "tv", "tw", "tz", "ua", "ug", "uk", "us", "uy", "uz", "va", "vc", "ve",
+    "vg", "vi", "vn", "vu", "wf", "ws", "ye", "yt", "yu", "za", "zm", "zw"
+))
+
+def is_host_character(character):
+    ''' Hostnames may contain ASCII letters and digits, and any character from the
+        rest of the Basic Multilingual Plane
+    '''
+    return ("a" <= character <= "z") or ("0" <= character <= "9") or ("\u00a1" <= character <= "\uffff")
+
+def is_hostname(host):
+    ''' A hostname is dot-separated labels ending in a known top-level domain. Labels
+        may contain hyphens, but can't start or end with them.
+    '''
+    labels = host.split(".")
+    if len(labels) < 2 or labels[-1] not in TOP_LEVEL_DOMAINS:
+        return False
+
+    for label in labels:
+        if not label or label[0] == "-" or label[-1] == "-":
+            return False
+        for character in label:
+            if character != "-" and not is_host_character(character):
+                return False
+
+    return True
+
+def is_octet(text, lowest, highest):
+    ''' Is the text a number between lowest and highest, without leading zeros?
+    '''
+    if not 1 <= len(text) <= 3 or (len(text) > 1 and text[0] == "0"):
+        return False
+
+    for character in text:
+        if not "0" <= character <= "9":
+            return False
+
+    return lowest <= int(text) <= highest
+
+def is_public_ip_address(host):
+    ''' A public IPv4 address in dotted-quad notation, excluding the private, loopback
+        and link-local ranges.
+    '''
+    octets = host.split(".")
+    if len(octets) != 4:
+        return False
+
+    if not (is_octet(octets[0], 1, 223) and is_octet(octets[1], 0, 255) and is_octet(octets[2], 0, 255) and is_octet(octets[3], 1, 254)):
+        return False
+
+    first, second = int(octets[0]), int(octets[1])
+    if first in (10, 127) or (first, second) in ((169, 254), (192, 168)) or (first == 172 and 16 <= second <= 31):
+        return False
+
+    return True
+
+def verify_url(text):
+    ''' verify that the passed text is a URL: an optional http(s) scheme, a public IP
+        address or a hostname, an optional port, and an optional path without whitespace
+    '''
+    lowered = text.lower()
+    start = 0
+    for scheme in SCHEMES:
+        if lowered.startswith(scheme):
+            start = len(scheme)
+            break
+
+    # the host runs until the port, the path, or the end of the text
+    end = start
+    while end < len(lowered) and lowered[end] not in ":/":
+        end += 1
+
+    host = lowered[start:end]
+    if not (is_public_ip_address(host) or is_hostname(host)):
+        return False
+
+    if end < len(lowered) and lowered[end] == ":":
+        port_start = end + 1
+        end = port_start
+        while end < len(lowered) and "0" <= lowered[end] <= "9":
+            end += 1
+        if not 2 <= end - port_start <= 5:
+            return False
+
+    if end == len(lowered):
+        return True
+
+    if lowered[end] != "/":
+        return False
+
+    for character in lowered[end:]:
+        if character.isspace():
+            return False
+
+    return True
+
+def verify_image_url(text):
+    ''' Verify that the passed text is an image URL.
+
+        We're verifying image URLs for inclusion in Slack's Incoming Webhook integration, which
+        requires a scheme at the beginning (http(s)) and a file extention at the end to render
+        correctly. So, a URL which passes verify_url() (like example.com/kitten.gif) might not
+        pass this test. If you need to test that the URL is both valid AND an image suitable for
+        the Incoming Webhook integration, run it through both verify_url() and verify_image_url().
+    '''
+    lowered = text.lower()
+    return lowered.startswith(SCHEMES) and lowered.endswith(IMAGE_EXTENSIONS)
+
+def get_image_url(text):
+    ''' Extract an image url from the passed text. If there are multiple image urls,
+        only the first one will be returned.
+    '''
+    if not text or 'http' not in text.lower():
+        return None
+
+    for chunk in text.split():
+        if verify_image_url(chunk) and verify_url(chunk):
+            return chunk
+
+    return None
@@ -1,12 +1,21 @@
-from flask import abort, current_app, request
+from flask import Response, abort, current_app, has_request_context, request, stream_with_context
 from . import gloss as app
-from . import db
-from .models import Definition, Interaction
-from sqlalchemy import func, distinct, sql
-from requests import post
-from datetime import datetime
+from . import db, definition_cache, definition_sampler, interactions, metrics, replicas, router, search_index, warmup, webhooks
+from .aliases import find_alias_cycles, refresh_aliases
+from .cache import CachedDefinition
+from .database import PreparedStatement
+from .models import Definition, get_alias_key, get_alias_term, normalize_term
+from .stats import get_statistics
+from .urls import get_image_url
+from sqlalchemy import sql
+from sqlalchemy.dialects.postgresql import insert
+from collections import OrderedDict
+from functools import partial
+from datetime import datetime, timedelta
+import base64
+import binascii
+import itertools
 import json
-import random
 import re
 
 STATS_CMDS = ("stats",)
@@ -16,7 +25,56 @@ SET_CMDS = ("=",)
 DELETE_CMDS = ("delete",)
 SEARCH_CMDS = ("search",)
 
-ALIAS_KEYWORDS = ("see also", "see")
+# terms that can't be defined, because they're commands
+RESERVED_TERMS = frozenset(STATS_CMDS + RECENT_CMDS + HELP_CMDS)
+
+# characters that have special meaning in patterns, which are stripped from search terms
+SEARCH_METACHARACTERS = re.compile(r'\||_|%|\*|\+|\?|\{|\}|\(|\)|\[|\]')
+
+# learnings params that start with this are tokens for the next page of results
+PAGE_TOKEN_PREFIX = "next:"
+# creation dates are stored in page tokens as microseconds since this
+PAGE_TOKEN_EPOCH = datetime(1970, 1, 1)
+
+# how many terms to fetch at a time when listing all of them
+LEARNINGS_FETCH_SIZE = 500
+
+# Slack only accepts this many posts to a command's response_url, in 30 minutes
+RESPONSE_URL_POST_LIMIT = 5
+
+# search terms shorter than this are matched as prefixes instead of by trigrams
+TRIGRAM_MIN_LENGTH = 3
+
+# find a workspace's terms that match a search as a substring (ranked by trigram
+# similarity) or through the full-text index (ranked by ts_rank) in one round trip.
+# Substring matches that aren't also full-text matches come first, as they always have.
+SEARCH_STATEMENT = '''
+    WITH like_matches AS (
+        SELECT id, term, similarity(term, :term) AS rank FROM definitions WHERE team_id = :team_id AND {like_filter}
+    ), tsv_matches AS (
+        SELECT id, term, ts_rank(tsv_search, plainto_tsquery(:term)) AS rank FROM definitions WHERE team_id = :team_id AND tsv_search @@ plainto_tsquery(:term)
+    )
+    SELECT term FROM (
+        SELECT term, 0 AS source, rank FROM like_matches WHERE NOT EXISTS (SELECT 1 FROM tsv_matches WHERE tsv_matches.id = like_matches.id)
+        UNION ALL
+        SELECT term, 1 AS source, rank FROM tsv_matches
+    ) AS matches
+    ORDER BY source, rank DESC, term
+    LIMIT :limit;
+'''
+# the trigram index on term can answer ILIKE with a leading wildcard
+SEARCH_SUBSTRING_STATEMENT = PreparedStatement("gloss_search_substring", SEARCH_STATEMENT.format(like_filter="term ILIKE :pattern"), ("text", "varchar", "text", "bigint"))
+# a prepared statement's generic plan can't use the pattern index for a prefix it
+# doesn't know yet, so prefix searches are planned every time
+SEARCH_PREFIX_STATEMENT = sql.text(SEARCH_STATEMENT.format(like_filter="term_key LIKE :pattern"))
+
+# look up the parts of a definition that answer a lookup, which for an alias are the
+# parts of the definition at the end of its chain
+LOOKUP_STATEMENT = PreparedStatement("gloss_lookup", '''
+    SELECT target.id, target.term, target.definition, target.image_url
+    FROM definitions AS entry JOIN definitions AS target ON target.team_id = entry.team_id AND target.id = COALESCE(entry.alias_of, entry.id)
+    WHERE entry.team_id = :team_id AND entry.term_key = :term_key LIMIT 1
+''', ("varchar", "text"))
 
 BOT_NAME = "Gloss Bot"
 BOT_EMOJI = ":lipstick:"
@@ -42,8 +100,21 @@ def get_payload_values(channel_id="", text=None):
     payload_values['text'] = text
     payload_values['username'] = BOT_NAME
     payload_values['icon_emoji'] = BOT_EMOJI
+    # a message sent to a command's response_url is only shown to the person who sent
+    # the command unless it asks to be shown in the channel; webhooks ignore this
+    payload_values['response_type'] = "in_channel"
     return payload_values
 
+def get_webhook_url():
+    ''' Get the URL to send public responses to. A deployment that serves several
+        workspaces answers each command through the response_url that Slack sent with
+        it, since an incoming webhook can only post to one workspace.
+    '''
+    if current_app.config['MULTI_WORKSPACE'] and has_request_context() and request.form.get('response_url'):
+        return request.form['response_url']
+
+    return current_app.config['SLACK_WEBHOOK_URL']
+
 def send_webhook_with_attachment(channel_id="", text=None, fallback="", pretext="", title="", color="#f33373", image_url=None, mrkdwn_in=[]):
     ''' Send a webhook with an attachment, for a more richly-formatted message.
         see https://api.slack.com/docs/attachments
@@ -52,6 +123,15 @@ def send_webhook_with_attachment(channel_id="", text=None, fallback="", pretext=
     if not text:
         return
 
+    payload = make_attachment_payload(channel_id=channel_id, text=text, fallback=fallback, pretext=pretext, title=title, color=color, image_url=image_url, mrkdwn_in=mrkdwn_in)
+
+    # queue the payload for delivery, so that we can respond to Slack right away
+    return webhooks.deliver(get_webhook_url(), payload)
+
+def make_attachment_payload(channel_id="", text=None, fallback="", pretext="", title="", color="#f33373", image_url=None, mrkdwn_in=[]):
+    ''' Make the JSON payload for a webhook with an attachment
+    '''
+
     # get the standard payload dict
     # :NOTE: sending text defined as 'pretext' to the standard payload and leaving
     #        'pretext' in the attachment empty so that I can use markdown styling.
@@ -68,23 +148,7 @@ def send_webhook_with_attachment(channel_id="", text=None, fallback="", pretext=
         attachment_values['mrkdwn_in'] = mrkdwn_in
     # add the attachment dict to the payload and jsonify it
     payload_values['attachments'] = [attachment_values]
-    payload = json.dumps(payload_values)
-
-    # return the response
-    return post(current_app.config['SLACK_WEBHOOK_URL'], data=payload)
-
-def get_image_url(text):
-    ''' Extract an image url from the passed text. If there are multiple image urls,
-        only the first one will be returned.
-    '''
-    if 'http' not in text:
-        return None
-
-    for chunk in text.split(' '):
-        if verify_image_url(text) and verify_url(text):
-            return chunk
-
-    return None
+    return json.dumps(payload_values)
 
 def make_bold(text):
     ''' make the passed text bold, accounting for newlines
@@ -99,31 +163,13 @@ def make_bold(text):
 
     return "\n".join(bold_split)
 
-def verify_url(text):
-    ''' verify that the passed text is a URL
-
-        Adapted from @adamrofer's Python port of @dperini's pattern here: https://gist.github.com/dperini/729294
-    '''
-    url_pattern = re.compile("^(?:(?:https?)://|)(?:(?!(?:10|127)(?:\.\d{1,3}){3})(?!(?:169\.254|192\.168)(?:\.\d{1,3}){2})(?!172\.(?:1[6-9]|2\d|3[0-1])(?:\.\d{1,3}){2})(?:[1-9]\d?|1\d\d|2[01]\d|22[0-3])(?:\.(?:1?\d{1,2}|2[0-4]\d|25[0-5])){2}(?:\.(?:[1-9]\d?|1\d\d|2[0-4]\d|25[0-4]))|(?:(?:[a-z\u00a1-\uffff0-9]-*)*[a-z\u00a1-\uffff0-9]+)(?:\.(?:[a-z\u00a1-\uffff0-9]-*)*[a-z\u00a1-\uffff0-9]+)*(?:\.(?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)))(?::\d{2,5})?(?:/\S*)?$", re.UNICODE)
-    return url_pattern.match(text)
-
-def verify_image_url(text):
-    ''' Verify that the passed text is an image URL.
-
-        We're verifying image URLs for inclusion in Slack's Incoming Webhook integration, which
-        requires a scheme at the beginning (http(s)) and a file extention at the end to render
-        correctly. So, a URL which passes verify_url() (like example.com/kitten.gif) might not
-        pass this test. If you need to test that the URL is both valid AND an image suitable for
-        the Incoming Webhook integration, run it through both verify_url() and verify_image_url().
-    '''
-    return (re.match('http', text) and re.search(r'[gif|jpg|jpeg|png|bmp]$', text))
-
-def get_stats():
-    ''' Gather and return some statistics
+def get_stats(team_id=""):
+    ''' Gather and return some statistics about the passed workspace
     '''
-    entries = db.session.query(func.count(Definition.term)).scalar()
-    definers = db.session.query(func.count(distinct(Definition.user_name))).scalar()
-    queries = db.session.query(func.count(Interaction.action)).scalar()
+    statistics = get_statistics(team_id)
+    entries = statistics.definitions
+    definers = statistics.definers
+    queries = statistics.interactions
     outputs = (
         ("I have definitions for", entries, "term", "terms", "I don't have any definitions"),
         ("", definers, "person has defined terms", "people have defined terms", "Nobody has defined terms"),
@@ -138,42 +184,164 @@ def get_stats():
     # return the message
     return "\n".join(lines)
 
-def get_learnings(how_many=12, sort_order="recent", offset=0):
-    ''' Gather and return some recent definitions
+def get_learnings(how_many=12, sort_order="recent", offset=0, after=None, team_id=""):
+    ''' Gather and return some of a workspace's recent definitions, along with a token
+        for the next page of them if there might be one. Pages after the first are found
+        by passing the position of the last definition on the previous page as after,
+        which the indexes on (team_id, creation_date, id) and (team_id, term_key) can
+        seek to directly.
     '''
-    order_descending = Definition.creation_date.desc()
-    order_random = func.random()
-    order_alphabetical = Definition.term
+    order_descending = (Definition.creation_date.desc(), Definition.id.desc())
+    order_alphabetical = (Definition.term_key,)
     order_function = order_descending
     prefix_singluar = "I recently learned the definition for"
     prefix_plural = "I recently learned definitions for"
     no_definitions_text = "I haven't learned any definitions yet."
-    if sort_order == "random":
-        order_function = order_random
-    elif sort_order == "alpha":
+    if sort_order == "alpha":
         order_function = order_alphabetical
 
-    if sort_order == "random" or sort_order == "alpha" or offset > 0:
+    if sort_order == "random" or sort_order == "alpha" or offset > 0 or after:
         prefix_singluar = "I know the definition for"
         prefix_plural = "I know definitions for"
 
+    in_team = db.session.query(Definition).filter(Definition.team_id == team_id)
     # if how_many is 0, ignore offset and return all results
     if how_many == 0:
-        definitions = db.session.query(Definition).order_by(order_function).all()
+        messages = list(get_all_learnings(sort_order, team_id=team_id))
+        return ", ".join([plain_text for plain_text, rich_text in messages]), ", ".join([rich_text for plain_text, rich_text in messages]), None
     # if order is random and there is an offset, randomize the results after the query
     elif sort_order == "random" and offset > 0:
-        definitions = db.session.query(Definition).order_by(order_descending).limit(how_many).offset(offset).all()
-        random.shuffle(definitions)
+        definitions = in_team.order_by(*order_descending).limit(how_many).offset(offset).all()
+        definition_sampler.shuffle(definitions)
+    # otherwise draw a random sample without sorting the whole table
+    elif sort_order == "random":
+        definitions = definition_sampler.sample(how_many, team_id=team_id)
+    # start after the last definition on the previous page
+    elif after and sort_order == "alpha":
+        definitions = in_team.filter(Definition.term_key > after[0]).order_by(*order_function).limit(how_many).all()
+    elif after:
+        after_key = sql.tuple_(Definition.creation_date, Definition.id) < sql.tuple_(PAGE_TOKEN_EPOCH + timedelta(microseconds=after[0]), after[1])
+        definitions = in_team.filter(after_key).order_by(*order_function).limit(how_many).all()
     else:
-        definitions = db.session.query(Definition).order_by(order_function).limit(how_many).offset(offset).all()
+        definitions = in_team.order_by(*order_function).limit(how_many).offset(offset).all()
 
     if not definitions:
-        return no_definitions_text, no_definitions_text
+        return no_definitions_text, no_definitions_text, None
+
+    # a full page might be followed by another one
+    next_token = None
+    if sort_order != "random" and how_many > 0 and len(definitions) == how_many:
+        next_token = make_page_token(sort_order, definitions[-1])
 
     wording = prefix_plural if len(definitions) > 1 else prefix_singluar
     plain_text = "{}: {}".format(wording, ', '.join([item.term for item in definitions]))
     rich_text = "{}: {}".format(wording, ', '.join([make_bold(item.term) for item in definitions]))
-    return plain_text, rich_text
+    return plain_text, rich_text, next_token
+
+def iterate_learned_terms(sort_order="recent", team_id=""):
+    ''' Generate every term defined in the passed workspace in the passed order, fetching
+        only the terms from a server-side cursor, a batch at a time
+    '''
+    if sort_order == "alpha":
+        order_function = (Definition.term_key,)
+    elif sort_order == "random":
+        order_function = (definition_sampler.random_order(Definition.id),)
+    else:
+        order_function = (Definition.creation_date.desc(), Definition.id.desc())
+
+    for term, in db.session.query(Definition.term).filter(Definition.team_id == team_id).order_by(*order_function).yield_per(LEARNINGS_FETCH_SIZE):
+        yield term
+
+def chunk_terms(terms, length):
+    ''' Group the passed terms into lists whose bolded, comma-separated text is no longer
+        than length, unless a single term is longer than that on its own
+    '''
+    chunk = []
+    chunk_length = 0
+    for term in terms:
+        term_length = len(make_bold(term))
+        if chunk and chunk_length + len(", ") + term_length > length:
+            yield chunk
+            chunk = []
+            chunk_length = 0
+
+        chunk_length += term_length + (len(", ") if chunk else 0)
+        chunk.append(term)
+
+    if chunk:
+        yield chunk
+
+def get_all_learnings(sort_order="recent", length=None, team_id=""):
+    ''' Generate plain and rich text listing every term defined in the passed workspace,
+        split into messages that are no longer than length
+    '''
+    if length is None:
+        length = current_app.config['LEARNINGS_MESSAGE_LENGTH']
+    no_definitions_text = "I haven't learned any definitions yet."
+    prefix_singluar = "I recently learned the definition for"
+    prefix_plural = "I recently learned definitions for"
+    if sort_order == "random" or sort_order == "alpha":
+        prefix_singluar = "I know the definition for"
+        prefix_plural = "I know definitions for"
+
+    # leave room for the prefix in every message
+    chunks = chunk_terms(iterate_learned_terms(sort_order, team_id), length - len(prefix_plural) - len(": "))
+    first = next(chunks, None)
+    if first is None:
+        yield no_definitions_text, no_definitions_text
+        return
+
+    # look ahead to decide whether the wording should be plural
+    second = next(chunks, None)
+    wording = prefix_plural if len(first) > 1 or second else prefix_singluar
+    yield "{}: {}".format(wording, ', '.join(first)), "{}: {}".format(wording, ', '.join([make_bold(term) for term in first]))
+    if second is None:
+        return
+
+    for chunk in itertools.chain([second], chunks):
+        yield ', '.join(chunk), ', '.join([make_bold(term) for term in chunk])
+
+def make_learnings_payloads(messages, channel_id, fallback, pretext):
+    ''' Generate a webhook payload for each of the passed learnings messages, with
+        the pretext on the first one
+    '''
+    for index, (plain_text, rich_text) in enumerate(messages):
+        yield make_attachment_payload(channel_id=channel_id, text=rich_text, fallback="{}: {}".format(fallback, plain_text), pretext="" if index else pretext, title="", mrkdwn_in=["text"])
+
+def join_learnings(messages):
+    ''' Generate the plain text of the passed learnings messages as one list
+    '''
+    for index, (plain_text, rich_text) in enumerate(messages):
+        yield ", {}".format(plain_text) if index else plain_text
+
+def make_page_token(sort_order, definition):
+    ''' Make an opaque token that marks the passed definition's place in the passed order
+    '''
+    if sort_order == "alpha":
+        key = [definition.term_key]
+    else:
+        since_epoch = definition.creation_date - PAGE_TOKEN_EPOCH
+        key = [(since_epoch.days * 86400 + since_epoch.seconds) * 1000000 + since_epoch.microseconds, definition.id]
+    encoded = base64.urlsafe_b64encode(json.dumps([sort_order] + key).encode('utf-8')).decode('ascii').rstrip("=")
+    return "{}{}".format(PAGE_TOKEN_PREFIX, encoded)
+
+def read_page_token(token):
+    ''' Get the sort order and place from a page token, or None if it isn't valid
+    '''
+    encoded = token[len(PAGE_TOKEN_PREFIX):]
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+    if not isinstance(decoded, list) or not decoded:
+        return None
+    sort_order, key = decoded[0], decoded[1:]
+    if sort_order == "alpha" and len(key) == 1 and isinstance(key[0], str):
+        return sort_order, key
+    if sort_order == "recent" and len(key) == 2 and all([isinstance(part, int) for part in key]):
+        return sort_order, key
+    return None
 
 def parse_learnings_params(command_params):
     ''' Parse the passed learnings command params
@@ -191,6 +359,11 @@ def parse_learnings_params(command_params):
         if param == "all":
             recent_args['how_many'] = 0
             continue
+        if param.startswith(PAGE_TOKEN_PREFIX):
+            page = read_page_token(param)
+            if page:
+                recent_args['sort_order'], recent_args['after'] = page
+            continue
         try:
             passed_int = int(param)
             if 'how_many' not in recent_args:
@@ -202,74 +375,65 @@ def parse_learnings_params(command_params):
 
     return recent_args
 
-def log_query(term, user_name, action):
-    ''' Log a query into the interactions table
+def log_query(term, user_name, action, team_id=""):
+    ''' Log a query into the interactions table, once the command has been answered
+        from whichever database it's answered from
     '''
-    try:
-        db.session.add(Interaction(term=term, user_name=user_name, action=action))
-        db.session.commit()
-    except:
-        pass
+    replicas.after_read(interactions.log, term=term, user_name=user_name, action=action, team_id=team_id)
 
-def query_definition(term):
-    ''' Query the definition for a term from the database
+def query_definition(term, team_id=""):
+    ''' Query a workspace's definition for a term from the database
     '''
-    return Definition.query.filter(func.lower(Definition.term) == func.lower(term)).first()
+    return Definition.query.filter(Definition.team_id == team_id, Definition.term_key == normalize_term(term)).first()
 
-def get_matches_for_term(term):
-    ''' Search the glossary for entries that are matches for the passed term.
+def load_definition(term, team_id=""):
+    ''' Load the parts of a term's definition that are needed to answer a lookup
     '''
+    entry = LOOKUP_STATEMENT.execute(db.session, {'team_id': team_id, 'term_key': normalize_term(term)}).first()
+    if not entry:
+        return None
+
+    return CachedDefinition(id=entry.id, term=entry.term, definition=entry.definition, image_url=entry.image_url)
+
+def lookup_definition(term, team_id=""):
+    ''' Look up a workspace's definition for a term, from the cache if possible
+    '''
+    return definition_cache.get(term, partial(load_definition, team_id=team_id), team_id)
+
+def get_matches_for_term(term, limit=None, team_id=""):
+    ''' Search a workspace's glossary for entries that are matches for the passed term,
+        returning at most limit terms (or SEARCH_RESULTS_LIMIT if limit isn't passed).
+    '''
+    if limit is None:
+        limit = current_app.config['SEARCH_RESULTS_LIMIT']
+
     # strip pattern-matching metacharacters from the term
-    stripped_term = re.sub(r'\||_|%|\*|\+|\?|\{|\}|\(|\)|\[|\]', '', term)
-    # get ILIKE matches for the term
-    # in SQL: SELECT term FROM definitions WHERE term ILIKE '%{}%'.format(stripped_term);
-    like_matches = Definition.query.filter(Definition.term.ilike("%{}%".format(stripped_term)))
-    like_terms = [entry.term for entry in like_matches]
-
-    # get TSV matches for the term
-    tsv_matches = db.session.query('term').from_statement(sql.text(
-        '''SELECT * FROM definitions WHERE tsv_search @@ plainto_tsquery(:term) ORDER BY ts_rank(tsv_search, plainto_tsquery(:term)) DESC;'''
-    )).params(term=stripped_term)
-    tsv_terms = [entry[0] for entry in tsv_matches]
-
-    # put ilike matches that aren't in the TSV list at the front
-    match_terms = list(tsv_terms)
-    for check_term in like_terms:
-        if check_term not in tsv_terms:
-            match_terms.insert(0, check_term)
-
-    return match_terms
-
-def get_command_action_and_params(command_text):
-    ''' Parse the passed string for a command action and parameters
-    '''
-    command_components = command_text.split(' ')
-    command_action = command_components[0].lower()
-    command_params = " ".join(command_components[1:])
-    return command_action, command_params
-
-def check_definition_for_alias(definition):
-    ''' If the passed definition starts with a keyword in ALIAS_KEYWORDS, strip
-        that prefix from the definition and return it.
-    '''
-    for keyword in ALIAS_KEYWORDS:
-        if definition.lower().startswith(keyword):
-            return re.split(keyword, definition, flags=re.IGNORECASE)[1].strip()
+    stripped_term = SEARCH_METACHARACTERS.sub('', term)
+    # terms this short don't have enough trigrams to match on, so match them as prefixes
+    prefix_only = len(stripped_term) < TRIGRAM_MIN_LENGTH
 
-    return None
+    if current_app.config['SEARCH_BACKEND'] == "memory":
+        return search_index.search(stripped_term, prefix_only=prefix_only, limit=limit, team_id=team_id)
+
+    # a limit of 0 means no limit, which is LIMIT NULL in SQL
+    if prefix_only:
+        matches = db.session.execute(SEARCH_PREFIX_STATEMENT, {'term': stripped_term, 'team_id': team_id, 'pattern': "{}%".format(normalize_term(stripped_term)), 'limit': limit or None})
+    else:
+        matches = SEARCH_SUBSTRING_STATEMENT.execute(db.session, {'term': stripped_term, 'team_id': team_id, 'pattern': "%{}%".format(stripped_term), 'limit': limit or None})
+    return [row[0] for row in matches]
 
-def query_definition_and_get_response(slash_command, command_text, user_name, channel_id, private_response):
+def query_definition_and_get_response(slash_command, command_text, user_name, channel_id, private_response, team_id=""):
     ''' Get the definition for the passed term and return the appropriate responses
     '''
     # query the definition
-    entry = query_definition(command_text)
+    entry = lookup_definition(command_text, team_id)
     if not entry:
         # remember this query
-        log_query(term=command_text, user_name=user_name, action="not_found")
+        log_query(term=command_text, user_name=user_name, action="not_found", team_id=team_id)
 
         message = "Sorry, but *{bot_name}* has no definition for *{term}*. You can set a definition with the command *{command} {term} = _definition_*".format(bot_name=BOT_NAME, command=slash_command, term=command_text)
 
-        search_results = get_matches_for_term(command_text)
+        search_results = get_matches_for_term(command_text, team_id=team_id)
         if len(search_results):
             search_results_styled = ', '.join([make_bold(term) for term in search_results])
             message = "{}, or try asking for one of these terms that may be related: {}".format(message, search_results_styled)
@@ -277,33 +441,23 @@ def query_definition_and_get_response(slash_command, command_text, user_name, ch
         return message, 200
 
     # remember this query
-    log_query(term=command_text, user_name=user_name, action="found")
-
-    # if the definition starts with an alias keyphrase, check to see if the rest
-    # of the definition matches another entry, and return that definition instead
-    alias_term = check_definition_for_alias(entry.definition)
-    if alias_term:
-        alias_entry = query_definition(alias_term)
-
-        if alias_entry:
-            entry = alias_entry
+    log_query(term=command_text, user_name=user_name, action="found", team_id=team_id)
 
     fallback = "{name} {command} {term}: {definition}".format(name=user_name, command=slash_command, term=entry.term, definition=entry.definition)
     if not private_response:
-        image_url = get_image_url(entry.definition)
         pretext = "*{name}* {command} {text}".format(name=user_name, command=slash_command, text=command_text)
         title = entry.term
         text = entry.definition
-        send_webhook_with_attachment(channel_id=channel_id, text=text, fallback=fallback, pretext=pretext, title=title, image_url=image_url)
+        send_webhook_with_attachment(channel_id=channel_id, text=text, fallback=fallback, pretext=pretext, title=title, image_url=entry.image_url)
         return "", 200
     else:
         return fallback, 200
 
-def search_term_and_get_response(command_text):
+def search_term_and_get_response(command_text, team_id=""):
     ''' Search the database for the passed term and return the results
     '''
     # query the definition
-    search_results = get_matches_for_term(command_text)
+    search_results = get_matches_for_term(command_text, team_id=team_id)
     if len(search_results):
         search_results_styled = ', '.join([make_bold(term) for term in search_results])
         message = "{bot_name} found {term} in: {results}".format(bot_name=BOT_NAME, term=make_bold(command_text), results=search_results_styled)
@@ -312,7 +466,7 @@ def search_term_and_get_response(command_text):
 
     return message, 200
 
-def set_definition_and_get_response(slash_command, command_params, user_name):
+def set_definition_and_get_response(slash_command, command_params, user_name, team_id=""):
     ''' Set the definition for the passed parameters and return the approriate responses
     '''
     set_components = command_params.split('=', 1)
@@ -324,11 +478,15 @@ def set_definition_and_get_response(slash_command, command_params, user_name):
         return "Sorry, but *{bot_name}* didn't understand your command. You can set definitions like this: *{command} EW = Eligibility Worker*".format(bot_name=BOT_NAME, command=slash_command), 200
 
     # reject attempts to set reserved terms
-    if set_term.lower() in STATS_CMDS + RECENT_CMDS + HELP_CMDS:
+    if set_term.lower() in RESERVED_TERMS:
         return "Sorry, but *{bot_name}* can't set a definition for {term} because it's a reserved term.".format(bot_name=BOT_NAME, term=make_bold(set_term))
 
+    # reject aliases that would lead back to the term they're set for
+    if find_alias_cycles({normalize_term(set_term): get_alias_key(set_value)}, team_id):
+        return "Sorry, but *{bot_name}* can't make {term} an alias of {alias_term} because {alias_term} leads back to {term}.".format(bot_name=BOT_NAME, term=make_bold(set_term), alias_term=make_bold(get_alias_term(set_value)))
+
     # check the database to see if the term's already defined
-    entry = query_definition(set_term)
+    entry = query_definition(set_term, team_id)
     if entry:
         if set_term != entry.term or set_value != entry.definition:
             # update the definition in the database
@@ -340,6 +498,8 @@ def set_definition_and_get_response(slash_command, command_params, user_name):
             entry.creation_date = datetime.utcnow()
             try:
                 db.session.add(entry)
+                # the aliases that lead to the term are looked up from it too
+                definition_cache.invalidate_many(refresh_aliases([entry.term_key], team_id), team_id)
                 db.session.commit()
             except Exception as e:
                 return "Sorry, but *{bot_name}* was unable to update that definition: {message}, {args}".format(bot_name=BOT_NAME, message=e.message, args=e.args), 200
@@ -350,141 +510,255 @@ def set_definition_and_get_response(slash_command, command_params, user_name):
             return "*{bot_name}* already knows that the definition for {term} is {definition}".format(bot_name=BOT_NAME, term=make_bold(set_term), definition=make_bold(set_value)), 200
 
     # save the definition in the database
-    entry = Definition(term=set_term, definition=set_value, user_name=user_name)
+    entry = Definition(team_id=team_id, term=set_term, definition=set_value, user_name=user_name)
     try:
         db.session.add(entry)
+        definition_cache.invalidate_many(refresh_aliases([entry.term_key], team_id), team_id)
         db.session.commit()
     except Exception as e:
         return "Sorry, but *{bot_name}* was unable to save that definition: {message}, {args}".format(bot_name=BOT_NAME, message=e.message, args=e.args), 200
 
     return "*{bot_name}* has set the definition for {term} to {definition}".format(bot_name=BOT_NAME, term=make_bold(set_term), definition=make_bold(set_value)), 200
 
-#
-# ROUTES
-#
-
-@app.route('/', methods=['POST'])
-def index():
-    # verify that the request is authorized
-    if request.form['token'] != current_app.config['SLACK_TOKEN']:
-        abort(401)
+def parse_set_pairs(command_params):
+    ''' Split the params of a set command into (term, definition) pairs if there's more
+        than one line and every line is a set, or return None. Otherwise the lines
+        after the first are part of a multi-line definition.
+    '''
+    lines = [line.strip() for line in command_params.split("\n") if line.strip()]
+    if len(lines) < 2:
+        return None
 
-    # get the user name and channel ID
-    user_name = request.form['user_name']
-    channel_id = request.form['channel_id']
+    set_pairs = []
+    for line in lines:
+        set_term, equals, set_value = line.partition("=")
+        if not equals or not set_term.strip() or not set_value.strip():
+            return None
+        set_pairs.append((set_term.strip(), set_value.strip()))
 
-    # get the slash command
-    slash_command = request.form['command']
+    return set_pairs
 
-    # strip excess spaces from the text
-    full_text = request.form['text'].strip()
-    full_text = re.sub(" +", " ", full_text)
-    command_text = full_text
+def set_definitions_and_get_response(slash_command, set_pairs, user_name, team_id=""):
+    ''' Set the definitions for the passed (term, definition) pairs, checking them
+        against the existing definitions in one query and saving them in one statement,
+        and return a summary of what changed
+    '''
+    reserved = []
+    wanted = OrderedDict()
+    for set_term, set_value in set_pairs:
+        if set_term.lower() in RESERVED_TERMS:
+            reserved.append(set_term)
+            continue
+        # the last definition for a term wins
+        wanted.pop(normalize_term(set_term), None)
+        wanted[normalize_term(set_term)] = (set_term, set_value)
+
+    # aliases that would lead round in a circle are left out, which puts the terms'
+    # current definitions back in the chains, so check again until none do
+    circular = []
+    while True:
+        cycles = find_alias_cycles(dict([(term_key, get_alias_key(set_value)) for term_key, (set_term, set_value) in wanted.items()]), team_id)
+        if not cycles:
+            break
+        circular.extend([set_term for term_key, (set_term, set_value) in wanted.items() if term_key in cycles])
+        for term_key in cycles:
+            del wanted[term_key]
+
+    existing = {}
+    if wanted:
+        existing = dict([(entry.term_key, entry) for entry in Definition.query.filter(Definition.team_id == team_id, Definition.term_key.in_(list(wanted.keys())))])
+
+    added = []
+    updated = []
+    unchanged = []
+    rows = []
+    now = datetime.utcnow()
+    for term_key, (set_term, set_value) in wanted.items():
+        entry = existing.get(term_key)
+        if entry and set_term == entry.term and set_value == entry.definition:
+            unchanged.append(set_term)
+            continue
 
-    #
-    # GET definition (for a single word that can't be interpreted as a command)
-    #
+        (updated if entry else added).append(set_term)
+        rows.append({'team_id': team_id, 'term': set_term, 'term_key': term_key, 'definition': set_value, 'image_url': get_image_url(set_value), 'alias_key': get_alias_key(set_value), 'user_name': user_name, 'creation_date': now})
 
-    # if the text is a single word that's not a single-word command, treat it as a get
-    if command_text.count(" ") is 0 and len(command_text) > 0 and \
-       command_text.lower() not in STATS_CMDS + RECENT_CMDS + HELP_CMDS + SET_CMDS:
-        return query_definition_and_get_response(slash_command, command_text, user_name, channel_id, False)
+    if rows:
+        statement = insert(Definition.__table__).values(rows)
+        statement = statement.on_conflict_do_update(index_elements=['team_id', 'term_key'], set_=dict([(column, statement.excluded[column]) for column in ('term', 'definition', 'image_url', 'alias_key', 'user_name', 'creation_date')]))
+        try:
+            db.session.execute(statement)
+            definition_cache.invalidate_many(refresh_aliases([row['term_key'] for row in rows], team_id), team_id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return "Sorry, but *{bot_name}* was unable to save those definitions: {args}".format(bot_name=BOT_NAME, args=e.args), 200
 
-    #
-    # SET definition
-    #
+    lines = []
+    for terms, singular, plural in ((added, "has set the definition for", "has set the definitions for"), (updated, "has updated the definition for", "has updated the definitions for"), (unchanged, "already knows the definition for", "already knows the definitions for")):
+        if terms:
+            lines.append("*{bot_name}* {wording} {terms}".format(bot_name=BOT_NAME, wording=plural if len(terms) > 1 else singular, terms=", ".join([make_bold(term) for term in terms])))
+    if reserved:
+        lines.append("Sorry, but *{bot_name}* can't set definitions for {terms} because they're reserved terms.".format(bot_name=BOT_NAME, terms=", ".join([make_bold(term) for term in reserved])))
+    if circular:
+        lines.append("Sorry, but *{bot_name}* can't set definitions for {terms} because they're aliases that lead back to themselves.".format(bot_name=BOT_NAME, terms=", ".join([make_bold(term) for term in circular])))
 
-    # if the text contains an '=', treat it as a 'set' command
-    if '=' in command_text:
-        return set_definition_and_get_response(slash_command, command_text, user_name)
+    return "\n".join(lines), 200
 
-    # we'll respond privately if the text is prefixed with 'shh ' (or any number of s followed by any number of h)
-    shh_pattern = re.compile(r'^s+h+ ')
-    private_response = shh_pattern.match(command_text)
-    if private_response:
-        # strip the 'shh' from the command text
-        command_text = shh_pattern.sub('', command_text)
+#
+# COMMANDS
+#
 
-    # extract the command action and parameters
-    command_action, command_params = get_command_action_and_params(command_text)
+@router.command("get", read_only=True)
+def get_command(command):
+    ''' Show the definition for a term
+    '''
+    return query_definition_and_get_response(command.slash_command, command.text, command.user_name, command.channel_id, command.private, command.team_id)
 
-    #
-    # DELETE definition
-    #
+@router.command("set", SET_CMDS)
+def set_command(command):
+    ''' Set the definition for a term, or for several terms on separate lines
+    '''
+    set_pairs = parse_set_pairs(command.params)
+    if set_pairs:
+        return set_definitions_and_get_response(command.slash_command, set_pairs, command.user_name, command.team_id)
 
-    if command_action in DELETE_CMDS:
-        delete_term = command_params
+    return set_definition_and_get_response(command.slash_command, command.params, command.user_name, command.team_id)
 
-        # verify that the definition is in the database
-        entry = query_definition(delete_term)
-        if not entry:
-            return "Sorry, but *{bot_name}* has no definition for {term}".format(bot_name=BOT_NAME, term=make_bold(delete_term)), 200
+@router.command("delete", DELETE_CMDS, single_word=False)
+def delete_command(command):
+    ''' Delete the definition for a term
+    '''
+    delete_term = command.params
 
-        # delete the definition from the database
-        try:
-            db.session.delete(entry)
-            db.session.commit()
-        except Exception as e:
-            return "Sorry, but *{bot_name}* was unable to delete that definition: {message}, {args}".format(bot_name=BOT_NAME, message=e.message, args=e.args), 200
+    # verify that the definition is in the database
+    entry = query_definition(delete_term, command.team_id)
+    if not entry:
+        return "Sorry, but *{bot_name}* has no definition for {term}".format(bot_name=BOT_NAME, term=make_bold(delete_term)), 200
 
-        return "*{bot_name}* has deleted the definition for {term}, which was {definition}".format(bot_name=BOT_NAME, term=make_bold(delete_term), definition=make_bold(entry.definition)), 200
+    # delete the definition from the database
+    try:
+        db.session.delete(entry)
+        definition_cache.invalidate(entry.term, command.team_id)
+        # the aliases of the term are left pointing at whatever's left of their chains
+        definition_cache.invalidate_many(refresh_aliases([entry.term_key], command.team_id), command.team_id)
+        db.session.commit()
+    except Exception as e:
+        return "Sorry, but *{bot_name}* was unable to delete that definition: {message}, {args}".format(bot_name=BOT_NAME, message=e.message, args=e.args), 200
 
-    #
-    # SEARCH for a string
-    #
+    return "*{bot_name}* has deleted the definition for {term}, which was {definition}".format(bot_name=BOT_NAME, term=make_bold(delete_term), definition=make_bold(entry.definition)), 200
 
-    if command_action in SEARCH_CMDS:
-        search_term = command_params
+@router.command("search", SEARCH_CMDS, single_word=False, read_only=True)
+def search_command(command):
+    ''' Search terms and definitions for a string
+    '''
+    return search_term_and_get_response(command.params, command.team_id)
 
-        return search_term_and_get_response(search_term)
+@router.command("help", HELP_CMDS, read_only=True)
+def help_command(command):
+    ''' Show how to use the bot
+    '''
+    return "*{command} _term_* to show the definition for a term\n*{command} _term_ = _definition_* to set the definition for a term\n*{command} _alias_ = see _term_* to set an alias for a term\n*{command} delete _term_* to delete the definition for a term\n*{command} stats* to show usage statistics\n*{command} recent* to show recently defined terms\n*{command} search _term_* to search terms and definitions\n*{command} shh _command_* to get a private response\n*{command} help* to see this message\n<https://github.com/codeforamerica/glossary-bot/issues|report bugs and request features>".format(command=command.slash_command), 200
 
-    #
-    # HELP
-    #
+@router.command("stats", STATS_CMDS, read_only=True)
+def stats_command(command):
+    ''' Show usage statistics
+    '''
+    stats_newline = get_stats(command.team_id)
+    stats_comma = stats_newline.replace("\n", ", ")
+    if not command.private:
+        # send the message
+        fallback = "{name} {command} stats: {comma}".format(name=command.user_name, command=command.slash_command, comma=stats_comma)
+        pretext = "*{name}* {command} stats".format(name=command.user_name, command=command.slash_command)
+        title = ""
+        send_webhook_with_attachment(channel_id=command.channel_id, text=stats_newline, fallback=fallback, pretext=pretext, title=title)
+        return "", 200
 
-    if command_action in HELP_CMDS or command_text.strip() == "":
-        return "*{command} _term_* to show the definition for a term\n*{command} _term_ = _definition_* to set the definition for a term\n*{command} _alias_ = see _term_* to set an alias for a term\n*{command} delete _term_* to delete the definition for a term\n*{command} stats* to show usage statistics\n*{command} recent* to show recently defined terms\n*{command} search _term_* to search terms and definitions\n*{command} shh _command_* to get a private response\n*{command} help* to see this message\n<https://github.com/codeforamerica/glossary-bot/issues|report bugs and request features>".format(command=slash_command), 200
+    else:
+        return stats_comma, 200
 
-    #
-    # STATS
-    #
+@router.command("recent", RECENT_CMDS, read_only=True)
+def recent_command(command):
+    ''' Show recently defined terms
+    '''
+    command_action, command_params = command.word, command.params
+    user_name, slash_command, channel_id = command.user_name, command.slash_command, command.channel_id
 
-    if command_action in STATS_CMDS:
-        stats_newline = get_stats()
-        stats_comma = re.sub("\n", ", ", stats_newline)
-        if not private_response:
-            # send the message
-            fallback = "{name} {command} stats: {comma}".format(name=user_name, command=slash_command, comma=stats_comma)
-            pretext = "*{name}* {command} stats".format(name=user_name, command=slash_command)
-            title = ""
-            send_webhook_with_attachment(channel_id=channel_id, text=stats_newline, fallback=fallback, pretext=pretext, title=title)
-            return "", 200
+    # extract parameters
+    recent_args = parse_learnings_params(command_params)
+
+    # list every term a message at a time, without holding them all in memory
+    if recent_args.get('how_many') == 0:
+        messages = get_all_learnings(recent_args.get('sort_order', "recent"), team_id=command.team_id)
+        if not command.private:
+            # a public list is only posted if it fits in a few messages, which are all
+            # read before any are sent, so that a command that's answered again after its
+            # replica fails doesn't post them twice
+            webhook_url = get_webhook_url()
+            limit = current_app.config['LEARNINGS_PUBLIC_MESSAGES']
+            # each message is a post to the command's response_url in a multi-workspace deployment
+            if webhook_url != current_app.config['SLACK_WEBHOOK_URL']:
+                limit = min(limit, RESPONSE_URL_POST_LIMIT)
+            first_messages = list(itertools.islice(messages, limit + 1))
+            if len(first_messages) > limit:
+                note = "Sorry, but *{bot_name}* knows too many definitions to list them all in the channel, so here they are just for you.".format(bot_name=BOT_NAME)
+            else:
+                fallback = "{name} {command} {action} {params}".format(name=user_name, command=slash_command, action=command_action, params=command_params)
+                pretext = "*{name}* {command} {action} {params}".format(name=user_name, command=slash_command, action=command_action, params=command_params)
+                if webhooks.deliver_in_order(webhook_url, list(make_learnings_payloads(first_messages, channel_id, fallback, pretext))):
+                    return "", 200
+                note = "Sorry, but *{bot_name}* is too busy to list definitions in the channel right now, so here they are just for you.".format(bot_name=BOT_NAME)
+
+            # answer privately instead, with the messages that have been read first
+            messages = itertools.chain(first_messages, messages)
+            return Response(stream_with_context(itertools.chain([note, "\n"], replicas.pin_stream(join_learnings(messages))))), 200
 
         else:
-            return stats_comma, 200
-
-    #
-    # LEARNINGS/RECENT
-    #
-
-    if command_action in RECENT_CMDS:
-        # extract parameters
-        recent_args = parse_learnings_params(command_params)
-        learnings_plain_text, learnings_rich_text = get_learnings(**recent_args)
-        if not private_response:
-            # send the message
-            fallback = "{name} {command} {action} {params}: {text}".format(name=user_name, command=slash_command, action=command_action, params=command_params, text=learnings_plain_text)
-            pretext = "*{name}* {command} {action} {params}".format(name=user_name, command=slash_command, action=command_action, params=command_params)
-            title = ""
-            send_webhook_with_attachment(channel_id=channel_id, text=learnings_rich_text, fallback=fallback, pretext=pretext, title=title, mrkdwn_in=["text"])
-            return "", 200
+            # stream the messages back together as one response, which is read after
+            # the command has returned
+            return Response(stream_with_context(replicas.pin_stream(join_learnings(messages)))), 200
+
+    learnings_plain_text, learnings_rich_text, next_token = get_learnings(team_id=command.team_id, **recent_args)
+    if next_token:
+        more_text = "{command} {shh}{action} {how_many} {token}".format(command=slash_command, shh="shh " if command.private else "", action=command_action, how_many=recent_args.get('how_many', 12), token=next_token)
+        learnings_plain_text = "{}\nFor more, use {}".format(learnings_plain_text, more_text)
+        learnings_rich_text = "{}\nFor more, use *{}*".format(learnings_rich_text, more_text)
+    if not command.private:
+        # send the message
+        fallback = "{name} {command} {action} {params}: {text}".format(name=user_name, command=slash_command, action=command_action, params=command_params, text=learnings_plain_text)
+        pretext = "*{name}* {command} {action} {params}".format(name=user_name, command=slash_command, action=command_action, params=command_params)
+        title = ""
+        send_webhook_with_attachment(channel_id=channel_id, text=learnings_rich_text, fallback=fallback, pretext=pretext, title=title, mrkdwn_in=["text"])
+        return "", 200
 
-        else:
-            return learnings_plain_text, 200
+    else:
+        return learnings_plain_text, 200
+
+#
+# ROUTES
+#
+
+@app.route('/', methods=['POST'])
+def index():
+    # verify that the request is authorized
+    if request.form['token'] != current_app.config['SLACK_TOKEN']:
+        abort(401)
 
-    #
-    # GET definition (for any text that wasn't caught before this)
-    #
+    # a deployment that serves several workspaces keeps each one's glossary apart
+    team_id = request.form.get('team_id', "") if current_app.config['MULTI_WORKSPACE'] else ""
+    return router.dispatch(request.form['text'], slash_command=request.form['command'], user_name=request.form['user_name'], channel_id=request.form['channel_id'], team_id=team_id)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_report():
+    ''' Report metrics in Prometheus' text format
+    '''
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    ''' Report whether this worker has warmed up and can answer commands quickly
+    '''
+    if not warmup.is_ready():
+        return "warming up", 503
 
-    # check the definition
-    return query_definition_and_get_response(slash_command, command_text, user_name, channel_id, private_response)
+    return "ready", 200
@@ -0,0 +1,98 @@
+from sqlalchemy import sql
+from sqlalchemy.orm import configure_mappers
+from threading import Lock
+from time import monotonic
+from . import db
+from .models import Definition, normalize_term
+from .urls import get_image_url
+import os
+
+# text that exercises the URL scanner and the command parser
+WARMUP_TEXT = ("shh learnings alpha 10", "EW = Eligibility Worker https://example.com/ew.gif", "see https://example.com/")
+
+class Warmup(object):
+    ''' Does the slow, once-per-process work of getting ready to answer requests before
+        the first request arrives. warm_up() runs in the gunicorn master when the app is
+        preloaded, so that every forked worker inherits mapped models, a connected and
+        initialized database dialect, exercised code and, with the in-memory search
+        backend, a loaded search index; warm_up_worker() runs in each worker after it
+        forks, filling its own connection pool. The worker is ready once that's done.
+    '''
+
+    def __init__(self, app=None, router=None, search_index=None):
+        self.lock = Lock()
+        self.router = router
+        self.search_index = search_index
+        self.app = None
+        self.warmed_up = False
+        self.ready_pid = None
+        self.timings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read the warmup settings from the app's config.
+        '''
+        self.app = app
+        self.connections = app.config.get('WARMUP_CONNECTIONS', 2)
+        app.extensions['warmup'] = self
+
+    def warm_up(self):
+        ''' Load and exercise everything that's shared between workers, then close the
+            database connections so that no worker inherits one.
+        '''
+        started = monotonic()
+        with self.app.app_context():
+            configure_mappers()
+            for text in WARMUP_TEXT:
+                get_image_url(text)
+                if self.router is not None:
+                    self.router.resolve(text)
+
+            # the dialect checks the server's version and settings on its first connection
+            db.session.query(Definition.id).filter(Definition.term_key == normalize_term("warmup")).first()
+            if self.search_index is not None and self.app.config.get('SEARCH_BACKEND') == "memory":
+                self.search_index.refresh()
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+
+        with self.lock:
+            self.warmed_up = True
+            self.timings['warm_up'] = monotonic() - started
+
+    def warm_up_worker(self):
+        ''' Open this worker's database connections, warming up first if that wasn't
+            done before the fork, and mark the worker ready.
+        '''
+        if not self.warmed_up:
+            self.warm_up()
+
+        started = monotonic()
+        with self.app.app_context():
+            engine = db.get_engine(self.app)
+            # connections inherited from a parent process can't be used, so start over
+            engine.dispose()
+            connections = []
+            try:
+                for number in range(self.connections):
+                    connections.append(engine.connect())
+                    connections[-1].execute(sql.text('SELECT 1'))
+            finally:
+                # return the connections to the pool, which keeps them open
+                for connection in connections:
+                    connection.close()
+
+        with self.lock:
+            self.ready_pid = os.getpid()
+            self.timings['warm_up_worker'] = monotonic() - started
+
+    def is_ready(self):
+        ''' Has this process been warmed up?
+        '''
+        return self.ready_pid == os.getpid()
+
+    def stats(self):
+        ''' Return whether this process is ready, and how long warming up took.
+        '''
+        with self.lock:
+            return dict(self.timings, ready=self.ready_pid == os.getpid())
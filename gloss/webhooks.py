@@ -0,0 +1,269 @@
+from queue import Queue, Full
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from threading import Lock, Thread
+from time import monotonic, sleep
+import atexit
+import logging
+import os
+
+# response codes from Slack that are worth trying again
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class WebhookDelivery(object):
+    ''' Deliver webhook payloads from a bounded in-process queue, which is drained
+        by a pool of worker threads sharing a single keep-alive session. Payloads that
+        have to arrive in order are queued together on a queue of their own, which is
+        drained by a single thread, so that they never hold up the pool.
+    '''
+
+    def __init__(self, app=None):
+        self.lock = Lock()
+        self.counter_lock = Lock()
+        self.pid = None
+        self.queue = None
+        self.ordered_queue = None
+        self.session = None
+        self.threads = []
+        self.listeners = []
+        self.reset_counters()
+        atexit.register(self.shutdown)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' Read delivery settings from the app's config.
+        '''
+        self.shutdown()
+        self.worker_count = app.config.get('WEBHOOK_WORKERS', 2)
+        self.queue_size = app.config.get('WEBHOOK_QUEUE_SIZE', 100)
+        self.max_retries = app.config.get('WEBHOOK_MAX_RETRIES', 3)
+        self.backoff = app.config.get('WEBHOOK_BACKOFF', 0.5)
+        self.timeout = app.config.get('WEBHOOK_TIMEOUT', 5.0)
+        self.drain_timeout = app.config.get('WEBHOOK_DRAIN_TIMEOUT', 10.0)
+        self.queue_wait = app.config.get('WEBHOOK_QUEUE_WAIT', 0.5)
+        self.ordered_queue_size = app.config.get('WEBHOOK_ORDERED_QUEUE_SIZE', 10)
+        self.reset_counters()
+        app.extensions['webhook_delivery'] = self
+
+    def reset_counters(self):
+        ''' Zero the delivery counters.
+        '''
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+        self.overflowed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def add_listener(self, listener):
+        ''' Call listener(succeeded, latency, retries) after every delivery, where
+            latency is the time in seconds from queueing to the last attempt.
+        '''
+        self.listeners.append(listener)
+
+    def start(self):
+        ''' Start the worker pool and the ordered delivery thread if they aren't
+            running in this process. Threads don't survive a fork, so a pool started
+            before gunicorn forked is replaced.
+        '''
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+            self.queue = Queue(maxsize=self.queue_size)
+            self.ordered_queue = Queue(maxsize=self.ordered_queue_size)
+            self.session = self.make_session()
+            self.threads = []
+            for number in range(self.worker_count):
+                thread = Thread(target=self.work, name="webhook-delivery-{}".format(number), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            self.ordered_thread = Thread(target=self.work_in_order, name="webhook-ordered-delivery", daemon=True)
+            self.ordered_thread.start()
+
+    def make_session(self):
+        ''' Make a session with a connection pool big enough for every worker.
+        '''
+        session = Session()
+        # the ordered delivery thread needs a connection too
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.worker_count + 1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def deliver(self, url, payload):
+        ''' Queue the payload for delivery to the url and return immediately. If
+            there are no workers configured, deliver it now and return the response.
+        '''
+        if self.worker_count < 1:
+            if self.session is None:
+                self.session = self.make_session()
+            return self.post(url, payload, monotonic())
+
+        self.enqueue(url, payload)
+        return None
+
+    def enqueue(self, url, payload):
+        ''' Queue the payload, waiting up to queue_wait seconds for room. A payload
+            that still doesn't fit is dropped rather than sent from the request, which
+            could take as long as sending it through every retry. Returns whether it
+            was queued.
+        '''
+        self.start()
+        try:
+            self.queue.put((url, payload, monotonic()), timeout=self.queue_wait)
+        except Full:
+            with self.counter_lock:
+                self.overflowed += 1
+            logging.error("Webhook delivery queue is full, dropping a payload")
+            return False
+
+        return True
+
+    def deliver_in_order(self, url, payloads):
+        ''' Queue the list of payloads to be delivered to the url one after another and
+            return immediately, or deliver them now if there are no workers configured.
+            Returns whether they were queued; they aren't if the ordered queue is full,
+            so that the caller can answer some other way.
+        '''
+        if self.worker_count < 1:
+            if self.session is None:
+                self.session = self.make_session()
+            self.post_in_order(url, payloads, monotonic())
+            return True
+
+        self.start()
+        try:
+            self.ordered_queue.put_nowait((url, payloads, monotonic()))
+        except Full:
+            with self.counter_lock:
+                self.overflowed += len(payloads)
+            logging.error("Ordered webhook delivery queue is full, dropping {} payloads".format(len(payloads)))
+            return False
+
+        return True
+
+    def work(self):
+        ''' Deliver queued payloads until told to stop.
+        '''
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+
+                self.post(*item)
+            finally:
+                self.queue.task_done()
+
+    def work_in_order(self):
+        ''' Deliver queued lists of payloads, one list at a time, until told to stop.
+        '''
+        while True:
+            item = self.ordered_queue.get()
+            try:
+                if item is None:
+                    return
+
+                self.post_in_order(*item)
+            finally:
+                self.ordered_queue.task_done()
+
+    def post_in_order(self, url, payloads, queued_at):
+        ''' Post the payloads to the url one after another, stopping at the first one
+            that can't be delivered, so that the ones after it don't arrive out of place.
+        '''
+        for number, payload in enumerate(payloads):
+            response = self.post(url, payload, queued_at)
+            if response is None or not response.ok:
+                logging.error("Giving up on the last {} of {} ordered webhook payloads".format(len(payloads) - number - 1, len(payloads)))
+                return
+
+    def post(self, url, payload, queued_at):
+        ''' Post the payload to the url, retrying with exponential backoff on
+            connection errors and on responses that are worth trying again.
+        '''
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self.counter_lock:
+                    self.retried += 1
+                sleep(self.backoff * (2 ** (attempt - 1)))
+
+            try:
+                response = self.session.post(url, data=payload, timeout=self.timeout)
+            except RequestException as e:
+                logging.warning("Webhook delivery attempt {} failed: {}".format(attempt + 1, e))
+                response = None
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+
+        latency = monotonic() - queued_at
+        succeeded = response is not None and response.ok
+        with self.counter_lock:
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if succeeded:
+                self.delivered += 1
+            else:
+                self.failed += 1
+
+        if not succeeded:
+            logging.error("Webhook delivery to Slack failed after {} attempts".format(attempt + 1))
+
+        for listener in self.listeners:
+            listener(succeeded, latency, attempt)
+
+        return response
+
+    def drain(self):
+        ''' Block until every queued payload has been delivered.
+        '''
+        if self.queue is not None and self.pid == os.getpid():
+            self.queue.join()
+            self.ordered_queue.join()
+
+    def shutdown(self):
+        ''' Stop the worker pool, giving queued payloads until drain_timeout to
+            be delivered.
+        '''
+        with self.lock:
+            if self.pid != os.getpid():
+                return
+
+            deadline = monotonic() + getattr(self, 'drain_timeout', 0)
+            for thread in self.threads:
+                try:
+                    self.queue.put(None, timeout=max(deadline - monotonic(), 0))
+                except Full:
+                    break
+            try:
+                self.ordered_queue.put(None, timeout=max(deadline - monotonic(), 0))
+            except Full:
+                pass
+
+            for thread in self.threads + [self.ordered_thread]:
+                thread.join(timeout=max(deadline - monotonic(), 0))
+
+            self.pid = None
+            self.threads = []
+
+    def stats(self):
+        ''' Return the current queue depth and delivery counters.
+        '''
+        attempted = self.delivered + self.failed
+        return {
+            'queue_depth': self.queue.qsize() if self.queue is not None and self.pid == os.getpid() else 0,
+            'ordered_queue_depth': self.ordered_queue.qsize() if self.ordered_queue is not None and self.pid == os.getpid() else 0,
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'retried': self.retried,
+            'overflowed': self.overflowed,
+            'latency_average': self.latency_total / attempted if attempted else 0.0,
+            'latency_max': self.latency_max
+        }
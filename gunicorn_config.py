@@ -0,0 +1,62 @@
+# gunicorn settings, see http://docs.gunicorn.org/en/stable/settings.html
+from os import environ, makedirs, path
+import shutil
+import tempfile
+
+# workers share their Prometheus metrics through this directory, which has to be set
+# before the app (and so prometheus_client) is loaded
+metrics_directory = environ.setdefault('PROMETHEUS_MULTIPROC_DIR', path.join(tempfile.gettempdir(), "gloss-metrics"))
+
+# with gevent workers, each worker answers up to this many requests at once while
+# they wait on the database; the default stays within the default pool of
+# DATABASE_POOL_SIZE=5 connections plus DATABASE_MAX_OVERFLOW=10, so requests don't
+# queue for a connection
+worker_connections = int(environ.get('GUNICORN_WORKER_CONNECTIONS', 15))
+
+# the worker classes that run requests in greenlets
+GREEN_WORKER_CLASSES = ("gevent", "gunicorn.workers.ggevent.GeventWorker")
+
+# load and warm up the app once in the master, so that workers start warm after they
+# fork; gevent has to patch the standard library before the app is imported, so
+# green workers load the app themselves unless told otherwise
+green = environ.get('GUNICORN_WORKER_CLASS', "sync") in GREEN_WORKER_CLASSES
+preload_app = environ.get('GUNICORN_PRELOAD', "false" if green else "true").lower() == "true"
+
+def on_starting(server):
+    ''' Start with no metrics left over from an earlier run
+    '''
+    shutil.rmtree(metrics_directory, ignore_errors=True)
+    makedirs(metrics_directory)
+
+def when_ready(server):
+    ''' Warm up the preloaded app before any workers are forked
+    '''
+    if server.cfg.preload_app:
+        from gloss import warmup
+        try:
+            warmup.warm_up()
+        except Exception:
+            server.log.exception("Couldn't warm up before forking; workers will warm up on their own")
+
+def post_fork(server, worker):
+    ''' Make psycopg2 yield to other greenlets while it waits on Postgres, instead of
+        blocking the whole gevent worker
+    '''
+    if server.cfg.worker_class_str in GREEN_WORKER_CLASSES:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+def post_worker_init(worker):
+    ''' Open the worker's database connections and mark it ready
+    '''
+    from gloss import warmup
+    try:
+        warmup.warm_up_worker()
+    except Exception:
+        worker.log.exception("Couldn't warm up the worker; it won't report itself ready")
+
+def child_exit(server, worker):
+    ''' Stop reporting live metrics for a worker that's gone
+    '''
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
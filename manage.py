@@ -1,8 +1,15 @@
 from os import environ, path
 from gloss import create_app, db
 from gloss.models import Definition, Interaction
-from flask_script import Manager, prompt_bool
+from gloss.profiling import read_profiles, summarize_profiles
+from gloss.stats import rebuild_statistics
+from gloss.bulk import export_glossary, get_format, import_glossary
+from gloss.teams import assign_team, partition_definitions
+from gloss.maintenance import maintain_interactions
+from benchmarks.glossary import generate_glossary
+from flask_script import Command, Manager, Option, prompt_bool
 from flask_migrate import Migrate, MigrateCommand
+import sys
 
 # grab environment variables from the .env file if it exists
 if path.exists('.env'):
@@ -36,5 +43,87 @@ def dropdb():
 def createdb():
     db.create_all()
 
+@manager.command
+def rebuildstats():
+    ''' Recount the statistics that the stats command reports from the definitions and interactions tables
+    '''
+    rebuild_statistics()
+
+@manager.command
+def assignteam(team_id):
+    ''' Move the definitions and interactions recorded before MULTI_WORKSPACE was turned on to the workspace with the passed team_id
+    '''
+    definitions, interactions = assign_team(team_id)
+    print("moved {} definitions and {} interactions to {}".format(definitions, interactions, team_id))
+
+@manager.command
+def partitiondefinitions(partitions=16):
+    ''' Rebuild the definitions table as one that's hash partitioned by team_id (needs Postgres 12 or later)
+    '''
+    partition_definitions(int(partitions))
+
+@manager.command
+def maintain():
+    ''' Create the coming months' interactions partitions, roll up finished days and drop expired partitions; run it daily from a scheduler
+    '''
+    summary = maintain_interactions()
+    print("created {} partitions, rolled up interactions until {}, dropped {} partitions".format(len(summary['created']), summary['rolled_up_until'], len(summary['dropped'])))
+
+@manager.command
+def generate(definitions=1000, interactions=100000, users=None, seed=None):
+    ''' Add made-up definitions and interactions to the database, for benchmarking
+    '''
+    generate_glossary(int(definitions), int(interactions), users=int(users) if users else None, seed=int(seed) if seed else None)
+
+@manager.command
+def profilesummary(path=None):
+    ''' Summarize the request profiles that every worker recorded for PROFILE_PATH (or the passed path), and their rotated backups
+    '''
+    profiles = read_profiles(path or app.config['PROFILE_PATH'], backup_count=app.config['PROFILE_BACKUP_COUNT'])
+    for line in summarize_profiles(profiles):
+        print(line)
+
+class ImportGlossary(Command):
+    ''' Import definitions from a CSV or JSON Lines file with term and definition fields, and optional user_name and creation_date fields
+    '''
+
+    option_list = (
+        Option('path', help="the file to import, or - for standard input"),
+        Option('-f', '--format', dest='file_format', choices=("csv", "jsonl"), help="the file's format, if its extension doesn't say"),
+        Option('-u', '--user-name', dest='user_name', default="import", help="who to credit for definitions without a user_name"),
+        Option('-p', '--processes', dest='processes', type=int, default=None, help="how many processes to parse the file with"),
+        Option('-t', '--team-id', dest='team_id', default="", help="the workspace to import into, when MULTI_WORKSPACE is on"),
+    )
+
+    def run(self, path, file_format, user_name, processes, team_id):
+        file_format = get_format(path, file_format)
+        with (open(path, newline="", encoding="utf-8") if path != "-" else sys.stdin) as lines:
+            counts, errors = import_glossary(lines, file_format, user_name=user_name, processes=processes, team_id=team_id)
+
+        for line_number, problem in errors:
+            print("line {}: {}".format(line_number, problem))
+        print("{records} records for {terms} terms: {inserted} added, {updated} updated, {unchanged} unchanged, {skipped} skipped".format(**counts))
+
+class ExportGlossary(Command):
+    ''' Export every definition to a CSV or JSON Lines file
+    '''
+
+    option_list = (
+        Option('path', help="the file to export to, or - for standard output"),
+        Option('-f', '--format', dest='file_format', choices=("csv", "jsonl"), help="the file's format, if its extension doesn't say"),
+        Option('-t', '--team-id', dest='team_id', default="", help="the workspace to export, when MULTI_WORKSPACE is on"),
+    )
+
+    def run(self, path, file_format, team_id):
+        file_format = get_format(path, file_format or ("jsonl" if path == "-" else None))
+        with (open(path, "w", newline="", encoding="utf-8") if path != "-" else sys.stdout) as output:
+            written = export_glossary(output, file_format, team_id=team_id)
+
+        if path != "-":
+            print("exported {} definitions to {}".format(written, path))
+
+manager.add_command('import', ImportGlossary())
+manager.add_command('export', ExportGlossary())
+
 if __name__ == '__main__':
     manager.run()
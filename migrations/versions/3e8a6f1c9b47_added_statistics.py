@@ -0,0 +1,128 @@
+"""Added statistics and definers tables, kept up to date by triggers, for the stats command
+
+Revision ID: 3e8a6f1c9b47
+Revises: 9c41e7b2a5d8
+Create Date: 2026-10-17 13:02:37.415908
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3e8a6f1c9b47'
+down_revision = '9c41e7b2a5d8'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    db_bind = op.get_bind()
+
+    # create the tables
+    op.create_table('statistics',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('definitions', sa.BigInteger(), nullable=False),
+        sa.Column('definers', sa.BigInteger(), nullable=False),
+        # interactions that have been counted into the row; the rest are counted when
+        # they're asked for
+        sa.Column('interactions', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('definers',
+        sa.Column('user_name', sa.Unicode(), nullable=False),
+        sa.Column('definitions', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_name')
+    )
+
+    # set up triggers to keep the definition counts up to date; interactions are
+    # written far more often, so they're counted when the stats are asked for instead
+    # of updating this one row on every insert
+    db_bind.execute(sa.sql.text('''
+        CREATE OR REPLACE FUNCTION count_definitions() RETURNS trigger AS $$
+        DECLARE
+          term_change integer := 0;
+          definer_change integer := 0;
+          remaining integer;
+        BEGIN
+          IF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM definers;
+            UPDATE statistics SET definitions = 0, definers = 0;
+            RETURN NULL;
+          END IF;
+
+          IF TG_OP = 'UPDATE' AND old.term IS NOT DISTINCT FROM new.term AND old.user_name IS NOT DISTINCT FROM new.user_name THEN
+            RETURN NULL;
+          END IF;
+
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF old.term IS NOT NULL THEN
+              term_change := term_change - 1;
+            END IF;
+            IF old.user_name IS NOT NULL THEN
+              UPDATE definers SET definitions = definitions - 1 WHERE user_name = old.user_name RETURNING definitions INTO remaining;
+              IF remaining = 0 THEN
+                DELETE FROM definers WHERE user_name = old.user_name;
+                definer_change := definer_change - 1;
+              END IF;
+            END IF;
+          END IF;
+
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF new.term IS NOT NULL THEN
+              term_change := term_change + 1;
+            END IF;
+            IF new.user_name IS NOT NULL THEN
+              INSERT INTO definers (user_name, definitions) VALUES (new.user_name, 1)
+                ON CONFLICT (user_name) DO UPDATE SET definitions = definers.definitions + 1
+                RETURNING definitions INTO remaining;
+              IF remaining = 1 THEN
+                definer_change := definer_change + 1;
+              END IF;
+            END IF;
+          END IF;
+
+          IF term_change <> 0 OR definer_change <> 0 THEN
+            UPDATE statistics SET definitions = definitions + term_change, definers = definers + definer_change;
+          END IF;
+          RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP TRIGGER IF EXISTS count_definitions_trigger ON definitions;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE TRIGGER count_definitions_trigger AFTER INSERT OR UPDATE OR DELETE ON definitions FOR EACH ROW EXECUTE PROCEDURE count_definitions();
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP TRIGGER IF EXISTS count_definitions_truncate_trigger ON definitions;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE TRIGGER count_definitions_truncate_trigger AFTER TRUNCATE ON definitions FOR EACH STATEMENT EXECUTE PROCEDURE count_definitions();
+    '''))
+
+    # count what's already there, blocking writes so that the triggers pick up
+    # exactly where the count leaves off
+    db_bind.execute(sa.sql.text('''
+        LOCK TABLE definitions IN SHARE MODE;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        INSERT INTO definers (user_name, definitions) SELECT user_name, count(*) FROM definitions WHERE user_name IS NOT NULL GROUP BY user_name;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        INSERT INTO statistics (id, definitions, definers, interactions) SELECT 1, (SELECT count(term) FROM definitions), (SELECT count(*) FROM definers), 0;
+    '''))
+
+def downgrade():
+    db_bind = op.get_bind()
+
+    db_bind.execute(sa.sql.text('''
+        DROP TRIGGER IF EXISTS count_definitions_truncate_trigger ON definitions;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP TRIGGER IF EXISTS count_definitions_trigger ON definitions;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP FUNCTION IF EXISTS count_definitions();
+    '''))
+
+    op.drop_table('definers')
+    op.drop_table('statistics')
@@ -0,0 +1,59 @@
+"""Added a normalized term_key column for indexed case-insensitive lookups
+
+Revision ID: 5b8e2c4d1f3a
+Revises: 201bae6698f6
+Create Date: 2026-10-17 10:12:44.318022
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2c4d1f3a'
+down_revision = '201bae6698f6'
+
+from alembic import op
+import sqlalchemy as sa
+import unicodedata
+
+# how many rows to backfill at a time
+BATCH_SIZE = 1000
+
+def normalize_term(term):
+    ''' A copy of gloss.models.normalize_term as it was when this migration was written
+    '''
+    return unicodedata.normalize('NFKC', unicodedata.normalize('NFKC', term).casefold())
+
+def upgrade():
+    db_bind = op.get_bind()
+
+    # add the column
+    op.add_column('definitions', sa.Column('term_key', sa.Unicode(), nullable=True))
+
+    # backfill existing rows in batches
+    last_id = 0
+    while True:
+        rows = db_bind.execute(sa.sql.text('''
+            SELECT id, term FROM definitions WHERE id > :last_id ORDER BY id LIMIT :batch_size;
+        '''), last_id=last_id, batch_size=BATCH_SIZE).fetchall()
+        if not rows:
+            break
+
+        updates = [{'id': row_id, 'term_key': normalize_term(term)} for row_id, term in rows if term is not None]
+        if updates:
+            db_bind.execute(sa.sql.text('''
+                UPDATE definitions SET term_key = :term_key WHERE id = :id;
+            '''), updates)
+        last_id = rows[-1][0]
+
+    # terms that differ only by case were already refused, but terms that only
+    # differ by Unicode form would break the unique index
+    duplicates = db_bind.execute(sa.sql.text('''
+        SELECT term_key, string_agg(term, ', ') FROM definitions WHERE term_key IS NOT NULL GROUP BY term_key HAVING count(*) > 1;
+    ''')).fetchall()
+    if duplicates:
+        raise RuntimeError("Can't add a unique index on term_key because these terms are duplicates of each other: {}".format("; ".join([terms for term_key, terms in duplicates])))
+
+    op.create_index(op.f('ix_definitions_term_key'), 'definitions', ['term_key'], unique=True)
+
+def downgrade():
+    op.drop_index(op.f('ix_definitions_term_key'), table_name='definitions')
+    op.drop_column('definitions', 'term_key')
@@ -0,0 +1,21 @@
+"""Added an index on creation_date and id for paging through recent definitions
+
+Revision ID: 6a1f0d8e3c52
+Revises: 3e8a6f1c9b47
+Create Date: 2026-10-17 13:48:05.226194
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a1f0d8e3c52'
+down_revision = '3e8a6f1c9b47'
+
+from alembic import op
+
+def upgrade():
+    # recent definitions are listed, and paged through, by (creation_date, id);
+    # alphabetical listings use the unique index on term_key
+    op.create_index(op.f('ix_definitions_creation_date_id'), 'definitions', ['creation_date', 'id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_definitions_creation_date_id'), table_name='definitions')
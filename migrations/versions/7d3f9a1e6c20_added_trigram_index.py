@@ -0,0 +1,49 @@
+"""Added a trigram index for substring matching of terms
+
+Revision ID: 7d3f9a1e6c20
+Revises: 5b8e2c4d1f3a
+Create Date: 2026-10-17 11:03:19.840517
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7d3f9a1e6c20'
+down_revision = '5b8e2c4d1f3a'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    db_bind = op.get_bind()
+
+    # enable trigram matching
+    db_bind.execute(sa.sql.text('''
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    '''))
+
+    # a GIN trigram index can answer ILIKE '%term%' and rank by similarity()
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_term_trgm;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_term_trgm ON definitions USING gin (term gin_trgm_ops);
+    '''))
+
+    # short search terms are matched as prefixes of term_key
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_term_key_pattern;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_term_key_pattern ON definitions (term_key varchar_pattern_ops);
+    '''))
+
+def downgrade():
+    db_bind = op.get_bind()
+
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_term_key_pattern;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_term_trgm;
+    '''))
+    # leave the pg_trgm extension in place, since other things may depend on it
@@ -0,0 +1,235 @@
+"""Scoped definitions, interactions and statistics by Slack workspace (team_id)
+
+Revision ID: b4e7c2d9a813
+Revises: 6a1f0d8e3c52
+Create Date: 2026-10-17 15:21:44.108263
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b4e7c2d9a813'
+down_revision = '6a1f0d8e3c52'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    db_bind = op.get_bind()
+
+    # existing rows belong to the one workspace the deployment served until now
+    op.add_column('definitions', sa.Column('team_id', sa.Unicode(), nullable=False, server_default=''))
+    op.add_column('interactions', sa.Column('team_id', sa.Unicode(), nullable=False, server_default=''))
+
+    # GIN indexes that start with team_id need btree_gin
+    db_bind.execute(sa.sql.text('''
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+    '''))
+
+    # every index on definitions starts with team_id, so that a workspace's queries
+    # only read its own entries
+    op.drop_index(op.f('ix_definitions_term_key'), table_name='definitions')
+    op.create_index(op.f('ix_definitions_team_id_term_key'), 'definitions', ['team_id', 'term_key'], unique=True)
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_term_trgm;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_team_id_term_trgm ON definitions USING gin (team_id, term gin_trgm_ops);
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_term_key_pattern;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_team_id_term_key_pattern ON definitions (team_id, term_key varchar_pattern_ops);
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_tsv_search;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_team_id_tsv_search ON definitions USING gin (team_id, tsv_search);
+    '''))
+    op.drop_index(op.f('ix_definitions_creation_date_id'), table_name='definitions')
+    op.create_index(op.f('ix_definitions_team_id_creation_date_id'), 'definitions', ['team_id', 'creation_date', 'id'], unique=False)
+    op.drop_index(op.f('ix_interactions_action'), table_name='interactions')
+    op.create_index(op.f('ix_interactions_team_id_action'), 'interactions', ['team_id', 'action'], unique=False)
+
+    # keep a row of counts, and the definers, for each workspace
+    op.add_column('statistics', sa.Column('team_id', sa.Unicode(), nullable=False, server_default=''))
+    op.drop_constraint('statistics_pkey', 'statistics', type_='primary')
+    op.drop_column('statistics', 'id')
+    op.create_primary_key('statistics_pkey', 'statistics', ['team_id'])
+    op.alter_column('statistics', 'team_id', server_default=None)
+    op.add_column('definers', sa.Column('team_id', sa.Unicode(), nullable=False, server_default=''))
+    op.drop_constraint('definers_pkey', 'definers', type_='primary')
+    op.create_primary_key('definers_pkey', 'definers', ['team_id', 'user_name'])
+    op.alter_column('definers', 'team_id', server_default=None)
+
+    # count definitions by workspace; the triggers themselves don't change
+    db_bind.execute(sa.sql.text('''
+        CREATE OR REPLACE FUNCTION count_definitions() RETURNS trigger AS $$
+        DECLARE
+          term_change integer;
+          definer_change integer;
+          remaining integer;
+        BEGIN
+          IF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM definers;
+            UPDATE statistics SET definitions = 0, definers = 0;
+            RETURN NULL;
+          END IF;
+
+          IF TG_OP = 'UPDATE' AND old.team_id = new.team_id AND old.term IS NOT DISTINCT FROM new.term AND old.user_name IS NOT DISTINCT FROM new.user_name THEN
+            RETURN NULL;
+          END IF;
+
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            term_change := 0;
+            definer_change := 0;
+            IF old.term IS NOT NULL THEN
+              term_change := -1;
+            END IF;
+            IF old.user_name IS NOT NULL THEN
+              UPDATE definers SET definitions = definitions - 1 WHERE team_id = old.team_id AND user_name = old.user_name RETURNING definitions INTO remaining;
+              IF remaining = 0 THEN
+                DELETE FROM definers WHERE team_id = old.team_id AND user_name = old.user_name;
+                definer_change := -1;
+              END IF;
+            END IF;
+            IF term_change <> 0 OR definer_change <> 0 THEN
+              UPDATE statistics SET definitions = definitions + term_change, definers = definers + definer_change WHERE team_id = old.team_id;
+            END IF;
+          END IF;
+
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            term_change := 0;
+            definer_change := 0;
+            IF new.term IS NOT NULL THEN
+              term_change := 1;
+            END IF;
+            IF new.user_name IS NOT NULL THEN
+              INSERT INTO definers (team_id, user_name, definitions) VALUES (new.team_id, new.user_name, 1)
+                ON CONFLICT (team_id, user_name) DO UPDATE SET definitions = definers.definitions + 1
+                RETURNING definitions INTO remaining;
+              IF remaining = 1 THEN
+                definer_change := 1;
+              END IF;
+            END IF;
+            IF term_change <> 0 OR definer_change <> 0 THEN
+              INSERT INTO statistics (team_id, definitions, definers, interactions) VALUES (new.team_id, term_change, definer_change, 0)
+                ON CONFLICT (team_id) DO UPDATE SET definitions = statistics.definitions + excluded.definitions, definers = statistics.definers + excluded.definers;
+            END IF;
+          END IF;
+          RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    '''))
+
+def downgrade():
+    db_bind = op.get_bind()
+
+    db_bind.execute(sa.sql.text('''
+        CREATE OR REPLACE FUNCTION count_definitions() RETURNS trigger AS $$
+        DECLARE
+          term_change integer := 0;
+          definer_change integer := 0;
+          remaining integer;
+        BEGIN
+          IF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM definers;
+            UPDATE statistics SET definitions = 0, definers = 0;
+            RETURN NULL;
+          END IF;
+
+          IF TG_OP = 'UPDATE' AND old.term IS NOT DISTINCT FROM new.term AND old.user_name IS NOT DISTINCT FROM new.user_name THEN
+            RETURN NULL;
+          END IF;
+
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF old.term IS NOT NULL THEN
+              term_change := term_change - 1;
+            END IF;
+            IF old.user_name IS NOT NULL THEN
+              UPDATE definers SET definitions = definitions - 1 WHERE user_name = old.user_name RETURNING definitions INTO remaining;
+              IF remaining = 0 THEN
+                DELETE FROM definers WHERE user_name = old.user_name;
+                definer_change := definer_change - 1;
+              END IF;
+            END IF;
+          END IF;
+
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF new.term IS NOT NULL THEN
+              term_change := term_change + 1;
+            END IF;
+            IF new.user_name IS NOT NULL THEN
+              INSERT INTO definers (user_name, definitions) VALUES (new.user_name, 1)
+                ON CONFLICT (user_name) DO UPDATE SET definitions = definers.definitions + 1
+                RETURNING definitions INTO remaining;
+              IF remaining = 1 THEN
+                definer_change := definer_change + 1;
+              END IF;
+            END IF;
+          END IF;
+
+          IF term_change <> 0 OR definer_change <> 0 THEN
+            UPDATE statistics SET definitions = definitions + term_change, definers = definers + definer_change;
+          END IF;
+          RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+    '''))
+
+    # go back to one row of counts, recounted across every workspace
+    db_bind.execute(sa.sql.text('''
+        LOCK TABLE definitions IN SHARE MODE;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DELETE FROM definers;
+    '''))
+    op.drop_constraint('definers_pkey', 'definers', type_='primary')
+    op.drop_column('definers', 'team_id')
+    op.create_primary_key('definers_pkey', 'definers', ['user_name'])
+    db_bind.execute(sa.sql.text('''
+        INSERT INTO definers (user_name, definitions)
+        SELECT user_name, count(*) FROM definitions WHERE user_name IS NOT NULL GROUP BY user_name;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DELETE FROM statistics;
+    '''))
+    op.drop_constraint('statistics_pkey', 'statistics', type_='primary')
+    op.drop_column('statistics', 'team_id')
+    op.add_column('statistics', sa.Column('id', sa.Integer(), nullable=False))
+    op.create_primary_key('statistics_pkey', 'statistics', ['id'])
+    db_bind.execute(sa.sql.text('''
+        INSERT INTO statistics (id, definitions, definers, interactions)
+        SELECT 1, (SELECT count(term) FROM definitions), (SELECT count(*) FROM definers), 0;
+    '''))
+
+    op.drop_index(op.f('ix_interactions_team_id_action'), table_name='interactions')
+    op.create_index(op.f('ix_interactions_action'), 'interactions', ['action'], unique=False)
+    op.drop_index(op.f('ix_definitions_team_id_creation_date_id'), table_name='definitions')
+    op.create_index(op.f('ix_definitions_creation_date_id'), 'definitions', ['creation_date', 'id'], unique=False)
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_team_id_tsv_search;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_tsv_search ON definitions USING gin (tsv_search);
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_team_id_term_key_pattern;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_term_key_pattern ON definitions (term_key varchar_pattern_ops);
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP INDEX IF EXISTS ix_definitions_team_id_term_trgm;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE INDEX ix_definitions_term_trgm ON definitions USING gin (term gin_trgm_ops);
+    '''))
+    # this fails if more than one workspace has defined the same term
+    op.drop_index(op.f('ix_definitions_team_id_term_key'), table_name='definitions')
+    op.create_index(op.f('ix_definitions_term_key'), 'definitions', ['term_key'], unique=True)
+
+    op.drop_column('interactions', 'team_id')
+    op.drop_column('definitions', 'team_id')
+    # leave the btree_gin extension in place, since other things may depend on it
@@ -0,0 +1,119 @@
+"""Partitioned interactions by month and added daily rollups of them
+
+Revision ID: c81f5a3e7d46
+Revises: b4e7c2d9a813
+Create Date: 2026-10-17 16:40:12.583019
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c81f5a3e7d46'
+down_revision = 'b4e7c2d9a813'
+
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+
+def get_month(moment, months_later=0):
+    index = moment.year * 12 + moment.month - 1 + months_later
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def upgrade():
+    db_bind = op.get_bind()
+
+    # interactions are counted by rolling them up now; databases that were upgraded
+    # when interactions were counted by a trigger on every insert still have it
+    db_bind.execute(sa.sql.text('''
+        DROP TRIGGER IF EXISTS count_interactions_trigger ON interactions;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP TRIGGER IF EXISTS count_interactions_truncate_trigger ON interactions;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP FUNCTION IF EXISTS count_interactions();
+    '''))
+
+    op.create_table('daily_interactions',
+        sa.Column('team_id', sa.Unicode(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('action', sa.Unicode(), nullable=False),
+        sa.Column('term', sa.Unicode(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('team_id', 'day', 'action', 'term')
+    )
+    op.create_table('rollup_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rolled_up_until', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # nothing's been rolled up yet, so the stats command counts every interaction
+    db_bind.execute(sa.sql.text('''
+        UPDATE statistics SET interactions = 0;
+    '''))
+
+    # the existing table becomes the partition for everything before this month,
+    # without copying it; the partition key has to be part of the primary key
+    this_month = get_month(datetime.utcnow())
+    db_bind.execute(sa.sql.text('''
+        UPDATE interactions SET creation_date = '1970-01-01' WHERE creation_date IS NULL;
+    '''))
+    op.drop_index(op.f('ix_interactions_team_id_action'), table_name='interactions')
+    op.drop_constraint('interactions_pkey', 'interactions', type_='primary')
+    op.alter_column('interactions', 'creation_date', nullable=False)
+    op.rename_table('interactions', 'interactions_archive')
+    db_bind.execute(sa.sql.text('''
+        CREATE TABLE interactions (LIKE interactions_archive INCLUDING DEFAULTS) PARTITION BY RANGE (creation_date);
+    '''))
+    # the sequence would be dropped with the archive otherwise
+    db_bind.execute(sa.sql.text('''
+        ALTER SEQUENCE interactions_id_seq OWNED BY interactions.id;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        CREATE TABLE interactions_default PARTITION OF interactions DEFAULT;
+    '''))
+    for months_later in range(3):
+        start, end = get_month(this_month, months_later), get_month(this_month, months_later + 1)
+        db_bind.execute(sa.sql.text('''
+            CREATE TABLE interactions_y{:04d}m{:02d} PARTITION OF interactions FOR VALUES FROM ('{}') TO ('{}');
+        '''.format(start.year, start.month, start, end)))
+    db_bind.execute(sa.sql.text('''
+        INSERT INTO interactions SELECT * FROM interactions_archive WHERE creation_date >= '{}';
+    '''.format(this_month)))
+    db_bind.execute(sa.sql.text('''
+        DELETE FROM interactions_archive WHERE creation_date >= '{}';
+    '''.format(this_month)))
+    db_bind.execute(sa.sql.text('''
+        ALTER TABLE interactions ATTACH PARTITION interactions_archive FOR VALUES FROM (MINVALUE) TO ('{}');
+    '''.format(this_month)))
+
+    op.create_primary_key('interactions_pkey', 'interactions', ['id', 'creation_date'])
+    op.create_index(op.f('ix_interactions_team_id_creation_date'), 'interactions', ['team_id', 'creation_date'], unique=False)
+
+def downgrade():
+    db_bind = op.get_bind()
+
+    # interactions from partitions that have been dropped are gone
+    op.rename_table('interactions', 'interactions_partitioned')
+    db_bind.execute(sa.sql.text('''
+        CREATE TABLE interactions (LIKE interactions_partitioned INCLUDING DEFAULTS);
+    '''))
+    db_bind.execute(sa.sql.text('''
+        INSERT INTO interactions SELECT * FROM interactions_partitioned;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        ALTER SEQUENCE interactions_id_seq OWNED BY interactions.id;
+    '''))
+    db_bind.execute(sa.sql.text('''
+        DROP TABLE interactions_partitioned;
+    '''))
+    op.alter_column('interactions', 'creation_date', nullable=True)
+    op.create_primary_key('interactions_pkey', 'interactions', ['id'])
+    op.create_index(op.f('ix_interactions_team_id_action'), 'interactions', ['team_id', 'action'], unique=False)
+
+    op.drop_table('rollup_state')
+    op.drop_table('daily_interactions')
+
+    # the rolled up counts go with the rollups
+    db_bind.execute(sa.sql.text('''
+        UPDATE statistics SET interactions = 0;
+    '''))
@@ -0,0 +1,99 @@
+"""Resolved aliases into a key pointing at the definition at the end of their chains
+
+Revision ID: d5a9f3c1b7e2
+Revises: c81f5a3e7d46
+Create Date: 2026-10-17 18:05:37.264180
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd5a9f3c1b7e2'
+down_revision = 'c81f5a3e7d46'
+
+from alembic import op
+import re
+import sqlalchemy as sa
+import unicodedata
+
+# how many rows to backfill at a time
+BATCH_SIZE = 1000
+
+ALIAS_KEYWORDS = ("see also", "see")
+
+def normalize_term(term):
+    ''' A copy of gloss.models.normalize_term as it was when this migration was written
+    '''
+    return unicodedata.normalize('NFKC', unicodedata.normalize('NFKC', term).casefold())
+
+def get_alias_term(definition):
+    ''' A copy of gloss.models.get_alias_term as it was when this migration was written
+    '''
+    for keyword in ALIAS_KEYWORDS:
+        if definition.lower().startswith(keyword):
+            return re.split(keyword, definition, flags=re.IGNORECASE)[1].strip()
+
+    return None
+
+def get_alias_key(definition):
+    ''' A copy of gloss.models.get_alias_key as it was when this migration was written
+    '''
+    alias_term = get_alias_term(definition) if definition is not None else None
+    return normalize_term(alias_term) if alias_term else None
+
+# a copy of gloss.aliases.REFRESH_ALIASES as it was when this migration was written,
+# for every alias: it points each one at the definition at the end of its chain, and
+# leaves chains longer than 32 hops, and circles, unresolved
+RESOLVE_ALIASES = '''
+    WITH RECURSIVE hops (alias_id, team_id, id, alias_key, depth) AS (
+        SELECT id, team_id, id, alias_key, 0 FROM definitions WHERE alias_key IS NOT NULL
+        UNION ALL
+        SELECT hops.alias_id, hops.team_id, definitions.id, definitions.alias_key, hops.depth + 1
+        FROM definitions JOIN hops ON definitions.team_id = hops.team_id AND definitions.term_key = hops.alias_key
+        WHERE hops.depth < 32
+    ), resolved AS (
+        SELECT DISTINCT ON (alias_id) alias_id, team_id, CASE WHEN depth = 0 OR depth = 32 THEN NULL ELSE id END AS alias_of
+        FROM hops ORDER BY alias_id, depth DESC
+    )
+    UPDATE definitions SET alias_of = resolved.alias_of FROM resolved
+    WHERE definitions.team_id = resolved.team_id AND definitions.id = resolved.alias_id AND definitions.alias_of IS DISTINCT FROM resolved.alias_of;
+'''
+
+def upgrade():
+    db_bind = op.get_bind()
+
+    # add the columns
+    op.add_column('definitions', sa.Column('alias_key', sa.Unicode(), nullable=True))
+    op.add_column('definitions', sa.Column('alias_of', sa.Integer(), nullable=True))
+
+    # backfill alias_key in batches
+    last_id = 0
+    while True:
+        rows = db_bind.execute(sa.sql.text('''
+            SELECT id, definition FROM definitions WHERE id > :last_id ORDER BY id LIMIT :batch_size;
+        '''), last_id=last_id, batch_size=BATCH_SIZE).fetchall()
+        if not rows:
+            break
+
+        updates = [{'id': row_id, 'alias_key': get_alias_key(definition)} for row_id, definition in rows]
+        updates = [update for update in updates if update['alias_key']]
+        if updates:
+            db_bind.execute(sa.sql.text('''
+                UPDATE definitions SET alias_key = :alias_key WHERE id = :id;
+            '''), updates)
+        last_id = rows[-1][0]
+
+    op.create_index(op.f('ix_definitions_team_id_alias_key'), 'definitions', ['team_id', 'alias_key'], unique=False)
+    op.create_unique_constraint('uq_definitions_team_id_id', 'definitions', ['team_id', 'id'])
+    db_bind.execute(sa.sql.text('''
+        ALTER TABLE definitions ADD CONSTRAINT fk_definitions_alias_of FOREIGN KEY (team_id, alias_of) REFERENCES definitions (team_id, id) DEFERRABLE INITIALLY DEFERRED;
+    '''))
+
+    # point every alias in every workspace at the end of its chain
+    db_bind.execute(sa.sql.text(RESOLVE_ALIASES))
+
+def downgrade():
+    op.drop_constraint('fk_definitions_alias_of', 'definitions', type_='foreignkey')
+    op.drop_constraint('uq_definitions_team_id_id', 'definitions', type_='unique')
+    op.drop_index(op.f('ix_definitions_team_id_alias_key'), table_name='definitions')
+    op.drop_column('definitions', 'alias_of')
+    op.drop_column('definitions', 'alias_key')
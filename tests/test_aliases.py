@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from gloss.models import Definition
+from tests.test_base import TestBase
+
+class TestAliases(TestBase):
+
+    def setUp(self):
+        super(TestAliases, self).setUp()
+        self.db.create_all()
+
+    def get_alias_of(self, term):
+        self.db.session.expire_all()
+        entry = Definition.query.filter(Definition.term == term).first()
+        target = Definition.query.get(entry.alias_of) if entry.alias_of else None
+        return target.term if target else None
+
+    def test_chains_are_followed(self):
+        ''' An alias of an alias is answered with the definition at the end of the chain
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="E W = see EW")
+        self.post_command(text="Elig = see also e w")
+        self.assertEqual(self.get_alias_of("E W"), "EW")
+        self.assertEqual(self.get_alias_of("Elig"), "EW")
+
+        robo_response = self.post_command(text="shh Elig")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+
+    def test_aliases_can_be_set_before_their_terms(self):
+        ''' An alias of a term that isn't defined yet shows its own definition until the term is defined
+        '''
+        self.post_command(text="Elig = see EW")
+        robo_response = self.post_command(text="shh Elig")
+        self.assertTrue("Elig: see EW".encode('utf-8') in robo_response.data)
+
+        self.post_command(text="EW = Eligibility Worker")
+        robo_response = self.post_command(text="shh Elig")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+
+    def test_cycles_are_refused(self):
+        ''' An alias that would lead back to itself isn't set
+        '''
+        self.post_command(text="EW = see Elig")
+        self.post_command(text="Elig = see E W")
+        robo_response = self.post_command(text="E W = see EW")
+        self.assertTrue("leads back to".encode('utf-8') in robo_response.data)
+        self.assertEqual(Definition.query.filter(Definition.term == "E W").count(), 0)
+
+        robo_response = self.post_command(text="EW = see EW")
+        self.assertTrue("leads back to".encode('utf-8') in robo_response.data)
+
+        robo_response = self.post_command(text="FW = see SW\nSW = see FW\nEW = Eligibility Worker")
+        self.assertTrue("can't set definitions for *FW*, *SW* because they're aliases that lead back to themselves".encode('utf-8') in robo_response.data)
+        self.assertEqual(Definition.query.filter(Definition.term.in_(["FW", "SW"])).count(), 0)
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+
+    def test_dependents_follow_their_targets(self):
+        ''' Aliases follow changes to the definitions they lead to
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="E W = see EW")
+        self.post_command(text="Elig = see E W")
+        robo_response = self.post_command(text="shh Elig")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+
+        # a changed definition isn't served from the cache
+        self.post_command(text="EW = Eligibility Wizard")
+        robo_response = self.post_command(text="shh Elig")
+        self.assertTrue("EW: Eligibility Wizard".encode('utf-8') in robo_response.data)
+
+        # a target that becomes an alias passes its aliases along
+        self.post_command(text="Eligibility Worker = Someone who determines eligibility")
+        self.post_command(text="EW = see Eligibility Worker")
+        self.assertEqual(self.get_alias_of("Elig"), "Eligibility Worker")
+
+        # deleting a link leaves its aliases at what's left of the chain
+        self.post_command(text="delete EW")
+        self.assertIsNone(self.get_alias_of("E W"))
+        self.assertEqual(self.get_alias_of("Elig"), "E W")
+        robo_response = self.post_command(text="shh Elig")
+        self.assertTrue("E W: see EW".encode('utf-8') in robo_response.data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,12 @@ class TestBase(unittest.TestCase):
         environ['DATABASE_URL'] = 'postgresql:///glossary-bot-test'
         environ['SLACK_TOKEN'] = 'meowser_token'
         environ['SLACK_WEBHOOK_URL'] = 'http://hooks.example.com/services/HELLO/LOVELY/WORLD'
+        # deliver webhooks synchronously so that the tests can inspect them
+        environ['WEBHOOK_WORKERS'] = '0'
+        # commit interactions as they happen so that the tests can inspect them
+        environ['INTERACTION_DURABILITY'] = 'sync'
+        # the tests only run one worker, so there's nothing to listen for
+        environ['DEFINITION_CACHE_LISTEN'] = 'false'
 
         self.app = create_app(environ)
         self.app_context = self.app.app_context()
@@ -67,6 +67,30 @@ class TestBot(TestBase):
         self.assertEqual(definition_check.term, "EW")
         self.assertEqual(definition_check.definition, "Eligibility Worker = Cool Person=Yeah")
 
+    def test_set_several_definitions(self):
+        ''' Definitions set on separate lines of one command are saved together and summarized
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="FW = Fraud Worker")
+        robo_response = self.post_command(text="EW = Eligibility Worker\nfw = Fraud Whisperer\nCF = Cash Fund\n\nSS = Social Security\nstats = Statistics")
+        self.assertEqual(robo_response.status_code, 200)
+        self.assertEqual(robo_response.data.decode('utf-8').split("\n"), [
+            "*Gloss Bot* has set the definitions for *CF*, *SS*",
+            "*Gloss Bot* has updated the definition for *fw*",
+            "*Gloss Bot* already knows the definition for *EW*",
+            "Sorry, but *Gloss Bot* can't set definitions for *stats* because they're reserved terms."
+        ])
+
+        self.assertEqual(self.db.session.query(Definition).count(), 4)
+        definition_check = self.db.session.query(Definition).filter(Definition.term_key == "fw").first()
+        self.assertEqual((definition_check.term, definition_check.definition), ("fw", "Fraud Whisperer"))
+
+        # lines that aren't all sets make a multi-line definition
+        robo_response = self.post_command(text="PW = Program Worker\nwho works on programs")
+        self.assertTrue("has set the definition".encode('utf-8') in robo_response.data)
+        definition_check = self.db.session.query(Definition).filter(Definition.term == "PW").first()
+        self.assertEqual(definition_check.definition, "Program Worker\nwho works on programs")
+
     def test_reset_definition(self):
         ''' Setting a definition for an existing term overwrites the original
         '''
@@ -108,6 +132,29 @@ class TestBot(TestBase):
         robo_response = self.post_command(text="shh lower case")
         self.assertTrue("LOWER CASE: really not upper case".encode('utf-8') in robo_response.data)
 
+    def test_lookups_ignore_unicode_case_and_form(self):
+        ''' Terms are looked up by their casefolded, NFKC-normalized key
+        '''
+        robo_response = self.post_command(text="Straße = a street")
+        self.assertTrue("has set the definition".encode('utf-8') in robo_response.data)
+
+        filter = Definition.term == "Straße"
+        definition_check = self.db.session.query(Definition).filter(filter).first()
+        self.assertIsNotNone(definition_check)
+        self.assertEqual(definition_check.term_key, "strasse")
+
+        robo_response = self.post_command(text="shh STRASSE")
+        self.assertTrue("Straße: a street".encode('utf-8') in robo_response.data)
+
+        # the ligature is normalized to 'fi'
+        self.post_command(text="ﬁle = a folder")
+        robo_response = self.post_command(text="shh FILE")
+        self.assertTrue("ﬁle: a folder".encode('utf-8') in robo_response.data)
+
+        robo_response = self.post_command(text="File = a document")
+        self.assertTrue("overwriting the previous entry".encode('utf-8') in robo_response.data)
+        self.assertEqual(self.db.session.query(Definition).count(), 2)
+
     def test_set_identical_definition(self):
         ''' Correct response for setting an identical definition for an existing term
         '''
@@ -313,6 +360,7 @@ class TestBot(TestBase):
         self.assertIsNotNone(definition_check)
         self.assertEqual(definition_check.term, "EW")
         self.assertEqual(definition_check.definition, "http://example.com/ew.gif")
+        self.assertEqual(definition_check.image_url, "http://example.com/ew.gif")
 
         # set a fake Slack webhook URL
         fake_webhook_url = 'http://webhook.example.com/'
@@ -688,6 +736,79 @@ class TestBot(TestBase):
         self.assertEqual(robo_response.status_code, 200)
         self.assertTrue(", ".join(check).encode('utf-8') in robo_response.data)
 
+    @responses.activate
+    def test_all_learnings_are_split_into_messages(self):
+        ''' A public list of all learnings is sent in messages that fit in Slack
+        '''
+        # set some values in the database
+        letters = ["E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X"]
+        check = []
+        for letter in letters:
+            self.post_command(text="{letter}W = {letter}ligibility Worker".format(letter=letter))
+            check.insert(0, "*{}W*".format(letter))
+
+        # set a fake Slack webhook URL
+        fake_webhook_url = 'http://webhook.example.com/'
+        current_app.config['SLACK_WEBHOOK_URL'] = fake_webhook_url
+        current_app.config['LEARNINGS_MESSAGE_LENGTH'] = 80
+
+        # create a mock to receive POST requests to that URL
+        responses.add(responses.POST, fake_webhook_url, status=200)
+
+        rsp = self.post_command(text="learnings all")
+        self.assertTrue(rsp.status_code in range(200, 299), rsp.status_code)
+
+        # the messages are sent in order, and only the first one has the pretext
+        self.assertTrue(len(responses.calls) > 1)
+        texts = []
+        for index, call in enumerate(responses.calls):
+            payload = json.loads(call.request.body)
+            self.assertEqual(bool(payload['text']), index == 0)
+            attachment = payload['attachments'][0]
+            self.assertTrue(len(attachment['text']) <= 80)
+            texts.append(attachment['text'])
+
+        self.assertTrue(texts[0].startswith("I recently learned definitions for: "))
+        texts[0] = texts[0].replace("I recently learned definitions for: ", "")
+        self.assertEqual(", ".join(texts), ", ".join(check))
+
+        # delete the fake Slack webhook URL
+        del(current_app.config['SLACK_WEBHOOK_URL'])
+        # reset the mock
+        responses.reset()
+
+    @responses.activate
+    def test_too_many_learnings_are_listed_privately(self):
+        ''' A public list of all learnings that would take too many messages is sent
+            back privately instead
+        '''
+        # set some values in the database
+        letters = ["E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X"]
+        check = []
+        for letter in letters:
+            self.post_command(text="{letter}W = {letter}ligibility Worker".format(letter=letter))
+            check.insert(0, "{}W".format(letter))
+
+        # set a fake Slack webhook URL
+        fake_webhook_url = 'http://webhook.example.com/'
+        current_app.config['SLACK_WEBHOOK_URL'] = fake_webhook_url
+        current_app.config['LEARNINGS_MESSAGE_LENGTH'] = 80
+        current_app.config['LEARNINGS_PUBLIC_MESSAGES'] = 1
+
+        # create a mock to receive POST requests to that URL
+        responses.add(responses.POST, fake_webhook_url, status=200)
+
+        robo_response = self.post_command(text="learnings all")
+        self.assertEqual(robo_response.status_code, 200)
+        self.assertTrue(b"too many definitions to list them all in the channel" in robo_response.data)
+        self.assertTrue(", ".join(check).encode('utf-8') in robo_response.data)
+        self.assertEqual(len(responses.calls), 0)
+
+        # delete the fake Slack webhook URL
+        del(current_app.config['SLACK_WEBHOOK_URL'])
+        # reset the mock
+        responses.reset()
+
     def test_some_learnings(self):
         ''' Only a few learnings are returned when requested
         '''
@@ -721,6 +842,37 @@ class TestBot(TestBase):
         self.assertEqual(robo_response.status_code, 200)
         self.assertTrue(", ".join(check).encode('utf-8') in robo_response.data)
 
+    def test_paged_learnings(self):
+        ''' Pages of learnings can be followed with the token at the end of each page
+        '''
+        # set some values in the database
+        letters = ["E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X"]
+        for letter in letters:
+            self.post_command(text="{letter}W = {letter}ligibility Worker".format(letter=letter))
+
+        limit = 7
+        recent = ["{}W".format(item) for item in reversed(letters)]
+        for sort_order, check in (("", recent), ("alpha ", sorted(recent))):
+            command = "shh learnings {}{}".format(sort_order, limit)
+            for page in range(3):
+                robo_response = self.post_command(text=command)
+                self.assertEqual(robo_response.status_code, 200)
+                page_check = check[page * limit:(page + 1) * limit]
+                self.assertTrue(", ".join(page_check).encode('utf-8') in robo_response.data)
+                # follow the link to the next page, if there is one
+                text = robo_response.data.decode('utf-8')
+                if "For more, use " not in text:
+                    break
+                command = text.split("For more, use ")[1].replace("/gloss ", "", 1)
+
+            # the last page isn't full, so there's no link to another
+            self.assertEqual(page, 2)
+            self.assertEqual(len(page_check), len(letters) - 2 * limit)
+
+        # a token that can't be read is ignored
+        robo_response = self.post_command(text="shh learnings {} next:nonsense".format(limit))
+        self.assertTrue(", ".join(recent[:limit]).encode('utf-8') in robo_response.data)
+
     def test_learnings_language(self):
         ''' Language describing learnings is numerically accurate
         '''
@@ -959,6 +1111,17 @@ class TestBot(TestBase):
         robo_response = self.post_command(text="= = =")
         self.assertTrue("You can set definitions like this".encode('utf-8') in robo_response.data)
 
+    def test_image_url_follows_definition(self):
+        ''' The image URL is extracted from a definition when it's set, and updated when it's reset
+        '''
+        self.post_command(text="EW = an eligibility worker, like http://example.com/ew.png")
+        definition_check = self.db.session.query(Definition).filter(Definition.term == "EW").first()
+        self.assertEqual(definition_check.image_url, "http://example.com/ew.png")
+
+        self.post_command(text="EW = an eligibility worker")
+        definition_check = self.db.session.query(Definition).filter(Definition.term == "EW").first()
+        self.assertIsNone(definition_check.image_url)
+
     @responses.activate
     def test_bad_image_urls_rejected(self):
         ''' Bad image URLs are not sent in the attachment's image_url parameter
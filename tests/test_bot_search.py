@@ -5,6 +5,7 @@ import logging
 import random
 from flask_migrate import upgrade
 from flask_migrate import Migrate
+from gloss import search_index
 from tests.test_base import TestBase
 
 class TestBotSearch(TestBase):
@@ -79,5 +80,90 @@ class TestBotSearch(TestBase):
         robo_response = self.post_command(text="search banana")
         self.assertTrue('could not find *banana* in any terms or definitions.'.encode('utf-8') in robo_response.data)
 
+    def test_substring_matches_ranked_by_similarity(self):
+        ''' Terms that contain the search term are ranked by how similar they are to it.
+        '''
+        self.post_command(text="abglosscd = a cool thing")
+        self.post_command(text="glossy = a shiny thing")
+
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('found *gloss* in: *glossy*, *abglosscd*'.encode('utf-8') in robo_response.data)
+
+    def test_short_search_terms_match_prefixes(self):
+        ''' Search terms too short for trigram matching only match the start of terms.
+        '''
+        self.post_command(text="CalWIN = an eligibility system")
+        self.post_command(text="SCAR = a mark")
+
+        robo_response = self.post_command(text="search ca")
+        self.assertTrue('found *ca* in: *CalWIN*'.encode('utf-8') in robo_response.data)
+        self.assertFalse('*SCAR*'.encode('utf-8') in robo_response.data)
+
+    def test_search_results_are_limited(self):
+        ''' No more than SEARCH_RESULTS_LIMIT search results are returned, best first.
+        '''
+        matches = [
+            ("abglosscd", "a cool thing"),
+            ("glossed gloss", "a really useful tool"),
+            ("standard gloss", "a good resource"),
+            ("dictionary helper", "a gloss that is really glossing my world"),
+            ("luster", "a prominent gloss")
+        ]
+        for post_match in matches:
+            self.post_command(text="{} = {}".format(post_match[0], post_match[1]))
+
+        self.app.config['SEARCH_RESULTS_LIMIT'] = 2
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('found *gloss* in: *abglosscd*, *glossed gloss*'.encode('utf-8') in robo_response.data)
+        self.assertFalse('*standard gloss*'.encode('utf-8') in robo_response.data)
+
+class TestBotSearchInMemory(TestBotSearch):
+    ''' Run the search tests against the in-memory search backend, which should return
+        the same results in the same order as Postgres.
+    '''
+
+    def setUp(self):
+        super(TestBotSearchInMemory, self).setUp()
+        self.app.config['SEARCH_BACKEND'] = "memory"
+
+    def test_index_follows_changes(self):
+        ''' Definitions that are set or deleted are found or not found by the next search.
+        '''
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('could not find *gloss* in any terms or definitions.'.encode('utf-8') in robo_response.data)
+
+        self.post_command(text="luster = a prominent gloss")
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('found *gloss* in: *luster*'.encode('utf-8') in robo_response.data)
+
+        self.post_command(text="luster = a prominent shine")
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('could not find *gloss* in any terms or definitions.'.encode('utf-8') in robo_response.data)
+
+        self.post_command(text="glossy = a shiny thing")
+        self.post_command(text="delete glossy")
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('could not find *gloss* in any terms or definitions.'.encode('utf-8') in robo_response.data)
+
+    def test_index_is_rebuilt_in_the_background(self):
+        ''' A rebuild runs in the background, and searches use the old index until it's done.
+        '''
+        self.post_command(text="luster = a prominent gloss")
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('found *gloss* in: *luster*'.encode('utf-8') in robo_response.data)
+
+        # a change that wasn't announced is only found once the index is rebuilt
+        self.db.session.execute("UPDATE definitions SET definition = 'a prominent shine'")
+        self.db.session.commit()
+        search_index.mark_stale(None)
+        # hold the rebuild back until the search has been answered
+        with search_index.rebuild_lock:
+            robo_response = self.post_command(text="search gloss")
+        self.assertTrue('found *gloss* in: *luster*'.encode('utf-8') in robo_response.data)
+
+        search_index.rebuild_thread.join(5)
+        robo_response = self.post_command(text="search gloss")
+        self.assertTrue('could not find *gloss* in any terms or definitions.'.encode('utf-8') in robo_response.data)
+
 if __name__ == '__main__':
     unittest.main()
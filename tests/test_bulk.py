@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import io
+import json
+from gloss.bulk import export_glossary, import_glossary, prepare_records
+from gloss.models import Definition
+from tests.test_base import TestBase
+
+class TestBulk(TestBase):
+
+    def setUp(self):
+        super(TestBulk, self).setUp()
+        self.db.create_all()
+
+    def test_csv_import(self):
+        ''' Definitions are imported from CSV, and existing terms are updated by their normalized form
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="FW = Fraud Worker")
+        lines = io.StringIO('term,definition,user_name\new,"Eligibility\nWorker",importer\nFW,Fraud Worker,\nCF,Cash Fund,\nstats,Statistics,\nCF,Cash Flow,\n')
+
+        counts, errors = import_glossary(lines, "csv", processes=2)
+        self.assertEqual(errors, [(6, "is for the reserved term stats")])
+        self.assertEqual(counts, {'records': 5, 'skipped': 1, 'terms': 3, 'inserted': 1, 'updated': 1, 'unchanged': 1})
+
+        entry = self.db.session.query(Definition).filter(Definition.term_key == "ew").first()
+        self.assertEqual((entry.term, entry.definition, entry.user_name), ("ew", "Eligibility\nWorker", "importer"))
+        entry = self.db.session.query(Definition).filter(Definition.term_key == "cf").first()
+        self.assertEqual((entry.term, entry.definition, entry.user_name), ("CF", "Cash Flow", "import"))
+
+        robo_response = self.post_command(text="shh CF")
+        self.assertTrue("Cash Flow" in robo_response.data.decode('utf-8'))
+
+    def test_jsonl_round_trip(self):
+        ''' Exported definitions can be imported again without changes
+        '''
+        lines = io.StringIO('{"term": "EW", "definition": "Eligibility Worker https://example.com/ew.gif", "creation_date": "2018-01-02 03:04:05"}\n\nnot json\n{"term": "x = y", "definition": "z"}\n')
+        counts, errors = import_glossary(lines, "jsonl", user_name="glossie", processes=1)
+        self.assertEqual(errors, [(3, "isn't valid JSON"), (4, "has an '=' in its term")])
+        self.assertEqual(counts['inserted'], 1)
+        entry = self.db.session.query(Definition).filter(Definition.term == "EW").first()
+        self.assertEqual(entry.image_url, "https://example.com/ew.gif")
+        self.assertEqual(entry.creation_date.year, 2018)
+
+        output = io.StringIO()
+        self.assertEqual(export_glossary(output, "jsonl"), 1)
+        exported = json.loads(output.getvalue())
+        self.assertEqual(exported, {'term': "EW", 'definition': "Eligibility Worker https://example.com/ew.gif", 'user_name': "glossie", 'creation_date': "2018-01-02T03:04:05"})
+
+        output.seek(0)
+        counts, errors = import_glossary(output, "jsonl", processes=1)
+        self.assertEqual(counts['unchanged'], 1)
+
+    def test_records_are_prepared_like_sets(self):
+        ''' Imported records are cleaned up the same way that set commands are
+        '''
+        rows, errors = prepare_records([(1, {'term': "  Eligibility   Worker ", 'definition': " a worker "}), (2, {'term': "EW"}), (3, {'term': "EW", 'definition': "x", 'creation_date': "yesterday"})], user_name="glossie")
+        self.assertEqual(rows, [("Eligibility Worker", "eligibility worker", "a worker", None, "glossie", None)])
+        self.assertEqual([line_number for line_number, problem in errors], [2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
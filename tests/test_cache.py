@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import time
+from gloss import definition_cache
+from gloss.cache import DefinitionCache
+from tests.test_base import TestBase
+
+class TestDefinitionCache(TestBase):
+
+    def setUp(self):
+        super(TestDefinitionCache, self).setUp()
+        self.db.create_all()
+
+    def test_lookups_are_cached(self):
+        ''' Repeated lookups of a definition are answered from the cache
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+        self.assertEqual(definition_cache.stats()['misses'], 1)
+        self.assertEqual(definition_cache.stats()['hits'], 0)
+
+        robo_response = self.post_command(text="shh ew")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+        self.assertEqual(definition_cache.stats()['misses'], 1)
+        self.assertEqual(definition_cache.stats()['hits'], 1)
+
+    def test_set_and_delete_invalidate_the_cache(self):
+        ''' Setting or deleting a definition evicts it from the cache
+        '''
+        # cache a miss, then set the definition
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("has no definition for".encode('utf-8') in robo_response.data)
+        self.post_command(text="EW = Eligibility Worker")
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+
+        # overwrite the definition
+        self.post_command(text="ew = Egg Weathervane")
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("ew: Egg Weathervane".encode('utf-8') in robo_response.data)
+
+        # delete the definition
+        self.post_command(text="delete EW")
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("has no definition for".encode('utf-8') in robo_response.data)
+
+    def test_entries_expire(self):
+        ''' Cached entries are reloaded after their TTL has passed
+        '''
+        cache = DefinitionCache(self.app)
+        cache.listen = False
+        cache.ttl = 0.05
+        loads = []
+
+        def loader(term):
+            loads.append(term)
+            return term.upper()
+
+        self.assertEqual(cache.get("ew", loader), "EW")
+        self.assertEqual(cache.get("EW", loader), "EW")
+        self.assertEqual(len(loads), 1)
+        time.sleep(0.1)
+        self.assertEqual(cache.get("EW", loader), "EW")
+        self.assertEqual(len(loads), 2)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        ''' The cache holds no more than its configured number of entries
+        '''
+        cache = DefinitionCache(self.app)
+        cache.listen = False
+        cache.size = 2
+        cache.get("EW", str.upper)
+        cache.get("FW", str.upper)
+        cache.get("EW", str.upper)
+        cache.get("GW", str.upper)
+        self.assertEqual(list(cache.entries.keys()), [":ew", ":gw"])
+
+    def test_changes_are_announced_to_other_workers(self):
+        ''' A change committed by one worker evicts the entry from other workers' caches
+        '''
+        other_cache = DefinitionCache(self.app)
+        other_cache.listen = True
+        other_cache.get("EW", str.upper)
+        # wait for the listener to connect; it clears the cache when it does
+        deadline = time.time() + 5
+        while other_cache.entries and time.time() < deadline:
+            time.sleep(0.05)
+        other_cache.get("EW", str.upper)
+        self.assertTrue(":ew" in other_cache.entries)
+
+        definition_cache.invalidate("EW")
+        self.db.session.commit()
+
+        deadline = time.time() + 5
+        while ":ew" in other_cache.entries and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(":ew" in other_cache.entries)
+        other_cache.pid = None
+
+if __name__ == '__main__':
+    unittest.main()
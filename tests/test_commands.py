@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from gloss.commands import CommandRouter
+
+class TestCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.router = CommandRouter()
+        for action, words, single_word, read_only in (("get", (), True, True), ("set", ("=",), True, False), ("delete", ("delete",), False, False), ("search", ("search",), False, True), ("help", ("help", "?"), True, True), ("stats", ("stats",), True, True), ("recent", ("learnings", "recent"), True, True)):
+            self.router.command(action, words, single_word=single_word, read_only=read_only)(lambda command: command)
+
+    def test_commands_are_resolved(self):
+        ''' Commands are resolved to the same actions that the bot has always taken
+        '''
+        checks = (
+            ("EW", ("get", "", "EW", "", False)),
+            ("  EW  ", ("get", "", "EW", "", False)),
+            ("stats", ("stats", "stats", "stats", "", False)),
+            ("STATS", ("stats", "stats", "STATS", "", False)),
+            ("shh stats", ("stats", "stats", "stats", "", True)),
+            ("sssshhhh   stats", ("stats", "stats", "stats", "", True)),
+            ("shh", ("get", "", "shh", "", False)),
+            ("search", ("get", "", "search", "", False)),
+            ("search  eligibility worker", ("search", "search", "search eligibility worker", "eligibility worker", False)),
+            ("delete EW", ("delete", "delete", "delete EW", "EW", False)),
+            ("EW = Eligibility Worker", ("set", "", "EW = Eligibility Worker", "EW = Eligibility Worker", False)),
+            ("shh EW = Eligibility Worker", ("set", "", "shh EW = Eligibility Worker", "shh EW = Eligibility Worker", False)),
+            ("=", ("set", "", "=", "=", False)),
+            ("", ("help", "", "", "", False)),
+            ("?", ("help", "?", "?", "", False)),
+            ("Learnings alpha 5", ("recent", "learnings", "Learnings alpha 5", "alpha 5", False)),
+            ("shh Eligibility Worker", ("get", "eligibility", "Eligibility Worker", "Worker", True)),
+        )
+        for text, resolved in checks:
+            self.assertEqual(self.router.resolve(text), resolved, text)
+
+    def test_dispatches_are_timed(self):
+        ''' Every dispatched command is timed and passed to the timing hooks
+        '''
+        timed = []
+        self.router.add_timing_hook(lambda action, seconds: timed.append(action))
+
+        command = self.router.dispatch("shh learnings 5", slash_command="/gloss", user_name="glossie", channel_id="123456")
+        self.assertEqual(command.action, "recent")
+        self.assertEqual(command.params, "5")
+        self.assertTrue(command.private)
+        self.router.dispatch("EW", slash_command="/gloss", user_name="glossie", channel_id="123456")
+        self.router.dispatch("FW", slash_command="/gloss", user_name="glossie", channel_id="123456")
+
+        self.assertEqual(timed, ["recent", "get", "get"])
+        stats = self.router.stats()
+        self.assertEqual(stats['get']['count'], 2)
+        self.assertEqual(stats['recent']['count'], 1)
+        self.assertTrue(stats['get']['max'] >= stats['get']['average'] >= 0)
+
+    def test_broken_timing_hooks_are_ignored(self):
+        ''' A timing hook that fails doesn't break the command
+        '''
+        def hook(action, seconds):
+            raise ValueError("oops")
+
+        self.router.add_timing_hook(hook)
+        command = self.router.dispatch("EW", slash_command="/gloss", user_name="glossie", channel_id="123456")
+        self.assertEqual(command.text, "EW")
+
+    def test_dispatches_are_wrapped(self):
+        ''' Dispatch wrappers are told whether the command only reads the glossary
+        '''
+        wrapped = []
+        def wrapper(handler, read_only, command):
+            wrapped.append((command.action, read_only))
+            return handler(command)
+
+        self.router.add_dispatch_wrapper(wrapper)
+        self.router.add_dispatch_wrapper(wrapper)
+        command = self.router.dispatch("EW", slash_command="/gloss", user_name="glossie", channel_id="123456")
+        self.assertEqual(command.text, "EW")
+        self.router.dispatch("EW = Eligibility Worker", slash_command="/gloss", user_name="glossie", channel_id="123456")
+        self.router.dispatch("delete EW", slash_command="/gloss", user_name="glossie", channel_id="123456")
+        self.assertEqual(wrapped, [("get", True), ("set", False), ("delete", False)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from os import environ
+from sqlalchemy.exc import OperationalError
+from gloss import create_app, db
+from tests.test_base import TestBase
+
+class TestDatabase(TestBase):
+
+    def setUp(self):
+        environ['DATABASE_POOL_SIZE'] = '3'
+        environ['DATABASE_STATEMENT_TIMEOUT'] = '500'
+        environ['DATABASE_APPLICATION_NAME'] = 'glossary-bot-test'
+        super(TestDatabase, self).setUp()
+        self.db.create_all()
+
+    def tearDown(self):
+        super(TestDatabase, self).tearDown()
+        for name in ('DATABASE_POOL_SIZE', 'DATABASE_STATEMENT_TIMEOUT', 'DATABASE_APPLICATION_NAME', 'DATABASE_PGBOUNCER'):
+            environ.pop(name, None)
+
+    def test_engine_options_are_applied(self):
+        ''' The pool size, application name and statement timeout come from the environment
+        '''
+        self.assertEqual(self.db.engine.pool.size(), 3)
+        self.assertEqual(self.db.session.execute('SHOW application_name').scalar(), "glossary-bot-test")
+        self.assertEqual(self.db.session.execute('SHOW statement_timeout').scalar(), "500ms")
+
+        with self.assertRaises(OperationalError):
+            self.db.session.execute('SELECT pg_sleep(2)')
+        self.db.session.rollback()
+
+    def test_pgbouncer_mode_times_out_transactions(self):
+        ''' Behind PgBouncer the statement timeout is set in every transaction instead
+        '''
+        environ['DATABASE_PGBOUNCER'] = 'true'
+        app = create_app(environ)
+        self.assertFalse(app.config['DATABASE_PREPARED_STATEMENTS'])
+        with app.app_context():
+            self.assertEqual(db.session.execute('SHOW statement_timeout').scalar(), "500ms")
+            db.session.rollback()
+            with db.engine.connect() as connection:
+                self.assertEqual(connection.execute('SHOW statement_timeout').scalar(), "0")
+            db.session.remove()
+
+    def test_hot_statements_are_prepared(self):
+        ''' Lookups, searches and stats are run as prepared statements
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="shh EW")
+        self.post_command(text="shh search Eligibility")
+        self.post_command(text="shh stats")
+
+        prepared = [name for name, in self.db.session.execute('SELECT name FROM pg_prepared_statements')]
+        self.assertTrue(set(["gloss_lookup", "gloss_search_substring", "gloss_statistics"]) <= set(prepared), prepared)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from gloss.interactions import InteractionWriter
+from gloss.models import Interaction
+from tests.test_base import TestBase
+
+class TestInteractions(TestBase):
+
+    def setUp(self):
+        super(TestInteractions, self).setUp()
+        self.db.create_all()
+        self.app.config['INTERACTION_DURABILITY'] = "buffered"
+        self.app.config['INTERACTION_BUFFER_SIZE'] = 5
+        self.app.config['INTERACTION_BUFFER_LIMIT'] = 8
+        self.app.config['INTERACTION_FLUSH_INTERVAL'] = 60
+        self.writer = InteractionWriter(self.app)
+
+    def tearDown(self):
+        # don't let the writer flush leftover rows at exit
+        self.writer.rows = []
+        super(TestInteractions, self).tearDown()
+
+    def count_interactions(self):
+        self.db.session.commit()
+        return self.db.session.query(Interaction).count()
+
+    def test_buffered_interactions_are_written_on_flush(self):
+        ''' Buffered interactions aren't written until the buffer is flushed
+        '''
+        for letter in ("E", "F", "G"):
+            self.writer.log(term="{}W".format(letter), user_name="glossie", action="found")
+
+        self.assertEqual(self.count_interactions(), 0)
+        self.assertEqual(self.writer.stats()['buffered'], 3)
+
+        self.writer.flush()
+        self.assertEqual(self.count_interactions(), 3)
+        self.assertEqual(self.writer.stats(), {'buffered': 0, 'written': 3, 'dropped': 0})
+
+        interaction_check = self.db.session.query(Interaction).filter(Interaction.term == "FW").first()
+        self.assertIsNotNone(interaction_check)
+        self.assertEqual(interaction_check.user_name, "glossie")
+        self.assertEqual(interaction_check.action, "found")
+        self.assertIsNotNone(interaction_check.creation_date)
+
+    def test_full_buffer_is_flushed(self):
+        ''' The buffer is flushed when it reaches its size threshold
+        '''
+        for number in range(5):
+            self.writer.log(term="EW", user_name="glossie", action="found")
+
+        self.assertEqual(self.count_interactions(), 5)
+        self.assertEqual(self.writer.stats()['buffered'], 0)
+
+    def test_interactions_over_the_limit_are_counted(self):
+        ''' Interactions that don't fit in the buffer are counted as dropped
+        '''
+        self.writer.buffer_size = 100
+        for number in range(10):
+            self.writer.log(term="EW", user_name="glossie", action="found")
+
+        self.assertEqual(self.writer.stats(), {'buffered': 8, 'written': 0, 'dropped': 2})
+
+    def test_failed_writes_are_counted(self):
+        ''' Interactions that can't be written are counted as dropped
+        '''
+        self.writer.log(term="EW", user_name="glossie", action="found")
+        self.writer.log(term="FW", user_name="glossie", action="not_found")
+        Interaction.__table__.drop(self.db.engine)
+
+        self.writer.flush()
+        self.assertEqual(self.writer.stats(), {'buffered': 0, 'written': 0, 'dropped': 2})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from datetime import date, datetime, timedelta
+from gloss import interaction_maintenance
+from gloss.maintenance import create_partitions, drop_partitions, roll_up
+from gloss.models import DailyInteractions, Interaction
+from gloss.stats import get_statistics
+from tests.test_base import TestBase
+
+class TestMaintenance(TestBase):
+
+    def setUp(self):
+        super(TestMaintenance, self).setUp()
+        self.db.create_all()
+
+    def add_interaction(self, creation_date, term="EW", action="found"):
+        self.db.session.add(Interaction(team_id="", creation_date=creation_date, user_name="glossie", term=term, action=action))
+        self.db.session.commit()
+
+    def count_rows(self, table):
+        return self.db.session.execute('SELECT count(*) FROM {}'.format(table)).scalar()
+
+    def test_create_partitions(self):
+        ''' Monthly partitions are created ahead, taking over what the default partition holds for them
+        '''
+        self.add_interaction(datetime(2020, 2, 10))
+        self.add_interaction(datetime(2020, 4, 1))
+
+        self.assertEqual(create_partitions(datetime(2020, 1, 31), 1), ["interactions_y2020m01", "interactions_y2020m02"])
+        self.assertEqual(self.count_rows("interactions_y2020m02"), 1)
+        self.assertEqual(self.count_rows("interactions_default"), 1)
+        self.assertEqual(self.count_rows("interactions"), 2)
+
+        # partitions that exist are left alone
+        self.assertEqual(create_partitions(datetime(2020, 2, 1), 1), ["interactions_y2020m03"])
+
+    def test_roll_up(self):
+        ''' Finished days are counted into daily_interactions once, without changing the stats
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.add_interaction(datetime(2020, 1, 1, 9))
+        self.add_interaction(datetime(2020, 1, 1, 17))
+        self.add_interaction(datetime(2020, 1, 1, 18), term="FW", action="not_found")
+        self.add_interaction(datetime(2020, 1, 2, 9))
+        self.assertEqual(tuple(get_statistics()), (1, 1, 4))
+
+        self.assertEqual(roll_up(datetime(2020, 1, 2, 12)), datetime(2020, 1, 2))
+        counts = {(row.day, row.term, row.action): row.count for row in DailyInteractions.query.all()}
+        self.assertEqual(counts, {(date(2020, 1, 1), "EW", "found"): 2, (date(2020, 1, 1), "FW", "not_found"): 1})
+        self.assertEqual(tuple(get_statistics()), (1, 1, 4))
+
+        # rolling up again doesn't count anything twice
+        roll_up(datetime(2020, 1, 2, 18))
+        self.assertEqual(DailyInteractions.query.get(("", date(2020, 1, 1), "found", "EW")).count, 2)
+        roll_up(datetime(2020, 1, 3))
+        self.assertEqual(DailyInteractions.query.get(("", date(2020, 1, 2), "found", "EW")).count, 1)
+        self.assertEqual(tuple(get_statistics()), (1, 1, 4))
+
+    def test_drop_partitions(self):
+        ''' Old partitions are only dropped once they've been rolled up, and the stats still count them
+        '''
+        create_partitions(datetime(2020, 1, 1), 1)
+        self.add_interaction(datetime(2020, 1, 15))
+        self.add_interaction(datetime(2020, 2, 15))
+        self.add_interaction(datetime(2019, 12, 15))
+
+        self.assertEqual(drop_partitions(datetime(2020, 3, 1)), [])
+        self.assertEqual(self.count_rows("interactions"), 3)
+
+        roll_up(datetime(2020, 2, 1))
+        self.assertEqual(drop_partitions(datetime(2020, 3, 1)), ["interactions_y2020m01"])
+        self.assertIsNone(self.db.session.execute("SELECT to_regclass('interactions_y2020m01')").scalar())
+        # the default partition's rolled up rows are deleted too
+        self.assertEqual(self.count_rows("interactions"), 1)
+        self.assertEqual(tuple(get_statistics()), (0, 0, 3))
+
+    def test_overdue_maintenance_runs_from_the_app(self):
+        ''' Workers maintain interactions themselves when the scheduled job hasn't run for over a day
+        '''
+        self.add_interaction(datetime(2020, 1, 1, 9))
+        summary = interaction_maintenance.maintain_if_overdue()
+        self.assertTrue(summary['created'])
+        self.assertEqual(self.count_rows("daily_interactions"), 1)
+
+        # once it's been done, it isn't done again
+        self.assertFalse(interaction_maintenance.is_overdue())
+        self.assertIsNone(interaction_maintenance.maintain_if_overdue())
+        self.assertTrue(interaction_maintenance.is_overdue(datetime.utcnow() + timedelta(days=3)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import responses
+from flask import current_app
+from prometheus_client import REGISTRY
+from gloss import interactions, webhooks
+from tests.test_base import TestBase
+
+class TestMetrics(TestBase):
+
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+        self.db.create_all()
+
+    def get_value(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_metrics_are_reported(self):
+        ''' Metrics are reported in Prometheus' text format
+        '''
+        self.post_command(text="shh help")
+
+        robo_response = self.client.get('/metrics')
+        self.assertEqual(robo_response.status_code, 200)
+        self.assertTrue(robo_response.content_type.startswith("text/plain"))
+        self.assertTrue(b'gloss_command_seconds_count{action="help"}' in robo_response.data)
+        self.assertTrue(b'gloss_worker_start_time_seconds' in robo_response.data)
+
+    def test_commands_are_timed(self):
+        ''' Each command's latency and database queries are recorded
+        '''
+        commands_before = self.get_value('gloss_command_seconds_count', action="get")
+        requests_before = self.get_value('gloss_request_database_queries_count')
+        queries_before = self.get_value('gloss_request_database_queries_sum')
+
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="shh EW")
+
+        self.assertEqual(self.get_value('gloss_command_seconds_count', action="get"), commands_before + 1)
+        self.assertEqual(self.get_value('gloss_request_database_queries_count'), requests_before + 2)
+        self.assertTrue(self.get_value('gloss_request_database_queries_sum') > queries_before)
+
+    @responses.activate
+    def test_webhook_deliveries_are_counted(self):
+        ''' Delivered and failed webhooks are counted
+        '''
+        delivered_before = self.get_value('gloss_webhook_deliveries_total', outcome="delivered")
+        failed_before = self.get_value('gloss_webhook_deliveries_total', outcome="failed")
+        current_app.config['WEBHOOK_BACKOFF'] = 0
+        webhooks.init_app(current_app)
+
+        responses.add(responses.POST, 'http://webhook.example.com/ok', status=200)
+        responses.add(responses.POST, 'http://webhook.example.com/broken', status=500)
+        webhooks.deliver('http://webhook.example.com/ok', "{}")
+        webhooks.deliver('http://webhook.example.com/broken', "{}")
+
+        self.assertEqual(self.get_value('gloss_webhook_deliveries_total', outcome="delivered"), delivered_before + 1)
+        self.assertEqual(self.get_value('gloss_webhook_deliveries_total', outcome="failed"), failed_before + 1)
+
+    def test_dropped_interactions_are_counted(self):
+        ''' Interactions that can't be logged are counted
+        '''
+        dropped_before = self.get_value('gloss_interactions_total', outcome="dropped")
+        self.db.session.execute('DROP TABLE interactions CASCADE')
+        self.db.session.commit()
+
+        interactions.log(term="EW", user_name="glossie", action="found")
+        self.assertEqual(self.get_value('gloss_interactions_total', outcome="dropped"), dropped_before + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import shutil
+import tempfile
+from os import environ, getpid, path
+from gloss.profiling import get_process_path, read_profiles, summarize_profiles
+from tests.test_base import TestBase
+
+class TestProfiling(TestBase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        environ['PROFILE_SAMPLE_RATE'] = '1'
+        environ['PROFILE_CPROFILE'] = 'true'
+        environ['PROFILE_PATH'] = path.join(self.directory, "profiles.jsonl")
+        super(TestProfiling, self).setUp()
+        self.db.create_all()
+
+    def tearDown(self):
+        super(TestProfiling, self).tearDown()
+        for name in ('PROFILE_SAMPLE_RATE', 'PROFILE_CPROFILE', 'PROFILE_PATH'):
+            del environ[name]
+        shutil.rmtree(self.directory)
+
+    def test_commands_are_profiled(self):
+        ''' Each profiled command records its queries and slowest functions
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="EW")
+        self.client.get('/metrics')
+
+        # each worker writes to a file of its own
+        self.assertTrue(path.exists(get_process_path(self.app.config['PROFILE_PATH'], getpid())))
+        profiles = list(read_profiles(self.app.config['PROFILE_PATH']))
+        self.assertEqual([profile['action'] for profile in profiles], ["set", "get"])
+        for profile in profiles:
+            self.assertTrue(profile['queries'] > 0)
+            self.assertEqual(sum([statement['count'] for statement in profile['statements']]), profile['queries'])
+            self.assertTrue(profile['functions'])
+            self.assertIsNone(profile['error'])
+
+        summary = "\n".join(summarize_profiles(profiles))
+        self.assertTrue("Slowest statements" in summary)
+        self.assertTrue("Slowest functions" in summary)
+
+    def test_summary_of_nothing(self):
+        ''' A missing profile file is summarized without complaint
+        '''
+        profiles = read_profiles(path.join(self.directory, "missing.jsonl"))
+        self.assertEqual(summarize_profiles(profiles), ["No profiles were found."])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import json
+import responses
+from flask import current_app, g
+from os import environ
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from types import SimpleNamespace
+from gloss import replicas
+from tests.test_base import TestBase
+
+class TestReplicas(TestBase):
+
+    def setUp(self):
+        # the test database stands in for a replica of itself
+        environ['DATABASE_REPLICA_URLS'] = 'postgresql:///glossary-bot-test'
+        super(TestReplicas, self).setUp()
+        self.db.create_all()
+
+        self.statements = {'primary': [], 'replica': []}
+        self.listeners = [(self.db.engine, self.make_listener('primary')), (replicas.engines[0], self.make_listener('replica'))]
+        for engine, listener in self.listeners:
+            event.listen(engine, 'before_cursor_execute', listener)
+        # the health checks run in the background, so run them now instead of waiting
+        replicas.check_all()
+
+    def tearDown(self):
+        for engine, listener in self.listeners:
+            event.remove(engine, 'before_cursor_execute', listener)
+        super(TestReplicas, self).tearDown()
+        del environ['DATABASE_REPLICA_URLS']
+
+    def make_listener(self, name):
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            self.statements[name].append(statement)
+        return listener
+
+    def ran_on(self, name, fragment):
+        return any([fragment in statement for statement in self.statements[name]])
+
+    def test_reads_go_to_the_replica(self):
+        ''' Read-only commands read from the replica, and write to the primary
+        '''
+        replicas.write_hold = 0.0
+        self.post_command(text="EW = Eligibility Worker")
+        self.assertTrue(self.ran_on('primary', "INSERT INTO definitions"))
+        self.assertFalse(self.ran_on('replica', "definitions"))
+
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+        self.assertTrue(self.ran_on('replica', "gloss_lookup"))
+        self.assertTrue(self.ran_on('primary', "INSERT INTO interactions"))
+        self.assertFalse(self.ran_on('replica', "INSERT INTO interactions"))
+
+        # the missing statistics row is rebuilt on the primary
+        self.db.session.execute('DELETE FROM statistics')
+        self.db.session.commit()
+        robo_response = self.post_command(text="shh stats")
+        self.assertEqual(robo_response.data.decode('utf-8'), "I have definitions for 1 term, 1 person has defined terms, I've been asked for definitions 1 time")
+        self.assertTrue(self.ran_on('primary', "INSERT INTO statistics"))
+        self.assertFalse(self.ran_on('replica', "INSERT INTO statistics"))
+
+    def test_reads_stay_on_the_primary_after_a_write(self):
+        ''' Reads from a workspace whose definitions just changed go to the primary
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+        self.assertFalse(self.ran_on('replica', "gloss_lookup"))
+
+    def test_unhealthy_replicas_are_passed_over(self):
+        ''' Reads go to the primary when the replica is too far behind
+        '''
+        replicas.write_hold = 0.0
+        replicas.max_lag = -1.0
+        replicas.check_all()
+        self.post_command(text="EW = Eligibility Worker")
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+        self.assertTrue(self.ran_on('replica', "pg_is_in_recovery"))
+        self.assertFalse(self.ran_on('replica', "gloss_lookup"))
+        self.assertEqual(replicas.health[0][0], False)
+
+    def test_deferred_work_is_done_once(self):
+        ''' Work put off until a command is answered is done once, even when the replica fails
+        '''
+        replicas.write_hold = 0.0
+        attempts = []
+        logged = []
+
+        def handler(command):
+            attempts.append(g.get('database_replica'))
+            replicas.after_read(logged.append, len(attempts))
+            if len(attempts) == 1:
+                raise OperationalError("SELECT 1", {}, Exception("the replica went away"))
+            return "answered"
+
+        with self.app.test_request_context('/'):
+            self.assertEqual(replicas.route_command(handler, True, SimpleNamespace(team_id="")), "answered")
+
+        self.assertIsNotNone(attempts[0])
+        self.assertIsNone(attempts[1])
+        self.assertEqual(logged, [2])
+        self.assertEqual(replicas.health[0][0], False)
+
+    @responses.activate
+    def test_public_learnings_are_posted_once(self):
+        ''' A public list of learnings is posted once, even when the replica fails while it's read
+        '''
+        replicas.write_hold = 0.0
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="FW = Fraud Worker")
+        fake_webhook_url = 'http://webhook.example.com/'
+        current_app.config['SLACK_WEBHOOK_URL'] = fake_webhook_url
+        # one term to a message
+        current_app.config['LEARNINGS_MESSAGE_LENGTH'] = 40
+        responses.add(responses.POST, fake_webhook_url, status=200)
+
+        def fail_listing(conn, cursor, statement, parameters, context, executemany):
+            if "ORDER BY definitions.creation_date DESC" in statement:
+                raise OperationalError(statement, parameters, Exception("the replica went away"))
+
+        event.listen(replicas.engines[0], 'before_cursor_execute', fail_listing)
+        try:
+            self.post_command(text="learnings all")
+        finally:
+            event.remove(replicas.engines[0], 'before_cursor_execute', fail_listing)
+
+        sent = [json.loads(call.request.body)['attachments'][0]['text'] for call in responses.calls]
+        self.assertEqual(sent, ["I recently learned definitions for: *FW*", "*EW*"])
+        self.assertEqual(replicas.health[0][0], False)
+
+        del(current_app.config['SLACK_WEBHOOK_URL'])
+        responses.reset()
+
+    def test_streamed_learnings_are_read_from_the_replica(self):
+        ''' A private list of learnings that's streamed after the command returns is read from the replica
+        '''
+        replicas.write_hold = 0.0
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="FW = Fraud Worker")
+
+        robo_response = self.post_command(text="shh learnings all")
+        self.assertEqual(robo_response.data.decode('utf-8'), "I recently learned definitions for: FW, EW")
+        self.assertTrue(self.ran_on('replica', "ORDER BY definitions.creation_date DESC"))
+        self.assertFalse(self.ran_on('primary', "ORDER BY definitions.creation_date DESC"))
+
+if __name__ == '__main__':
+    unittest.main()
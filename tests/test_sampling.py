@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from gloss.models import Definition
+from gloss.sampling import DefinitionSampler
+from tests.test_base import TestBase
+
+class TestSampling(TestBase):
+
+    def setUp(self):
+        super(TestSampling, self).setUp()
+        self.db.create_all()
+        self.app.config['RANDOM_SEED'] = "glossary"
+        self.sampler = DefinitionSampler(self.app)
+        for number in range(30):
+            self.db.session.add(Definition(term="T{}".format(number), definition="Term {}".format(number), user_name="glossie"))
+        self.db.session.commit()
+
+    def test_sample_is_distinct(self):
+        ''' A sample has as many distinct definitions as were asked for
+        '''
+        sample = self.sampler.sample(12)
+        self.assertEqual(len(sample), 12)
+        self.assertEqual(len(set([definition.id for definition in sample])), 12)
+
+    def test_sample_of_more_than_there_are(self):
+        ''' Asking for more definitions than there are returns all of them
+        '''
+        sample = self.sampler.sample(50)
+        self.assertEqual(sorted([definition.term for definition in sample]), sorted(["T{}".format(number) for number in range(30)]))
+
+    def test_sample_of_sparse_ids(self):
+        ''' Definitions are still found when most ids have been deleted
+        '''
+        Definition.query.filter(Definition.term.notin_(["T0", "T13", "T29"])).delete(synchronize_session=False)
+        self.db.session.commit()
+
+        sample = self.sampler.sample(2)
+        self.assertEqual(len(sample), 2)
+        self.assertTrue(set([definition.term for definition in sample]) <= set(["T0", "T13", "T29"]))
+
+    def test_seeded_samples_are_reproducible(self):
+        ''' Samples drawn with the same seed are the same
+        '''
+        first = [definition.term for definition in self.sampler.sample(12, seed=8)]
+        second = [definition.term for definition in self.sampler.sample(12, seed=8)]
+        self.assertEqual(first, second)
+
+        # samplers seeded from the config draw the same sequence of samples
+        other_sampler = DefinitionSampler(self.app)
+        first = [[definition.term for definition in self.sampler.sample(5)] for count in range(3)]
+        second = [[definition.term for definition in other_sampler.sample(5)] for count in range(3)]
+        self.assertEqual(first, second)
+
+if __name__ == '__main__':
+    unittest.main()
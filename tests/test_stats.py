@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from gloss.models import Definer, Definition, Interaction
+from gloss.stats import get_statistics, rebuild_statistics
+from tests.test_base import TestBase
+
+class TestStats(TestBase):
+
+    def setUp(self):
+        super(TestStats, self).setUp()
+        self.db.create_all()
+
+    def get_counts(self):
+        self.db.session.expire_all()
+        statistics = get_statistics()
+        return statistics.definitions, statistics.definers, statistics.interactions
+
+    def test_counts_follow_definitions(self):
+        ''' Setting, changing and deleting definitions updates the counts
+        '''
+        self.assertEqual(self.get_counts(), (0, 0, 0))
+
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="FW = Fraud Worker")
+        self.assertEqual(self.get_counts(), (2, 1, 0))
+
+        # a definition reset by someone else moves to them
+        entry = self.db.session.query(Definition).filter(Definition.term == "FW").first()
+        entry.user_name = "fraudie"
+        self.db.session.commit()
+        self.assertEqual(self.get_counts(), (2, 2, 0))
+        self.assertEqual(self.db.session.query(Definer).get(("", "glossie")).definitions, 1)
+
+        self.post_command(text="delete FW")
+        self.assertEqual(self.get_counts(), (1, 1, 0))
+        self.assertIsNone(self.db.session.query(Definer).get(("", "fraudie")))
+
+    def test_counts_follow_interactions(self):
+        ''' Logging interactions updates the count
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="shh EW")
+        self.post_command(text="shh FW")
+        self.assertEqual(self.get_counts(), (1, 1, 2))
+
+    def test_rebuild_statistics(self):
+        ''' Rebuilding the statistics recounts them from the base tables
+        '''
+        self.post_command(text="EW = Eligibility Worker")
+        self.post_command(text="shh EW")
+
+        # knock the counts out of step
+        self.db.session.execute('UPDATE statistics SET definitions = 12, definers = 0, interactions = 99')
+        self.db.session.execute('DELETE FROM definers')
+        self.db.session.commit()
+        # interactions that haven't been rolled up are still counted from the base table
+        self.assertEqual(self.get_counts(), (12, 0, 100))
+
+        rebuild_statistics()
+        self.assertEqual(self.get_counts(), (1, 1, 1))
+        self.assertEqual(self.db.session.query(Definer).get(("", "glossie")).definitions, 1)
+        self.assertEqual(self.db.session.query(Interaction).count(), 1)
+
+        # a missing row is rebuilt when it's read
+        self.db.session.execute('DELETE FROM statistics')
+        self.db.session.commit()
+        self.assertEqual(self.get_counts(), (1, 1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import json
+import responses
+from os import environ
+from flask import current_app
+from gloss.models import Definition, Interaction
+from gloss.stats import get_statistics
+from gloss.teams import assign_team, partition_definitions
+from tests.test_base import TestBase
+
+class TestTeams(TestBase):
+
+    def setUp(self):
+        environ['MULTI_WORKSPACE'] = 'true'
+        super(TestTeams, self).setUp()
+        self.db.create_all()
+
+    def tearDown(self):
+        super(TestTeams, self).tearDown()
+        del environ['MULTI_WORKSPACE']
+
+    def post_team_command(self, text, team_id, **extra):
+        data = {'token': "meowser_token", 'text': text, 'user_name': "glossie", 'channel_id': "123456", 'command': "/gloss", 'team_id': team_id}
+        data.update(extra)
+        return self.client.post('/', data=data)
+
+    def test_workspaces_have_separate_glossaries(self):
+        ''' The same term can be defined differently in each workspace, and lookups only see their own
+        '''
+        self.post_team_command(text="EW = Eligibility Worker", team_id="T1")
+        self.post_team_command(text="EW = Egg Weathervane", team_id="T2")
+
+        robo_response = self.post_team_command(text="shh EW", team_id="T1")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+        robo_response = self.post_team_command(text="shh EW", team_id="T2")
+        self.assertTrue("EW: Egg Weathervane".encode('utf-8') in robo_response.data)
+        robo_response = self.post_team_command(text="shh EW", team_id="T3")
+        self.assertTrue("has no definition for".encode('utf-8') in robo_response.data)
+
+        # deleting in one workspace leaves the others alone
+        self.post_team_command(text="delete EW", team_id="T1")
+        robo_response = self.post_team_command(text="shh EW", team_id="T2")
+        self.assertTrue("EW: Egg Weathervane".encode('utf-8') in robo_response.data)
+        self.assertEqual([entry.team_id for entry in Definition.query.all()], ["T2"])
+
+    def test_search_stats_and_learnings_are_scoped(self):
+        ''' Searches, stats and learnings only count a workspace's own definitions and interactions
+        '''
+        self.post_team_command(text="EW = Eligibility Worker\nFW = Fraud Worker", team_id="T1")
+        self.post_team_command(text="EWE = Female Sheep", team_id="T2")
+        self.post_team_command(text="shh EWE", team_id="T2")
+
+        robo_response = self.post_team_command(text="search ew", team_id="T1")
+        self.assertTrue("*EW*".encode('utf-8') in robo_response.data)
+        self.assertFalse("*EWE*".encode('utf-8') in robo_response.data)
+
+        robo_response = self.post_team_command(text="shh learnings alpha", team_id="T1")
+        self.assertEqual(robo_response.data.decode('utf-8'), "I know definitions for: EW, FW")
+
+        robo_response = self.post_team_command(text="shh stats", team_id="T2")
+        self.assertEqual(robo_response.data.decode('utf-8'), "I have definitions for 1 term, 1 person has defined terms, I've been asked for definitions 1 time")
+        self.assertEqual(tuple(get_statistics("T1")), (2, 1, 0))
+        self.assertEqual([interaction.team_id for interaction in Interaction.query.all()], ["T2"])
+
+    @responses.activate
+    def test_public_responses_go_to_the_response_url(self):
+        ''' Public responses are sent to the workspace that sent the command
+        '''
+        self.post_team_command(text="EW = Eligibility Worker", team_id="T1")
+        response_url = 'http://hooks.example.com/commands/T1/RESPONSE'
+        responses.add(responses.POST, response_url, status=200)
+
+        self.post_team_command(text="EW", team_id="T1", response_url=response_url)
+        self.assertEqual(len(responses.calls), 1)
+        payload = json.loads(responses.calls[0].request.body)
+        self.assertEqual(payload['response_type'], "in_channel")
+        self.assertEqual(payload['attachments'][0]['text'], "Eligibility Worker")
+
+    @responses.activate
+    def test_long_learnings_lists_arent_sent_to_the_response_url(self):
+        ''' A public list of all learnings that would take more posts than a response_url
+            accepts is sent back privately instead
+        '''
+        letters = ["E", "F", "G", "H", "I", "J", "K", "L"]
+        for letter in letters:
+            self.post_team_command(text="{letter}W = {letter}ligibility Worker".format(letter=letter), team_id="T1")
+        response_url = 'http://hooks.example.com/commands/T1/RESPONSE'
+        responses.add(responses.POST, response_url, status=200)
+        # one term to a message
+        current_app.config['LEARNINGS_MESSAGE_LENGTH'] = 40
+
+        robo_response = self.post_team_command(text="learnings all", team_id="T1", response_url=response_url)
+        self.assertTrue("too many definitions to list them all in the channel".encode('utf-8') in robo_response.data)
+        self.assertEqual(len(responses.calls), 0)
+
+        # a list that fits is posted publicly
+        self.post_team_command(text="delete EW", team_id="T1")
+        self.post_team_command(text="delete FW", team_id="T1")
+        self.post_team_command(text="delete GW", team_id="T1")
+        robo_response = self.post_team_command(text="learnings all", team_id="T1", response_url=response_url)
+        self.assertEqual(robo_response.data, b"")
+        self.assertEqual(len(responses.calls), 5)
+
+    def test_team_id_is_ignored_for_one_workspace(self):
+        ''' Without MULTI_WORKSPACE, every command uses the same glossary
+        '''
+        current_app.config['MULTI_WORKSPACE'] = False
+        self.post_team_command(text="EW = Eligibility Worker", team_id="T1")
+        robo_response = self.post_team_command(text="shh EW", team_id="T2")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+        self.assertEqual(Definition.query.first().team_id, "")
+
+    def test_assign_team(self):
+        ''' Definitions and interactions from before MULTI_WORKSPACE was on can be moved to a workspace
+        '''
+        self.post_team_command(text="EW = Eligibility Worker", team_id="")
+        self.post_team_command(text="shh EW", team_id="")
+
+        self.assertEqual(assign_team("T1"), (1, 1))
+        self.db.session.expire_all()
+        self.assertEqual(tuple(get_statistics("T1")), (1, 1, 1))
+        self.assertEqual(tuple(get_statistics("")), (0, 0, 0))
+        robo_response = self.post_team_command(text="shh EW", team_id="T1")
+        self.assertTrue("EW: Eligibility Worker".encode('utf-8') in robo_response.data)
+
+    def test_partition_definitions(self):
+        ''' Definitions still work per workspace after the table is partitioned by team
+        '''
+        self.post_team_command(text="EW = Eligibility Worker", team_id="T1")
+        self.post_team_command(text="EW = Egg Weathervane", team_id="T2")
+
+        partition_definitions(4)
+        partitions = self.db.session.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'definitions'::regclass").scalar()
+        self.assertEqual(partitions, 4)
+
+        self.post_team_command(text="FW = Fraud Worker", team_id="T1")
+        robo_response = self.post_team_command(text="shh EW", team_id="T2")
+        self.assertTrue("EW: Egg Weathervane".encode('utf-8') in robo_response.data)
+        self.assertEqual(tuple(get_statistics("T1")), (2, 1, 0))
+        with self.assertRaises(ValueError):
+            partition_definitions(4)
+
+if __name__ == '__main__':
+    unittest.main()
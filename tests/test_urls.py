@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import random
+import time
+from gloss.urls import get_image_url, verify_image_url, verify_url
+
+class TestUrls(unittest.TestCase):
+
+    def test_valid_urls(self):
+        ''' URLs that dperini's pattern accepts are accepted
+        '''
+        for url in ("http://example.com", "https://example.com/ew.gif", "example.com", "http://www.example.co.uk:8080/path?query=1#fragment", "http://a--b.example.org/", "http://142.42.1.1/", "http://223.255.255.254", "http://✪df.ws/123", "http://EXAMPLE.COM/"):
+            self.assertTrue(verify_url(url), url)
+
+    def test_invalid_urls(self):
+        ''' URLs that dperini's pattern rejects are rejected
+        '''
+        for url in ("", "http://", "http://kittens.gif", "httpdoggie.jpeg", "http://stupid/goldfish.bmp", "http://-example.com", "http://example-.com", "http://example..com", "http://10.1.1.1", "http://127.0.0.1", "http://192.168.1.1", "http://172.16.0.1", "http://169.254.1.1", "http://224.1.1.1", "http://1.1.1.255", "http://example.com:1", "http://example.com:123456", "http://example.com/a path", "ftp://example.com"):
+            self.assertFalse(verify_url(url), url)
+
+    def test_image_urls(self):
+        ''' Image URLs need a scheme and an image file extension
+        '''
+        self.assertTrue(verify_image_url("http://example.com/ew.gif"))
+        self.assertTrue(verify_image_url("https://example.com/ew.JPEG"))
+        self.assertFalse(verify_image_url("example.com/ew.gif"))
+        self.assertFalse(verify_image_url("http://s.mlkshk-cdn.com/r/13ILU"))
+        self.assertFalse(verify_image_url("http://example.com/ewg"))
+
+    def test_get_image_url(self):
+        ''' The first image URL in a text is found
+        '''
+        self.assertEqual(get_image_url("http://example.com/ew.gif"), "http://example.com/ew.gif")
+        self.assertEqual(get_image_url("an eligibility worker http://example.com/ew.png http://example.com/fw.png"), "http://example.com/ew.png")
+        self.assertIsNone(get_image_url("an eligibility worker"))
+        self.assertIsNone(get_image_url("see http://example.com/ew for more"))
+        self.assertIsNone(get_image_url(""))
+
+    def test_pathological_inputs_are_scanned_quickly(self):
+        ''' Inputs that made the old regular expression backtrack are scanned in linear time
+        '''
+        for pattern in ("aa.", "a.a", "a1.", "a-", "a", "-"):
+            text = "http://{}!".format(pattern * 20000)
+            started = time.perf_counter()
+            verify_url(text)
+            get_image_url("{}.gif".format(text))
+            self.assertLess(time.perf_counter() - started, 0.5, pattern)
+
+    def test_fuzzed_inputs(self):
+        ''' Random inputs built from URL-ish pieces never raise or take long
+        '''
+        pieces = ["http://", "https://", "a", "Z", "0", "9", "-", ".", ":", "/", " ", "\n", "com", "gif", ".png", "ü", "✪", "255", "10", "@", "?", "#", "%"]
+        fuzzer = random.Random(8675309)
+        started = time.perf_counter()
+        for attempt in range(2000):
+            text = "".join([fuzzer.choice(pieces) for count in range(fuzzer.randint(0, 400))])
+            self.assertIn(bool(verify_url(text)), (True, False))
+            url = get_image_url(text)
+            if url is not None:
+                self.assertTrue(url in text)
+                self.assertTrue(verify_url(url) and verify_image_url(url))
+        self.assertLess(time.perf_counter() - started, 10)
+
+if __name__ == '__main__':
+    unittest.main()
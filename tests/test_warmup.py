@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+from gloss import warmup
+from tests.test_base import TestBase
+
+class TestWarmup(TestBase):
+
+    def setUp(self):
+        super(TestWarmup, self).setUp()
+        self.db.create_all()
+        warmup.warmed_up = False
+        warmup.ready_pid = None
+
+    def test_worker_is_ready_once_warm(self):
+        ''' The readiness endpoint only succeeds once the worker has warmed up
+        '''
+        robo_response = self.client.get('/ready')
+        self.assertEqual(robo_response.status_code, 503)
+
+        warmup.warm_up_worker()
+        robo_response = self.client.get('/ready')
+        self.assertEqual(robo_response.status_code, 200)
+        self.assertEqual(robo_response.data, b"ready")
+
+        stats = warmup.stats()
+        self.assertTrue(stats['ready'])
+        self.assertTrue(stats['warm_up'] >= 0)
+        self.assertTrue(stats['warm_up_worker'] >= 0)
+
+    def test_commands_work_after_warming_up(self):
+        ''' Warming up leaves the app able to answer commands
+        '''
+        warmup.warm_up()
+        warmup.warm_up_worker()
+        self.post_command(text="EW = Eligibility Worker")
+        robo_response = self.post_command(text="shh EW")
+        self.assertTrue("Eligibility Worker" in robo_response.data.decode('utf-8'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+import json
+import responses
+import threading
+import time
+from gloss.webhooks import WebhookDelivery
+from tests.test_base import TestBase
+
+class TestWebhooks(TestBase):
+
+    def setUp(self):
+        super(TestWebhooks, self).setUp()
+        self.fake_webhook_url = 'http://webhook.example.com/'
+        self.app.config['WEBHOOK_WORKERS'] = 2
+        self.app.config['WEBHOOK_BACKOFF'] = 0
+        self.delivery = WebhookDelivery(self.app)
+
+    def tearDown(self):
+        self.delivery.shutdown()
+        super(TestWebhooks, self).tearDown()
+
+    @responses.activate
+    def test_queued_payloads_are_delivered(self):
+        ''' Payloads are queued and delivered by the worker pool
+        '''
+        responses.add(responses.POST, self.fake_webhook_url, status=200)
+
+        for number in range(5):
+            response = self.delivery.deliver(self.fake_webhook_url, json.dumps({'text': number}))
+            # nothing is returned, because nothing's been sent yet
+            self.assertIsNone(response)
+
+        self.delivery.drain()
+        self.assertEqual(len(responses.calls), 5)
+        sent = sorted([json.loads(call.request.body)['text'] for call in responses.calls])
+        self.assertEqual(sent, [0, 1, 2, 3, 4])
+
+        stats = self.delivery.stats()
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['delivered'], 5)
+        self.assertEqual(stats['failed'], 0)
+
+    @responses.activate
+    def test_failed_deliveries_are_retried(self):
+        ''' Deliveries that fail with a retryable status are tried again
+        '''
+        statuses = [503, 500, 200]
+
+        def respond(request):
+            return (statuses.pop(0), {}, "")
+
+        responses.add_callback(responses.POST, self.fake_webhook_url, callback=respond)
+
+        self.delivery.deliver(self.fake_webhook_url, json.dumps({'text': "hello"}))
+        self.delivery.drain()
+
+        self.assertEqual(len(responses.calls), 3)
+        stats = self.delivery.stats()
+        self.assertEqual(stats['delivered'], 1)
+        self.assertEqual(stats['retried'], 2)
+
+    @responses.activate
+    def test_undeliverable_payloads_are_counted(self):
+        ''' Deliveries that never succeed are counted as failures
+        '''
+        responses.add(responses.POST, self.fake_webhook_url, status=500)
+
+        self.delivery.deliver(self.fake_webhook_url, json.dumps({'text': "hello"}))
+        self.delivery.drain()
+
+        self.assertEqual(len(responses.calls), self.app.config['WEBHOOK_MAX_RETRIES'] + 1)
+        stats = self.delivery.stats()
+        self.assertEqual(stats['delivered'], 0)
+        self.assertEqual(stats['failed'], 1)
+
+    @responses.activate
+    def test_payloads_are_delivered_in_order(self):
+        ''' Payloads delivered in order are sent one after another, even when the
+            first is slow to send
+        '''
+        def respond(request):
+            if json.loads(request.body)['text'] == 0:
+                time.sleep(0.2)
+            return (200, {}, "")
+
+        responses.add_callback(responses.POST, self.fake_webhook_url, callback=respond)
+
+        self.assertTrue(self.delivery.deliver_in_order(self.fake_webhook_url, [json.dumps({'text': number}) for number in range(4)]))
+        self.delivery.drain()
+
+        sent = [json.loads(call.request.body)['text'] for call in responses.calls]
+        self.assertEqual(sent, [0, 1, 2, 3])
+
+    @responses.activate
+    def test_ordered_payloads_dont_hold_up_other_payloads(self):
+        ''' Payloads delivered in order are sent by a thread of their own, so other
+            payloads are sent while they wait
+        '''
+        release = threading.Event()
+
+        def respond(request):
+            if json.loads(request.body)['text'] == 0:
+                release.wait(5)
+            return (200, {}, "")
+
+        responses.add_callback(responses.POST, self.fake_webhook_url, callback=respond)
+        self.app.config['WEBHOOK_WORKERS'] = 1
+        self.delivery.init_app(self.app)
+
+        self.delivery.deliver_in_order(self.fake_webhook_url, [json.dumps({'text': number}) for number in range(2)])
+        self.delivery.deliver(self.fake_webhook_url, json.dumps({'text': "other"}))
+        self.delivery.queue.join()
+        sent = [json.loads(call.request.body)['text'] for call in responses.calls]
+        self.assertIn("other", sent)
+        self.assertNotIn(1, sent)
+
+        release.set()
+        self.delivery.drain()
+        sent = [json.loads(call.request.body)['text'] for call in responses.calls]
+        self.assertEqual([text for text in sent if text != "other"], [0, 1])
+
+    @responses.activate
+    def test_payloads_that_dont_fit_are_dropped(self):
+        ''' Payloads that don't fit in a full queue are dropped instead of being sent
+            from the request, and lists of ordered payloads that don't fit are turned away
+        '''
+        started = threading.Event()
+        release = threading.Event()
+
+        def respond(request):
+            started.set()
+            release.wait(5)
+            return (200, {}, "")
+
+        responses.add_callback(responses.POST, self.fake_webhook_url, callback=respond)
+        self.app.config['WEBHOOK_WORKERS'] = 1
+        self.app.config['WEBHOOK_QUEUE_SIZE'] = 1
+        self.app.config['WEBHOOK_QUEUE_WAIT'] = 0.01
+        self.app.config['WEBHOOK_ORDERED_QUEUE_SIZE'] = 1
+        self.delivery.init_app(self.app)
+
+        # one payload is being sent, and one fills the queue
+        self.delivery.deliver(self.fake_webhook_url, json.dumps({'text': "sending"}))
+        started.wait(5)
+        self.delivery.deliver(self.fake_webhook_url, json.dumps({'text': "queued"}))
+        self.delivery.deliver(self.fake_webhook_url, json.dumps({'text': "dropped"}))
+
+        # one list is being sent, and one fills the ordered queue
+        self.assertTrue(self.delivery.deliver_in_order(self.fake_webhook_url, [json.dumps({'text': "ordered sending"})]))
+        while not self.delivery.ordered_queue.empty():
+            time.sleep(0.01)
+        self.assertTrue(self.delivery.deliver_in_order(self.fake_webhook_url, [json.dumps({'text': "ordered queued"})]))
+        self.assertFalse(self.delivery.deliver_in_order(self.fake_webhook_url, [json.dumps({'text': number}) for number in range(2)]))
+
+        release.set()
+        self.delivery.drain()
+        sent = sorted([json.loads(call.request.body)['text'] for call in responses.calls])
+        self.assertEqual(sent, ["ordered queued", "ordered sending", "queued", "sending"])
+        self.assertEqual(self.delivery.stats()['overflowed'], 3)
+
+if __name__ == '__main__':
+    unittest.main()